@@ -1,93 +1,115 @@
 """
 Platformer Game
 """
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import time
+
 import arcade
 
-# Constants
-SCREEN_WIDTH = 1280
-SCREEN_HEIGHT = 720
-SCREEN_TITLE = "Platformer"
-
-# These numbers represent "states" that the game can be in.
-INSTRUCTIONS_PAGE_0 = 0
-INSTRUCTIONS_PAGE_1 = 1
-GAME_RUNNING = 2
-YOU_LOST = 3
-YOU_WON = 4
-MAX_LEVEL = 10
-
-# Constants used to scale our sprites from their original size
-CHARACTER_SCALING = 0.8
-TILE_SCALING = 0.4
-COIN_SCALING = 0.4
-SPRITE_PIXEL_SIZE = 128
-GRID_PIXEL_SIZE = (SPRITE_PIXEL_SIZE * TILE_SCALING)
-
-# Movement speed of player, in pixels per frame
-PLAYER_MOVEMENT_SPEED = 8
-GRAVITY = 1.2
-PLAYER_JUMP_SPEED = 20
-
-# How many pixels to keep as a minimum margin between the character
-# and the edge of the screen.
-LEFT_VIEWPORT_MARGIN = 200
-RIGHT_VIEWPORT_MARGIN = 200
-BOTTOM_VIEWPORT_MARGIN = 150
-TOP_VIEWPORT_MARGIN = 100
-
-PLAYER_START_X = 80
-PLAYER_START_Y = 294
-
-TEXTURE_LEFT = 0
-TEXTURE_RIGHT = 1
+import textures
+from animation import character_state, character_table, frame_index, load_tables
+from assets import AssetLoader, decode_texture
+from audio import AudioManager, NullBackend
+from constants import *
+from level_cache import LevelLoader, map_file, open_stream
+from renderer import ChunkedLayer, MovingSpriteList, SpritePool, enemy_sprites, layer_sprites, shape_sprites
+from simulation import Simulation, run_headless, COIN_COLLECTED, HEART_COLLECTED, \
+    POISON_COLLECTED, PLAYER_DIED, LEVEL_CHANGED
+from snapshot import Rewind, load_game, restore_snapshot, save_game, take_snapshot
+
+# Tile layers that are drawn
+LAYER_NAMES = (BACKGROUND_LAYER_NAME, FOREGROUND_LAYER_NAME, PLATFORMS_LAYER_NAME,
+               DONT_TOUCH_LAYER_NAME, COINS_LAYER_NAME, HEARTS_LAYER_NAME, POISONS_LAYER_NAME)
+
+# Which control each key works
+KEY_CONTROLS = {
+    arcade.key.UP: CONTROL_JUMP,
+    arcade.key.W: CONTROL_JUMP,
+    arcade.key.LEFT: CONTROL_LEFT,
+    arcade.key.A: CONTROL_LEFT,
+    arcade.key.RIGHT: CONTROL_RIGHT,
+    arcade.key.D: CONTROL_RIGHT,
+}
 
 class Player(arcade.Sprite):
+    """ A character, shown in the frames of its animation table. It goes in a MovingSpriteList. """
 
-    def __init__(self):
+    def __init__(self, character=PLAYER_CHARACTER):
         super().__init__()
 
-        # Load a left facing texture and a right facing texture.
-        # mirrored=True will mirror the image we load.
-        texture = arcade.load_texture("images/player_1/player_stand.png", mirrored=True, scale=CHARACTER_SCALING)
-        self.textures.append(texture)
-        texture = arcade.load_texture("images/player_1/player_stand.png", scale=CHARACTER_SCALING)
-        self.textures.append(texture)
+        # Every frame of the character, facing left and right. The table
+        # loads them the first time a character of its kind is made.
+        self.animation = character_table(character)
+        self.textures = self.animation.textures
 
         # By default, face right.
-        self.set_texture(TEXTURE_RIGHT)
-
-    def update(self):
-        self.center_x += self.change_x
-        self.center_y += self.change_y
+        self.facing = TEXTURE_RIGHT
+        self.set_texture(self.animation.index(ANIMATION_IDLE, 0, TEXTURE_RIGHT))
 
+    def animate(self, x, y, change_x, in_air, ticks):
+        """
+        Show the character where its body is, in the frame for what it's
+        doing. Nothing is loaded, and the sprite buffer isn't made again.
+
+        :param x: Center of the body
+        :param y: Center of the body
+        :param change_x: How fast the body moves across
+        :param in_air: True if the body isn't standing on anything
+        :param ticks: Ticks played, which the frames change with
+        """
         # Figure out if we should face left or right
-        if self.change_x < 0:
-            self.set_texture(TEXTURE_LEFT)
-        if self.change_x > 0:
-            self.set_texture(TEXTURE_RIGHT)
+        if change_x < 0:
+            self.facing = TEXTURE_LEFT
+        elif change_x > 0:
+            self.facing = TEXTURE_RIGHT
+
+        texture = self.animation.index(character_state(change_x, in_air), ticks, self.facing)
+        offset_x, offset_y = self.animation.offsets[texture]
+        for sprite_list in self.sprite_lists:
+            sprite_list.place(self, x + offset_x, y + offset_y, texture)
 
-        if self.left < 0:
-            self.left = 0
-        elif self.right > SCREEN_WIDTH - 1:
-            self.right = SCREEN_WIDTH - 1
 
-        if self.bottom < 0:
-            self.bottom = 0
-        elif self.top > SCREEN_HEIGHT - 1:
-            self.top = SCREEN_HEIGHT - 1
+def build_level_sprites(my_map, pool=None):
+    """
+    Make the chunked sprite layers for every layer of a map. Runs on the
+    level loader's worker thread, so the next level is ready before we
+    reach it. With a pool, the sprites are the ones of levels left before.
+    """
+    return {name: ChunkedLayer(layer_sprites(my_map, name, TILE_SCALING, pool), pool=pool)
+            for name in LAYER_NAMES}
+
+
+def build_hud():
+    """
+    Make the HUD. Runs on an asset loader thread, and imports the HUD there
+    too, since the first frame doesn't need it.
+    """
+    from hud import GameHud
+    return GameHud()
+
+
+def warm_stream(level):
+    """ Compile a streamed level's stream file, if it is out of date. """
+    open_stream(map_file(level), TILE_SCALING).close()
+
 
 class MyGame(arcade.Window):
     """
     Main application class.
     """
 
-    def __init__(self, width, height, title):
+    def __init__(self, width, height, title, record_file=None, streaming=False, save_file=SAVE_FILE, mute=False,
+                 telemetry=None):
 
         # Call the parent class and set up the window
         super().__init__(width, height, title, resizable = True)
 
         # These are 'lists' that keep track of our sprites. Each sprite should
-        # go into a list.
+        # go into a list. Tile layers are ChunkedLayers, drawn a chunk at a time.
         self.hearts_list = None
         self.poisons_list = None
         self.coin_list = None
@@ -96,50 +118,124 @@ class MyGame(arcade.Window):
         self.background_list = None
         self.dont_touch_list = None
         self.player_list = None
+        # Enemy sprites, and the map enemies they were made for
+        self.enemy_list = None
+        self.enemy_spawns = None
 
         # Separate variable that holds the player sprite
         self.player_sprite = None
 
-        # Our physics engine
-        self.physics_engine = None
+        # Sprites of levels that have been left, to build the next ones from
+        self.sprite_pool = SpritePool()
+
+        # The game itself. Everything that moves or scores lives in here,
+        # the window only draws it and plays the sounds.
+        prepare = functools.partial(build_level_sprites, pool=self.sprite_pool)
+        self.simulation = Simulation(LevelLoader(prepare=prepare), streaming=streaming)
+
+        # Frame timings, shared with the simulation. F3 shows them, F4
+        # saves them to a CSV file.
+        self.profiler = self.simulation.profiler
+        # The overlay F3 shows, made the first time it's shown
+        self.profiler_hud = None
+
+        # Sprite drawn for each pick-up tile of the simulation
+        self.pickup_sprites = {}
+
+        # Layers by name, the level they were loaded with (None if it is
+        # streamed), and for a streamed level, the sprites of each chunk
+        # it has loaded
+        self.layers = None
+        self.layers_level = None
+        self.chunk_sprites = {}
+
+        # Score, level and health, drawn over the game
+        self.hud = None
+
+        # Sound effects, played on their own thread. Muted, or on a machine
+        # with no sound, they go to a backend that plays nothing.
+        self.audio = AudioManager(NullBackend() if mute else None)
+
+        # Where players die and what they pick up, written to a session
+        # file off the game's thread, if it was asked for
+        self.telemetry = telemetry
+
+        # Every game played is recorded to this file, if one is given. While
+        # a recording is played back, the keyboard is ignored.
+        self.record_file = record_file
+        self.recorder = None
+        self.replayer = None
+
+        # A snapshot of every tick played, to rewind through while
+        # Backspace is held
+        self.rewind = Rewind()
+        self.rewinding = False
+
+        # Where the game stood at the start of the level, or when F5 was
+        # last pressed. F9 goes back to it. It is kept in the save file, so
+        # a game can be carried on later.
+        self.save_file = save_file
+        self.checkpoint = None
+        if save_file is not None and os.path.exists(save_file):
+            try:
+                self.checkpoint = load_game(save_file)
+            except ValueError as error:
+                print(error)
 
         # STEP 1: Put each instruction page in an image. Make sure the image
         # matches the dimensions of the window, or it will stretch and look
         # ugly. You can also do something similar if you want a page between
         # each level.
-        self.instructions = []
-        texture = arcade.load_texture("images/instructions/1.png")
-        self.instructions.append(texture)
-
-        texture = arcade.load_texture("images/instructions/2.png")
-        self.instructions.append(texture)
-        
-        texture = arcade.load_texture("images/instructions/GameOver.png")
-        self.instructions.append(texture)
-        
-        texture = arcade.load_texture("images/instructions/YouWon.png")
-        self.instructions.append(texture)
-        
-        # Used to keep track of our scrolling
-        self.view_bottom = 0
-        self.view_left = 0
-
-        # Keep track of the score
-        self.score = 0
-
-        # Keep track of the Game State
-        self.current_state = 0
-
-        # Where is the right edge of the map?
-        self.end_of_map = 0
-
-        # Level
-        self.level = 1
-
-        # Load sounds
-        self.collect_coin_sound = arcade.load_sound("sounds/coin1.wav")
-        self.jump_sound = arcade.load_sound("sounds/jump1.wav")
-        self.game_over = arcade.load_sound("sounds/gameover1.wav")
+        #
+        # Images, sounds and the first level are loaded on worker threads,
+        # the first instruction page before anything else, so it can be up
+        # straight away. The rest loads while the player reads it.
+        self.assets = AssetLoader()
+        for page, path in enumerate(INSTRUCTION_PAGES):
+            self.assets.load(f"page {page}", decode_texture, path)
+        for name, (path, category) in SOUNDS.items():
+            self.assets.load(f"{name} sound", self.audio.load, name, path, category)
+        # Pack the sprite images into the texture atlas up front, rather
+        # than part way into the first level
+        self.assets.load("atlas", textures.atlas)
+        self.assets.load("hud", build_hud)
+        self.assets.load("animations", load_tables)
+        self.warm_level(1)
+
+        # Picked up from the asset loader once everything has loaded
+        self.instructions = None
+
+        # Set when the player clicks through the instructions before
+        # loading is done, to start the game as soon as it is
+        self.start_when_loaded = False
+
+    def warm_level(self, level):
+        """ Get a level ready in the background, counting it as an asset to load. """
+        if self.simulation.streams(level):
+            self.assets.load("level", warm_stream, level)
+        else:
+            self.assets.track("level", self.simulation.loader.prefetch(level))
+
+    def finish_loading(self):
+        """ Pick up what the asset loader loaded, waiting for anything still loading. """
+        if self.hud is not None:
+            return
+        self.instructions = [self.assets.get(f"page {page}") for page in range(len(INSTRUCTION_PAGES))]
+        for name in SOUNDS:
+            self.assets.get(f"{name} sound")
+        self.assets.get("atlas")
+        if "level" in self.assets.jobs:
+            self.assets.get("level")
+        self.hud = self.assets.get("hud")
+
+    @property
+    def current_state(self):
+        """ Which state the game is in. """
+        return self.simulation.current_state
+
+    @current_state.setter
+    def current_state(self, state):
+        self.simulation.current_state = state
 
     def on_resize(self, width, height):
         """ This method is automatically called when the window is resized. """
@@ -150,114 +246,130 @@ class MyGame(arcade.Window):
         
     def setup(self, level):
         """ Set up the game here. Call this function to restart the game. """
-
-        # Used to keep track of our scrolling
-        self.view_bottom = 0
-        self.view_left = 0
-
-        # Keep track of the score
-        if level == 1:
-            self.score = 0
-            self.health = 5
-            self.level = 1
-
-        # Create the Sprite lists
-        self.player_list = arcade.SpriteList()
-        self.foreground_list = arcade.SpriteList()
-        self.background_list = arcade.SpriteList()
-        self.wall_list = arcade.SpriteList()
-        self.coin_list = arcade.SpriteList()
-        self.poisons_list = arcade.SpriteList()
-        self.hearts_list = arcade.SpriteList()
-        
-        # Set up the player, specifically placing it at these coordinates.
-        self.player_sprite = Player()
-        self.player_sprite.center_x = PLAYER_START_X
-        self.player_sprite.center_y = PLAYER_START_Y
-        self.player_list.append(self.player_sprite)
-
-        # --- Load in a map from the tiled editor ---
-
-        # Name of the layer in the file that has our platforms/walls
-        platforms_layer_name = 'Platforms'
-        # Name of the layer that has items for pick-up
-        coins_layer_name = 'Coins'
-        # Name of the layer that has items for foreground
-        foreground_layer_name = 'Foreground'
-        # Name of the layer that has items for background
-        background_layer_name = 'Background'
-        # Name of the layer that has items that poison us.
-        poisons_layer_name = 'Poisons'
-        # Name of the layer that has items we shouldn't touch
-        dont_touch_layer_name = "Don't Touch"
-        # Name of the layer that has items that increase health
-        hearts_layer_name = 'Hearts'
-
-        # Map name
-        map_name = f"MapLevel{level}.tmx"
-        # Read in the tiled map
-        my_map = arcade.read_tiled_map(map_name, TILE_SCALING)
-
-        # -- Walls
-        # Grab the layer of items we can't move through
-        map_array = my_map.layers_int_data[platforms_layer_name]
-
-        # Calculate the right edge of the my_map in pixels
-        self.end_of_map = len(map_array[0]) * GRID_PIXEL_SIZE
-
-        # -- Background
-        self.background_list = arcade.generate_sprites(my_map, background_layer_name, TILE_SCALING)
-
-        # -- Foreground
-        self.foreground_list = arcade.generate_sprites(my_map, foreground_layer_name, TILE_SCALING)
-
-        # -- Platforms
-        self.wall_list = arcade.generate_sprites(my_map, platforms_layer_name, TILE_SCALING)
-
-        # -- Platforms
-        self.wall_list = arcade.generate_sprites(my_map, platforms_layer_name, TILE_SCALING)
-
-        # -- Coins
-        self.coin_list = arcade.generate_sprites(my_map, coins_layer_name, TILE_SCALING)
-
-        # -- Don't Touch Layer
-        self.dont_touch_list = arcade.generate_sprites(my_map, dont_touch_layer_name, TILE_SCALING)
-
-        # -- Hearts Layer
-        self.hearts_list = arcade.generate_sprites(my_map, hearts_layer_name, TILE_SCALING)
-
-        # -- Hearts Layer
-        self.hearts_list = arcade.generate_sprites(my_map, hearts_layer_name, TILE_SCALING)
-
-        # -- Poisons Layer
-        self.poisons_list = arcade.generate_sprites(my_map, poisons_layer_name, TILE_SCALING)
-
-        # -- Poisons Layer
-        self.poisons_list = arcade.generate_sprites(my_map, poisons_layer_name, TILE_SCALING)
-
-        self.end_of_map = (len(map_array[0]) - 1) * GRID_PIXEL_SIZE
+        self.simulation.setup(level)
+        self.load_sprites()
+        self.scroll_viewport()
+
+    def load_sprites(self):
+        """ Get the sprite lists ready for the level the simulation has loaded. """
+
+        # The player is made once, and put back at the start for each level
+        if self.player_sprite is None:
+            self.player_list = MovingSpriteList()
+            self.player_sprite = Player()
+            self.player_list.append(self.player_sprite)
+        self.show_player()
+
+        # --- Sprites for the map the simulation loaded, built by the level loader ---
+        my_map = self.simulation.map
+        prepared = self.simulation.prepared
+        if prepared is not None:
+            sprites = prepared.sprites
+            # A level played before, restarted or kept by the loader, gets
+            # back the pick-ups taken last time
+            for name in PICKUP_LAYER_NAMES:
+                sprites[name].restore()
+        else:
+            # A streamed level starts empty, and gets sprites as chunks load
+            sprites = {name: ChunkedLayer([], pool=self.sprite_pool) for name in LAYER_NAMES}
+
+        # The sprites of the level we left go to the pool, for the levels
+        # after this one, unless the loader keeps it to be played again
+        left = self.layers_level
+        if self.layers is not None and self.layers is not sprites and \
+                (left is None or not self.simulation.loader.keeps(left)):
+            for layer in self.layers.values():
+                layer.release()
+        self.layers = sprites
+        self.layers_level = prepared
+        self.chunk_sprites = {}
+
+        self.background_list = sprites[BACKGROUND_LAYER_NAME]
+        self.foreground_list = sprites[FOREGROUND_LAYER_NAME]
+        self.wall_list = sprites[PLATFORMS_LAYER_NAME]
+        self.dont_touch_list = sprites[DONT_TOUCH_LAYER_NAME]
+        self.coin_list = sprites[COINS_LAYER_NAME]
+        self.hearts_list = sprites[HEARTS_LAYER_NAME]
+        self.poisons_list = sprites[POISONS_LAYER_NAME]
+
+        # Sprites come out in the same order as the simulation's shapes,
+        # so pair them up to know which sprite to remove on a pick-up.
+        self.pickup_sprites = {}
+        for index, layer in ((self.simulation.coin_list, self.coin_list),
+                             (self.simulation.hearts_list, self.hearts_list),
+                             (self.simulation.poisons_list, self.poisons_list)):
+            self.pickup_sprites.update(zip(index.shapes, layer.sprites))
+        self.sync_chunks()
+
+        # A sprite for each enemy, moved to wherever the simulation has it
+        if self.enemy_list is None or self.enemy_spawns is not my_map.enemies:
+            self.enemy_list = enemy_sprites(my_map.enemies)
+            self.enemy_spawns = my_map.enemies
+        self.move_enemies()
 
         # --- Other stuff
         # Set the background color
         if my_map.backgroundcolor:
             arcade.set_background_color(my_map.backgroundcolor)
 
-        # Create the 'physics engine'
-        self.physics_engine = arcade.PhysicsEnginePlatformer(self.player_sprite,
-                                                             self.wall_list,
-                                                             GRAVITY)
+    def sync_chunks(self):
+        """
+        Give a streamed level sprites for the chunks the simulation has
+        loaded, and drop the sprites of chunks it let go.
+        """
+        stream = self.simulation.stream
+        if stream is None:
+            return
+
+        for key in [key for key in self.chunk_sprites if key not in stream.loaded]:
+            for name, (shapes, sprites) in self.chunk_sprites.pop(key).items():
+                self.layers[name].remove(sprites)
+                for shape in shapes:
+                    self.pickup_sprites.pop(shape, None)
+
+        for key, chunk in stream.loaded.items():
+            if key in self.chunk_sprites:
+                continue
+            built = {}
+            for name, shapes in chunk.items():
+                if name not in self.layers:
+                    continue
+                # Copy the shapes, since the stream drops picked up ones from its own lists
+                shapes = list(shapes)
+                sprites = shape_sprites(self.simulation.map, shapes, TILE_SCALING, self.sprite_pool)
+                self.layers[name].add(sprites)
+                if name in PICKUP_LAYER_NAMES:
+                    self.pickup_sprites.update(zip(shapes, sprites))
+                built[name] = (shapes, sprites)
+            self.chunk_sprites[key] = built
+
     # STEP 2: Add this function.
     def draw_instructions_page(self, page_number):
         """
-        Draw an instruction page. Load the page as an image.
+        Draw an instruction page, once its image has loaded, and how much of
+        the game has loaded until it all has.
         """
         # This command should happen before we start drawing. It will clear
         # the screen to the background color, and erase what we drew last frame.
         arcade.start_render()
-        page_texture = self.instructions[page_number]
-        arcade.draw_texture_rectangle(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2,
-                                      page_texture.width,
-                                      page_texture.height, page_texture, 0)
+        name = f"page {page_number}"
+        if self.assets.ready(name):
+            page_texture = self.assets.get(name)
+            arcade.draw_texture_rectangle(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2,
+                                          page_texture.width,
+                                          page_texture.height, page_texture, 0)
+        if not self.assets.done():
+            self.draw_loading_bar()
+
+    def draw_loading_bar(self):
+        """ Draw a bar along the bottom of the screen that fills up as the game loads. """
+        left = (SCREEN_WIDTH - LOADING_BAR_WIDTH) / 2
+        bottom = LOADING_BAR_HEIGHT * 3
+        top = bottom + LOADING_BAR_HEIGHT
+        filled = LOADING_BAR_WIDTH * self.assets.progress()
+        arcade.draw_lrtb_rectangle_outline(left, left + LOADING_BAR_WIDTH, top, bottom, LOADING_BAR_COLOR)
+        if filled > 0:
+            arcade.draw_lrtb_rectangle_filled(left, left + filled, top, bottom, LOADING_BAR_COLOR)
 
     # STEP 3: Add this function
     def draw_game_over(self):
@@ -267,8 +379,6 @@ class MyGame(arcade.Window):
         # This command should happen before we start drawing. It will clear
         # the screen to the background color, and erase what we drew last frame.
         arcade.start_render()
-        self.view_bottom = 0
-        self.view_left = 0
 
         if self.current_state == YOU_LOST :
             page_texture = self.instructions[2] #arcade.load_texture("images/instructions/GameOver.png")
@@ -308,56 +418,92 @@ class MyGame(arcade.Window):
             self.draw_game()
             self.draw_game_over()
 
+        self.profiler.end_frame()
+        if self.profiler.enabled:
+            self.draw_profiler()
+
     def draw_game(self) :
-        # Draw our sprites
-        self.wall_list.draw()
-        self.background_list.draw()
-        self.wall_list.draw()
-        self.coin_list.draw()
-        self.dont_touch_list.draw()
-        self.hearts_list.draw()
-        self.poisons_list.draw()
+        view_left = self.simulation.view_left
+        view_bottom = self.simulation.view_bottom
+
+        # Draw our sprites, only the chunks of each layer that are on screen
+        viewport = (view_left, view_bottom, view_left + SCREEN_WIDTH, view_bottom + SCREEN_HEIGHT)
+        profiler = self.profiler
+        profiler.start()
+        self.background_list.draw(*viewport)
+        profiler.lap("draw_background")
+        self.wall_list.draw(*viewport)
+        profiler.lap("draw_platforms")
+        self.coin_list.draw(*viewport)
+        profiler.lap("draw_coins")
+        self.dont_touch_list.draw(*viewport)
+        profiler.lap("draw_dont_touch")
+        self.hearts_list.draw(*viewport)
+        profiler.lap("draw_hearts")
+        self.poisons_list.draw(*viewport)
+        profiler.lap("draw_poisons")
+        self.enemy_list.draw()
+        profiler.lap("draw_enemies")
         self.player_list.draw()
-        self.foreground_list.draw()
-
-        # Draw our score on the screen, scrolling it with the viewport
-        score_text = f"Score: {self.score}"
-        arcade.draw_text(score_text, 10 + self.view_left, 10 + self.view_bottom,
-                         arcade.csscolor.BLACK, 18)
+        profiler.lap("draw_player")
+        self.foreground_list.draw(*viewport)
+        profiler.lap("draw_foreground")
 
-        # Draw our level on the screen, scrolling it with the viewport
-        level_text = f"Level: {self.level}"
-        arcade.draw_text(level_text, 150 + self.view_left, 10 + self.view_bottom,
-                         arcade.csscolor.BLACK, 18)
+        # Draw our score, level and health on top, in screen space
+        self.hud.update(self.simulation)
+        self.hud.draw()
+        profiler.lap("hud")
 
-        # Draw our health on the screen, scrolling it with the viewport
-        level_text = f"Health: {self.health}"
-        arcade.draw_text(level_text, 310 + self.view_left, 10 + self.view_bottom,
-                         arcade.csscolor.BLACK, 18)
+    def draw_profiler(self):
+        """
+        Draw the p50 and p99 time of each part of a frame, and a graph of
+        the time between frames, over the game in screen space.
+        """
+        if self.profiler_hud is None:
+            from hud import ProfilerHud
+            self.profiler_hud = ProfilerHud()
+        self.profiler_hud.update(self.profiler)
+        self.profiler_hud.draw()
 
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed. """
-            # Only move the user if the game is running.
-        if self.current_state == GAME_RUNNING:
-
-            if key == arcade.key.UP or key == arcade.key.W:
-                if self.physics_engine.can_jump():
-                    self.player_sprite.change_y = PLAYER_JUMP_SPEED
-                    arcade.play_sound(self.jump_sound)
-            elif key == arcade.key.LEFT or key == arcade.key.A:
-                self.player_sprite.change_x = -PLAYER_MOVEMENT_SPEED
-            elif key == arcade.key.RIGHT or key == arcade.key.D:
-                self.player_sprite.change_x = PLAYER_MOVEMENT_SPEED
+        if key == arcade.key.F3:
+            self.profiler.toggle()
+        elif key == arcade.key.F5 and self.current_state == GAME_RUNNING and self.replayer is None:
+            self.save_checkpoint()
+            print(f"Saved the game to {self.save_file}")
+        elif key == arcade.key.F9 and self.replayer is None:
+            self.load_checkpoint()
+        elif key == arcade.key.BACKSPACE and self.current_state == GAME_RUNNING and self.replayer is None:
+            self.rewinding = True
+        elif key == arcade.key.F4 and self.profiler.enabled:
+            path = time.strftime("profile-%Y%m%d-%H%M%S.csv")
+            self.profiler.dump_csv(path)
+            print(f"Saved {self.profiler.count} frames of timings to {path}")
+
+        control = KEY_CONTROLS.get(key)
+
+        # Only move the user if the game is running, and isn't a replay.
+        if self.current_state == GAME_RUNNING and control is not None and self.replayer is None:
+
+            if self.recorder is not None:
+                self.recorder.press(control)
+            if self.simulation.press(control):
+                self.audio.play("jump")
 
     def on_key_release(self, key, modifiers):
         """Called when the user releases a key. """
-            # Only move the user if the game is running.
-        if self.current_state == GAME_RUNNING:
+        if key == arcade.key.BACKSPACE:
+            self.rewinding = False
+
+        control = KEY_CONTROLS.get(key)
+
+        # Only move the user if the game is running, and isn't a replay.
+        if self.current_state == GAME_RUNNING and control is not None and self.replayer is None:
 
-            if key == arcade.key.LEFT or key == arcade.key.A:
-                self.player_sprite.change_x = 0
-            elif key == arcade.key.RIGHT or key == arcade.key.D:
-                self.player_sprite.change_x = 0
+            if self.recorder is not None:
+                self.recorder.release(control)
+            self.simulation.release(control)
 
     # STEP 6: Do something like adding this to your on_mouse_press to flip
     # between instruction pages.
@@ -371,169 +517,391 @@ class MyGame(arcade.Window):
             # Next page of instructions.
             self.current_state = INSTRUCTIONS_PAGE_1
         elif self.current_state == INSTRUCTIONS_PAGE_1:
-            # Start the game
-            self.setup(1)
-            self.current_state = GAME_RUNNING
+            # Start the game, as soon as it has loaded
+            self.start_when_loaded = True
         elif self.current_state == YOU_WON:
             # Restart the game.
-            self.setup(1)
-            self.current_state = GAME_RUNNING
+            self.start_game()
         elif self.current_state == YOU_LOST:
             # Restart the game.
-            self.setup(1)
-            self.current_state = GAME_RUNNING
+            self.start_game()
+
+    def start_game(self):
+        """ Start a game on the first level. """
+        self.finish_loading()
+        self.setup(1)
+        self.current_state = GAME_RUNNING
+        self.rewind.clear()
+        self.simulation.controller = self.rewind
+        self.start_recording()
+
+    def save_checkpoint(self):
+        """ Note where the game stands, for F9 to go back to, and keep it in the save file. """
+        self.checkpoint = take_snapshot(self.simulation)
+        if self.save_file is not None:
+            save_game(self.save_file, self.checkpoint)
+
+    def load_checkpoint(self):
+        """ Go back to the last checkpoint, from this game or the save file. """
+        if self.checkpoint is None:
+            return
+        self.finish_loading()
+        self.start_when_loaded = False
+        self.rewind.clear()
+        try:
+            self.jump_to(self.checkpoint)
+        except ValueError as error:
+            print(error)
+
+    def jump_to(self, snapshot):
+        """ Put the game back the way a snapshot has it, and show it that way. """
+        # A recording is the inputs since the start of a game, so it can't
+        # follow a jump in time. It's saved as it stands.
+        self.finish_recording()
+        restore_snapshot(self.simulation, snapshot)
+        self.simulation.controller = self.rewind
+
+        if self.simulation.prepared is None or self.simulation.prepared is not self.layers_level:
+            self.load_sprites()
+        self.show_pickups()
+        self.sync_chunks()
+        self.move_enemies()
+        self.show_player()
+        self.scroll_viewport()
+
+    def show_pickups(self):
+        """ Show just the pick-ups the simulation has left, after it jumped to a snapshot. """
+        if self.simulation.prepared is None:
+            # A streamed level's sprites are made again as its chunks load
+            return
+        for index, layer in ((self.simulation.coin_list, self.coin_list),
+                             (self.simulation.hearts_list, self.hearts_list),
+                             (self.simulation.poisons_list, self.poisons_list)):
+            cells = index.cells
+            missing = []
+            for shape in index.shapes:
+                sprite = self.pickup_sprites[shape]
+                if cells.get((shape.row, shape.column)) is shape:
+                    if not sprite.sprite_lists:
+                        missing.append(sprite)
+                elif sprite.sprite_lists:
+                    sprite.remove_from_sprite_lists()
+            layer.add(missing)
+
+    def start_recording(self):
+        """ Start recording the game, if we were asked to. """
+        if self.record_file is not None and self.replayer is None:
+            from replay import Recorder
+            self.recorder = Recorder(self.simulation)
+
+    def finish_recording(self):
+        """ Save the game recorded so far. """
+        if self.recorder is not None:
+            self.recorder.finish().save(self.record_file)
+            self.recorder = None
+
+    def start_replay(self, recording):
+        """ Play a recording back, in real time. """
+        from replay import Replayer
+        self.finish_loading()
+        self.setup(recording.level)
+        self.replayer = Replayer(recording, self.simulation)
+        self.simulation.controller = self.replayer
+
+    def finish_replay(self):
+        """ Stop replaying, say if the game ended the way it was recorded, and hand back the keyboard. """
+        report_replay(self.replayer)
+        self.simulation.controller = None
+        self.replayer = None
+
+    def on_close(self):
+        """ Save the recording when the window is closed part way into a game. """
+        self.finish_recording()
+        self.audio.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        super().on_close()
 
     
     def update(self, delta_time):
         """ Movement and game logic """
 
+        if self.start_when_loaded and self.assets.done():
+            self.start_when_loaded = False
+            self.start_game()
+
         # Only move and do things if the game is running.
         if self.current_state == GAME_RUNNING:
-            
-            # Call update on all sprites (The sprites don't do much in this
-            # example though.)
-            self.physics_engine.update()
-
-            # See if we hit any coins
-            coin_hit_list = arcade.check_for_collision_with_list(self.player_sprite,
-                                                                 self.coin_list)
-
-            # See if we hit any hearts
-            hearts_hit_list = arcade.check_for_collision_with_list(self.player_sprite,
-                                                                 self.hearts_list)
-
-            # See if we hit any poisons
-            poisons_hit_list = arcade.check_for_collision_with_list(self.player_sprite,
-                                                                 self.poisons_list)
-
-            # Loop through each coin we hit (if any) and remove it
-            for coin in coin_hit_list:
-                # Remove the coin
-                coin.remove_from_sprite_lists()
-                # Play a sound
-                arcade.play_sound(self.collect_coin_sound)
-                # Add one to the score
-                self.score += 1
-
-            # Loop through each heart we hit (if any) and remove it
-            for heart in hearts_hit_list:
-                # Remove the heart
-                heart.remove_from_sprite_lists()
-                # Play a sound
-                arcade.play_sound(self.collect_coin_sound)
-                # Add one to the health
-                self.health += 1
-
-            # Loop through each heart we hit (if any) and remove it
-            for poison in poisons_hit_list:
-                # Remove the Poison
-                poison.remove_from_sprite_lists()
-                # Play a sound
-                arcade.play_sound(self.collect_coin_sound)
-                # Take one from the health
-                self.health -= 1
-
-            # Track if we need to change the viewport
-            changed_viewport = False
-
-            # Did the player fall off the map?
-            if self.player_sprite.center_y < -100:
-                self.player_sprite.center_x = PLAYER_START_X
-                self.player_sprite.center_y = PLAYER_START_Y
-                #self.current_state = YOU_LOST
-
-                self.health -= 1
-                # Set the camera to the start
-                self.view_left = 0
-                self.view_bottom = 0
-                changed_viewport = True
-                arcade.play_sound(self.game_over)
-
-            # Did the player touch something they should not?
-            if arcade.check_for_collision_with_list(self.player_sprite, self.dont_touch_list):
-                #self.current_state = YOU_LOST #GAME_OVER
-
-                self.player_sprite.center_x = PLAYER_START_X
-                self.player_sprite.center_y = PLAYER_START_Y
-                self.health -= 1
-                # Set the camera to the start
-                self.view_left = 0
-                self.view_bottom = 0
-                changed_viewport = True
-                arcade.play_sound(self.game_over)
-
-            # Did the player health run out ?
-            if self.health < 0:
-                self.current_state = YOU_LOST #GAME_OVER
-                
-                self.player_sprite.center_x = PLAYER_START_X
-                self.player_sprite.center_y = PLAYER_START_Y
-
-                # Set the camera to the start
-                self.view_left = 0
-                self.view_bottom = 0
-                changed_viewport = True
-                arcade.play_sound(self.game_over)
-
-            # See if the user got to the end of the level
-            if self.player_sprite.center_x >= self.end_of_map:
-                # Advance to the next level
-                if self.level == MAX_LEVEL:
-                    self.current_state = YOU_WON
-                else:
-                    self.level += 1
-
-                # Load the next level
-                self.setup(self.level)
-
-                # Set the camera to the start
-                self.view_left = 0
-                self.view_bottom = 0
-                changed_viewport = True
-
-            # --- Manage Scrolling ---
-        
-            # Scroll left
-            left_boundary = self.view_left + LEFT_VIEWPORT_MARGIN
-            if self.player_sprite.left < left_boundary:
-                self.view_left -= left_boundary - self.player_sprite.left
-                changed_viewport = True
-
-            # Scroll right
-            right_boundary = self.view_left + SCREEN_WIDTH - RIGHT_VIEWPORT_MARGIN
-            if self.player_sprite.right > right_boundary:
-                self.view_left += self.player_sprite.right - right_boundary
-                changed_viewport = True
-
-            # Scroll up
-            top_boundary = self.view_bottom + SCREEN_HEIGHT - TOP_VIEWPORT_MARGIN
-            if self.player_sprite.top > top_boundary:
-                self.view_bottom += self.player_sprite.top - top_boundary
-                changed_viewport = True
-
-            # Scroll down
-            bottom_boundary = self.view_bottom + BOTTOM_VIEWPORT_MARGIN
-            if self.player_sprite.bottom < bottom_boundary:
-                self.view_bottom -= bottom_boundary - self.player_sprite.bottom
-                changed_viewport = True
-
-            if changed_viewport:
-                # Only scroll to integers. Otherwise we end up with pixels that
-                # don't line up on the screen
-                self.view_bottom = int(self.view_bottom)
-                self.view_left = int(self.view_left)
-
-                # Do the scrolling
-                arcade.set_viewport(self.view_left,
-                                    SCREEN_WIDTH + self.view_left,
-                                    self.view_bottom,
-                                    SCREEN_HEIGHT + self.view_bottom)
+            profiler = self.profiler
+
+            # Step the game at its fixed rate, or back through the ticks
+            # played while rewinding, then show what happened in it
+            if self.rewinding:
+                events = []
+                snapshot = self.rewind.step_back(self.simulation.clock.steps(delta_time))
+                if snapshot is not None:
+                    self.jump_to(snapshot)
+            else:
+                events = self.simulation.advance(delta_time)
+                # Replays would count the same game twice
+                if self.telemetry is not None and self.replayer is None:
+                    self.telemetry.log(events)
+            profiler.start()
+            self.show_events(events)
+
+            # A game that has just ended is saved, or checked if it was a replay
+            if self.current_state != GAME_RUNNING:
+                self.finish_recording()
+            if self.replayer is not None and self.replayer.finished(self.simulation):
+                self.finish_replay()
+
+    def show_events(self, events):
+        """ Show what happened in the ticks just played, and move the sprites and camera along. """
+        profiler = self.profiler
+        for event in events:
+            if event.kind in (COIN_COLLECTED, HEART_COLLECTED, POISON_COLLECTED):
+                # Remove the pick-up and play a sound. In a streamed
+                # level, its chunk may have come and gone since.
+                sprite = self.pickup_sprites.get(event.item)
+                if sprite is not None:
+                    sprite.remove_from_sprite_lists()
+                profiler.lap("pickup_sprites")
+                self.audio.play("coin")
+            elif event.kind == PLAYER_DIED:
+                self.audio.play("game over")
+            elif event.kind == LEVEL_CHANGED:
+                # Load the next level, and save a checkpoint at its start
+                self.load_sprites()
+                if self.current_state == GAME_RUNNING and self.replayer is None:
+                    self.save_checkpoint()
+                profiler.lap("load_sprites")
+
+        # Catch up with the chunks a streamed level loaded and dropped
+        self.sync_chunks()
+        profiler.lap("load_sprites")
+
+        self.move_enemies()
+        profiler.lap("enemy_sprites")
+        self.show_player()
+        profiler.lap("player_sprite")
+
+        if self.simulation.changed_viewport:
+            self.scroll_viewport()
+        profiler.lap("viewport")
+
+        # The sounds of every tick just played go to the audio thread
+        # together, each played once
+        self.audio.flush()
+        profiler.lap("sound")
+
+    def move_enemies(self):
+        """ Put the enemy sprites where the simulation's enemies are, in the frame for the tick. """
+        enemies = self.simulation.enemies
+        frames = frame_index(0, self.enemy_list.frame_counts, self.simulation.level_tick,
+                             ENEMY_FRAME_TICKS, enemies.facing)
+        self.enemy_list.move(enemies.x, enemies.y, frames, enemies.angle)
+
+    def show_player(self):
+        """ Put the player sprite where the simulation's player is, in the frame for what they're doing. """
+        player = self.simulation.player
+        self.player_sprite.animate(player.center_x, player.center_y, player.change_x,
+                                   not self.simulation.physics_engine.can_jump(), self.simulation.tick)
+
+    def scroll_viewport(self):
+        """ Move the viewport to where the simulation's camera is. """
+        arcade.set_viewport(self.simulation.view_left,
+                            SCREEN_WIDTH + self.simulation.view_left,
+                            self.simulation.view_bottom,
+                            SCREEN_HEIGHT + self.simulation.view_bottom)
+
+
+class MultiplayerGame(MyGame):
+    """
+    The game played with others, on a server. Our player moves as soon as
+    a key is pressed, and is put right whenever the server has it somewhere
+    else. The other players are drawn a few ticks behind, moving smoothly
+    between the server's snapshots. Recording, rewinding and checkpoints
+    are for single player games only.
+    """
+
+    def __init__(self, width, height, title, address, mute=False):
+        super().__init__(width, height, title, save_file=None, mute=mute)
+        self.address = address
+        # The network runs on an asyncio loop, given a turn every frame
+        self.loop = asyncio.new_event_loop()
+        self.client = None
+        # Bitmask of the controls held down
+        self.held = 0
+        # Sprite for each of the other players, by player id
+        self.other_sprites = {}
+
+    def start_game(self):
+        """ Join the server. The game starts on its level once it answers. """
+        from multiplayer import GameClient
+        self.finish_loading()
+        if self.client is None:
+            self.client = GameClient(self.simulation)
+            self.loop.run_until_complete(
+                self.loop.create_datagram_endpoint(lambda: self.client, remote_addr=self.address))
+
+    def save_checkpoint(self):
+        """ There are no checkpoints in a game on a server. """
+
+    def on_key_press(self, key, modifiers):
+        """ Keep track of the controls held, to send the server every tick. """
+        if key in (arcade.key.F3, arcade.key.F4):
+            super().on_key_press(key, modifiers)
+        control = KEY_CONTROLS.get(key)
+        if control is not None:
+            self.held |= 1 << control
+
+    def on_key_release(self, key, modifiers):
+        """Called when the user releases a key. """
+        control = KEY_CONTROLS.get(key)
+        if control is not None:
+            self.held &= ~(1 << control)
+
+    def on_mouse_press(self, x, y, button, modifiers):
+        """ Click through the instructions. The server starts the next game by itself. """
+        if self.current_state in (INSTRUCTIONS_PAGE_0, INSTRUCTIONS_PAGE_1):
+            super().on_mouse_press(x, y, button, modifiers)
+
+    def on_close(self):
+        if self.client is not None:
+            self.client.leave()
+        self.loop.close()
+        super().on_close()
+
+    def update(self, delta_time):
+        """ Swap packets with the server, then play our ticks. """
+        if self.start_when_loaded and self.assets.done():
+            self.start_when_loaded = False
+            self.start_game()
+        if self.client is None:
+            return
+
+        # Let asyncio send what's queued and take in what has arrived
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+        events = []
+        for _ in range(self.simulation.clock.steps(delta_time)):
+            tick_events, jumped = self.client.step(self.held)
+            events += tick_events
+            if jumped:
+                self.audio.play("jump")
+        if not self.client.playing:
+            return
+
+        # We may be on another level, from a tick we played or from a
+        # snapshot, so levels are loaded here rather than for their events
+        self.profiler.start()
+        if self.simulation.prepared is not self.layers_level:
+            self.load_sprites()
+        self.show_events([event for event in events if event.kind != LEVEL_CHANGED])
+        if self.client.corrected:
+            # The snapshot may have put back pick-ups we thought we'd taken
+            self.client.corrected = False
+            self.show_pickups()
+            self.scroll_viewport()
+        self.show_others()
+        self.profiler.lap("other_players")
+
+    def show_others(self):
+        """ Move a sprite to each other player, adding and removing sprites for those who come and go. """
+        others = self.client.others()
+        for player_id in [player_id for player_id in self.other_sprites if player_id not in others]:
+            self.other_sprites.pop(player_id).remove_from_sprite_lists()
+        for player_id, (x, y, change_x, change_y, *_, level_tick) in others.items():
+            sprite = self.other_sprites.get(player_id)
+            if sprite is None:
+                character = OTHER_PLAYER_CHARACTERS[player_id % len(OTHER_PLAYER_CHARACTERS)]
+                sprite = self.other_sprites[player_id] = Player(character)
+                self.player_list.append(sprite)
+            # The physics stops a body that lands, so one standing still has
+            # no speed up or down
+            sprite.animate(x, y, change_x, change_y != 0, level_tick)
+
+
+def headless_main(ticks, level=1, streaming=False):
+    """ Run the game without a window, as fast as the CPU allows. """
+    simulation, elapsed = run_headless(ticks, level, streaming=streaming)
+    print(f"{ticks} ticks in {elapsed:.3f}s ({ticks / max(elapsed, 1e-9):.0f} ticks/s)")
+    print(f"Level: {simulation.level}  Score: {simulation.score}  Health: {simulation.health}")
+
+
+def report_replay(replayer):
+    """ Print whether a replay ended the way it was recorded. Returns True if it did. """
+    result = replayer.result
+    print(f"Replayed {result.ticks} ticks. "
+          f"Level: {result.level}  Score: {result.score}  Health: {result.health}")
+    mismatches = replayer.mismatches()
+    for mismatch in mismatches:
+        print(f"Mismatch, {mismatch}")
+    if not mismatches:
+        print("Replay matches the recording.")
+    return not mismatches
+
+
+def replay_main(replay_file):
+    """ Play a recording back without a window, as fast as the CPU allows. """
+    from replay import Recording, replay_headless
+    simulation, replayer = replay_headless(Recording.load(replay_file))
+    if not report_replay(replayer):
+        sys.exit(1)
 
 
 def main():
     """ Main method """
-    window = MyGame(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE)
-    window.setup(window.level)
+    parser = argparse.ArgumentParser(description=SCREEN_TITLE)
+    parser.add_argument("--headless", action="store_true",
+                        help="run the game logic without a window, uncapped")
+    parser.add_argument("--ticks", type=int, default=3600,
+                        help="number of ticks to run in headless mode")
+    parser.add_argument("--level", type=int, default=1,
+                        help="level to start on in headless mode")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the game played to FILE, each new game replacing the last")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play back a recording, and check it ends the same way. "
+                             "With --headless, plays it as fast as the CPU allows")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream every level, loading only the part near the camera. "
+                             "Infinite maps are always streamed")
+    parser.add_argument("--save", metavar="FILE", default=SAVE_FILE,
+                        help="file to keep the last checkpoint in, which F9 goes back to")
+    parser.add_argument("--connect", metavar="HOST[:PORT]",
+                        help="play with others on a server started with multiplayer.py")
+    parser.add_argument("--mute", action="store_true",
+                        help="play no sound")
+    parser.add_argument("--telemetry", action="store_true",
+                        help=f"record where you die and what you pick up, to a file in {TELEMETRY_DIRECTORY}/")
+    args = parser.parse_args()
+
+    if args.headless and args.replay:
+        replay_main(args.replay)
+        return
+    if args.headless:
+        headless_main(args.ticks, args.level, args.stream)
+        return
+
+    if args.connect:
+        host, _, port = args.connect.partition(":")
+        window = MultiplayerGame(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, (host, int(port or SERVER_PORT)),
+                                 mute=args.mute)
+        arcade.run()
+        return
+
+    # The first level is set up once the player clicks through the instructions
+    telemetry = None
+    if args.telemetry:
+        from telemetry import TelemetryWriter, session_file
+        telemetry = TelemetryWriter(session_file())
+    window = MyGame(SCREEN_WIDTH, SCREEN_HEIGHT, SCREEN_TITLE, record_file=args.record, streaming=args.stream,
+                    save_file=args.save, mute=args.mute, telemetry=telemetry)
+    if args.replay:
+        from replay import Recording
+        window.start_replay(Recording.load(args.replay))
     arcade.run()
 
 
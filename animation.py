@@ -0,0 +1,135 @@
+"""
+Animations of the characters and enemies, from tables made once.
+
+A table loads every frame of a character or enemy up front, facing left
+and right, and those textures are all of its sprites' textures. Showing a
+frame is then only picking one of them by index, from what the character
+is doing and the tick, so nothing is loaded while the game runs. The index
+is worked out the same way for a number or an array of them, so all of a
+level's enemies are animated at once.
+"""
+import os
+import threading
+
+import PIL.Image
+
+import textures
+from constants import *
+from tilemap import enemy_image, image_size
+
+_lock = threading.Lock()
+
+# Tables made so far, by character or enemy image name
+_characters = {}
+_enemies = {}
+
+
+def frame_index(first, count, ticks, frame_ticks, facing):
+    """
+    Index of the texture to show, in a table's textures. Each argument can
+    be a number, or an array with one for each sprite.
+
+    :param first: First frame of the animation
+    :param count: Frames in the animation
+    :param ticks: Ticks the animation has been playing
+    :param frame_ticks: Ticks each frame is shown for
+    :param facing: TEXTURE_LEFT or TEXTURE_RIGHT
+    """
+    return 2 * (first + ticks // frame_ticks % count) + facing
+
+
+def character_state(change_x, in_air, climbing=False):
+    """ Which animation a character shows, from how it's moving. """
+    if climbing:
+        return ANIMATION_CLIMB
+    if in_air:
+        return ANIMATION_JUMP
+    if change_x != 0:
+        return ANIMATION_WALK
+    return ANIMATION_IDLE
+
+
+class AnimationTable:
+    """
+    The frames of one character or enemy. Each frame is two textures,
+    facing left then right, so TEXTURE_LEFT and TEXTURE_RIGHT pick between
+    them. Each animation is a run of frames, from ``first`` for ``count``.
+    """
+
+    def __init__(self, animations, scale, faces_right=True, body_height=None):
+        """
+        :param animations: Image files of each animation's frames
+        :param float scale: Scale the frames are drawn at
+        :param bool faces_right: True if the images face right
+        :param float body_height: Height of the box the character moves as.
+                                  Its frames are drawn standing on the bottom
+                                  of it, rather than centered on it.
+        """
+        self.textures = []
+        self.first = []
+        self.count = []
+        # Where to draw each texture's center from the body's center
+        self.offsets = []
+        for paths in animations:
+            self.first.append(len(self.textures) // 2)
+            self.count.append(len(paths))
+            for path in paths:
+                self.textures.append(textures.load_texture(path, mirrored=faces_right, scale=scale))
+                self.textures.append(textures.load_texture(path, mirrored=not faces_right, scale=scale))
+                offset_x, offset_y = self._offset(path, scale, body_height)
+                self.offsets.extend(((-offset_x, offset_y), (offset_x, offset_y)))
+
+    @staticmethod
+    def _offset(path, scale, body_height):
+        """ Where to draw a right facing frame from the body's center, to line up its visible part. """
+        if body_height is None:
+            return 0.0, 0.0
+        with PIL.Image.open(path) as image:
+            width, height = image.size
+            left, top, right, bottom = image.convert("RGBA").getchannel("A").getbbox()
+        return (width / 2 - (left + right) / 2) * scale, (bottom - height / 2) * scale - body_height / 2
+
+    def index(self, animation, ticks, facing):
+        """ Index of the texture to show, some ticks into an animation. """
+        return frame_index(self.first[animation], self.count[animation], ticks, ANIMATION_FRAME_TICKS, facing)
+
+
+def character_table(character):
+    """ The table of one of CHARACTER_FRAMES, made the first time it's asked for. """
+    with _lock:
+        table = _characters.get(character)
+        if table is None:
+            animations = CHARACTER_FRAMES[character]
+            body_height = image_size(PLAYER_IMAGE)[1] * CHARACTER_SCALING
+            # Scaled so the character stands as tall as the body
+            with PIL.Image.open(animations[ANIMATION_IDLE][0]) as image:
+                top, bottom = image.convert("RGBA").getchannel("A").getbbox()[1::2]
+            table = _characters[character] = AnimationTable(animations, body_height / (bottom - top),
+                                                            body_height=body_height)
+    return table
+
+
+def enemy_table(name):
+    """
+    The table of an enemy image, made the first time it's asked for. Its
+    one animation is the image, then the image's ``_move`` frame if there
+    is one.
+    """
+    with _lock:
+        table = _enemies.get(name)
+        if table is None:
+            frames = [enemy_image(name)]
+            if os.path.exists(enemy_image(f"{name}_move")):
+                frames.append(enemy_image(f"{name}_move"))
+            table = _enemies[name] = AnimationTable([frames], TILE_SCALING, faces_right=False)
+    return table
+
+
+def load_tables():
+    """ Make every character's and enemy's table, so none is made part way into a game. """
+    for character in CHARACTER_FRAMES:
+        character_table(character)
+    for file_name in sorted(os.listdir(ENEMY_IMAGE_DIRECTORY)):
+        name, extension = os.path.splitext(file_name)
+        if extension == ".png" and "_" not in name:
+            enemy_table(name)
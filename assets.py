@@ -0,0 +1,58 @@
+"""
+Loading images, sounds and levels on background threads, so the window can
+show something while the rest is still being read.
+
+Jobs are handed to an ``AssetLoader`` by name, and their results picked up
+by name once they are ready. It keeps count of how many jobs are done, for
+a loading screen to show.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import arcade
+
+from constants import *
+
+
+def decode_texture(path):
+    """
+    Load a texture, and decode its image now. arcade only reads an image's
+    header when it loads it, and decodes the rest the first time it's drawn.
+    """
+    texture = arcade.load_texture(path)
+    texture.image.load()
+    return texture
+
+
+class AssetLoader:
+    """ Runs loading jobs on worker threads, and tells how far along they are. """
+
+    def __init__(self, workers=ASSET_LOADER_THREADS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assets")
+        self.jobs = {}
+
+    def load(self, name, function, *args):
+        """ Start a job. Jobs run in the order they're started. """
+        self.jobs[name] = self.executor.submit(function, *args)
+
+    def track(self, name, future):
+        """ Count a job started somewhere else, like a level being prefetched. """
+        if future is not None:
+            self.jobs[name] = future
+
+    def ready(self, name):
+        """ True if a job has finished. """
+        return self.jobs[name].done()
+
+    def get(self, name):
+        """ What a job loaded, waiting for it if it isn't done yet. """
+        return self.jobs[name].result()
+
+    def progress(self):
+        """ Fraction of the jobs that are done, from 0 to 1. """
+        if not self.jobs:
+            return 1.0
+        return sum(future.done() for future in self.jobs.values()) / len(self.jobs)
+
+    def done(self):
+        """ True once every job has finished. """
+        return all(future.done() for future in self.jobs.values())
@@ -0,0 +1,185 @@
+"""
+Sound effects, played on a fixed number of voices off the game's thread.
+
+Sounds are decoded into memory when they load, so starting one doesn't
+read or decode anything. The game asks for sounds as things happen, and
+once a frame hands them over to a worker thread that plays them: a sound
+asked for more than once in a frame is only played once, and each category
+of sound has its own few voices, so a run of coins can't start any number
+of players at the same time. When every voice of a category is busy, the
+one that started longest ago is stopped to play the new sound.
+
+The audio itself goes through a backend: pyglet's, or a null one that
+plays nothing, for machines with no sound.
+"""
+import queue
+import threading
+import time
+import wave
+from collections import deque
+
+from constants import *
+
+
+class NullBackend:
+    """
+    Plays nothing, but keeps track of what would be playing, and until
+    when, for machines with no sound and for trying the manager out.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        # (name, voice) of every sound started, in order
+        self.started = []
+
+    def decode(self, path):
+        """ How long a sound is, in seconds. Only .wav files can be read. """
+        try:
+            with wave.open(path) as sound:
+                return sound.getnframes() / sound.getframerate()
+        except (wave.Error, EOFError) as error:
+            raise ValueError(f"Can't read {path}: {error}") from error
+
+    def voice(self):
+        # When the sound on the voice ends, and its name
+        return [0.0, None]
+
+    def playing(self, voice):
+        return voice[0] > self.clock()
+
+    def start(self, voice, name, sound):
+        voice[:] = [self.clock() + sound, name]
+        self.started.append((name, voice))
+
+    def stop(self, voice):
+        voice[:] = [0.0, None]
+
+
+class PygletBackend:
+    """ Plays sounds through pyglet, each voice a pyglet player. """
+
+    def decode(self, path):
+        """ The whole sound, decoded into memory. """
+        import pyglet
+        try:
+            return pyglet.media.load(path, streaming=False)
+        except pyglet.media.exceptions.MediaException as error:
+            raise ValueError(f"Can't decode {path}: {error}") from error
+
+    def voice(self):
+        import pyglet
+        return pyglet.media.Player()
+
+    def playing(self, voice):
+        # A player drops its source once the source has played
+        return voice.source is not None
+
+    def start(self, voice, name, sound):
+        self.stop(voice)
+        voice.queue(sound)
+        voice.play()
+
+    def stop(self, voice):
+        if voice.source is not None:
+            voice.next_source()
+
+
+def default_backend():
+    """ pyglet's backend, or the null one if pyglet has no audio driver. """
+    import pyglet
+    if pyglet.media.get_audio_driver() is None:
+        return NullBackend()
+    return PygletBackend()
+
+
+class VoicePool:
+    """ The voices of one category of sound, in the order they were started. """
+
+    def __init__(self, backend, size):
+        self.backend = backend
+        self.idle = deque(backend.voice() for _ in range(size))
+        self.busy = deque()
+
+    def start(self, name, sound):
+        """ Play a sound on a free voice, or the one that has been playing longest. """
+        backend = self.backend
+        # Voices whose sound has ended are free again
+        for _ in range(len(self.busy)):
+            voice = self.busy.popleft()
+            (self.busy if backend.playing(voice) else self.idle).append(voice)
+        if self.idle:
+            voice = self.idle.popleft()
+        else:
+            voice = self.busy.popleft()
+            backend.stop(voice)
+        backend.start(voice, name, sound)
+        self.busy.append(voice)
+        return voice
+
+
+class AudioManager:
+    """
+    Loads the game's sounds and plays them, a frame's worth at a time, on
+    the voices of their category.
+    """
+
+    def __init__(self, backend=None, voices=SOUND_VOICES, threaded=True):
+        """
+        :param backend: Backend to play through, the default one if None
+        :param voices: How many voices each category of sound has
+        :param bool threaded: Play sounds on a worker thread. Without one,
+                              they play when each frame's are handed over.
+        """
+        self.backend = backend if backend is not None else default_backend()
+        self.pools = {category: VoicePool(self.backend, size) for category, size in voices.items()}
+        # Decoded sound and category of each sound, by name
+        self.sounds = {}
+        # Sounds asked for since the last frame's were handed over
+        self.pending = {}
+        self.batches = queue.SimpleQueue()
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self._run, name="audio", daemon=True)
+            self.thread.start()
+
+    def load(self, name, path, category):
+        """ Decode a sound, to be played by name. A sound that can't be loaded is left silent. """
+        try:
+            self.sounds[name] = (self.backend.decode(path), category)
+        except (OSError, ValueError) as error:
+            print(f"Unable to load {path}: {error}")
+
+    def play(self, name):
+        """ Ask for a sound to be played, once this frame's sounds are handed over. """
+        sound = self.sounds.get(name)
+        if sound is not None:
+            self.pending[name] = sound
+
+    def flush(self):
+        """ Hand the sounds asked for this frame over to be played. """
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = {}
+        if self.thread is None:
+            self._start(batch)
+        else:
+            self.batches.put(batch)
+
+    def close(self):
+        """ Stop the worker thread, once it has played what it was given. """
+        if self.thread is not None:
+            self.batches.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _start(self, batch):
+        for name, (sound, category) in batch.items():
+            self.pools[category].start(name, sound)
+
+    def _run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                return
+            self._start(batch)
@@ -0,0 +1,598 @@
+"""
+Many copies of the game stepped together, for bots and agents to play.
+
+Every instance's player, score, health, level and the pick-ups it has taken
+are kept in NumPy arrays, and each step moves all of them at once against
+dense grids of every level's tiles. The rules are the same as
+``Simulation``'s, and so are the results: an instance given the same
+controls as a simulation moves exactly the same way. The camera isn't
+followed, since it doesn't change how the game plays.
+
+    env = BatchEnv(1024)
+    observations = env.reset()
+    observations, rewards, done = env.step(actions)
+
+An action is the controls held down on that step, as bits: ``1 <<
+CONTROL_LEFT`` walks left, ``1 << CONTROL_RIGHT`` walks right, and ``1 <<
+CONTROL_JUMP`` jumps, if the player is standing on something.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from constants import *
+from enemies import EnemySet
+from level_cache import load_map, map_file
+from physics import STEP_TOLERANCE
+from tilemap import image_size, layer_shapes
+
+# Layers instances collide with, in the order they are stacked in the grids
+BATCH_LAYERS = (PLATFORMS_LAYER_NAME, COINS_LAYER_NAME, HEARTS_LAYER_NAME,
+                POISONS_LAYER_NAME, DONT_TOUCH_LAYER_NAME)
+WALLS, COINS, HEARTS, POISONS, DONT_TOUCH = range(len(BATCH_LAYERS))
+PICKUP_LAYERS = (COINS, HEARTS, POISONS)
+
+# Columns of an observation
+OBSERVATION_FIELDS = ("x", "y", "change_x", "change_y", "health", "score", "level")
+
+# Columns of the rewards: score and health gained on a step
+REWARD_SCORE = 0
+REWARD_HEALTH = 1
+
+
+class LevelGrids:
+    """
+    The tiles of every level as arrays, shared by all instances of a batch.
+
+    ``cells[level, layer, row, column]`` is the id of the tile shape in a
+    cell, or -1 for an empty one, and the shape arrays hold each shape's
+    bounding box and hit box polygon by id. Polygons are padded out to the
+    same length by repeating their first point. Pick-ups also have a slot,
+    numbered from 0 within their level, for the collected masks. Each
+    level's enemies are an EnemySet, in ``enemies[level]``.
+    """
+
+    def __init__(self, levels=range(1, MAX_LEVEL + 1)):
+        """
+        :param levels: Levels to load. A batch needs all of them, since games
+                       move on from one level to the next.
+        """
+        maps = {level: load_map(map_file(level), TILE_SCALING) for level in levels}
+        shapes = {level: [layer_shapes(my_map, name, TILE_SCALING) for name in BATCH_LAYERS]
+                  for level, my_map in maps.items()}
+        every_shape = [shape for layers in shapes.values() for layer in layers for shape in layer]
+        most_points = max(len(shape.points) for shape in every_shape)
+
+        # Levels are looked up by number, so row 0 of these is never used
+        self.height = np.zeros(MAX_LEVEL + 1, dtype=np.int64)
+        self.tile_width = np.ones(MAX_LEVEL + 1)
+        self.tile_height = np.ones(MAX_LEVEL + 1)
+        self.end_of_map = np.zeros(MAX_LEVEL + 1)
+        self.enemies = {level: EnemySet(my_map.enemies) for level, my_map in maps.items()}
+        for level, my_map in maps.items():
+            self.height[level] = my_map.height
+            self.tile_width[level] = my_map.tilewidth * TILE_SCALING
+            self.tile_height[level] = my_map.tileheight * TILE_SCALING
+            self.end_of_map[level] = (my_map.width - 1) * GRID_PIXEL_SIZE
+
+        width = max(my_map.width for my_map in maps.values())
+        self.cells = np.full((MAX_LEVEL + 1, len(BATCH_LAYERS), self.height.max(), width), -1, dtype=np.int32)
+
+        count = len(every_shape)
+        self.left = np.zeros(count)
+        self.right = np.zeros(count)
+        self.bottom = np.zeros(count)
+        self.top = np.zeros(count)
+        self.box = np.zeros(count, dtype=bool)
+        self.row = np.zeros(count, dtype=np.int64)
+        self.column = np.zeros(count, dtype=np.int64)
+        self.slot = np.full(count, -1, dtype=np.int64)
+        self.points = np.zeros((count, most_points + 1, 2))
+        self.edge_valid = np.zeros((count, most_points + 1), dtype=bool)
+
+        self.most_pickups = 0
+        shape_id = 0
+        for level, layers in shapes.items():
+            pickups = 0
+            for layer, layer_list in enumerate(layers):
+                for shape in layer_list:
+                    self.cells[level, layer, shape.row, shape.column] = shape_id
+                    self.left[shape_id] = shape.left
+                    self.right[shape_id] = shape.right
+                    self.bottom[shape_id] = shape.bottom
+                    self.top[shape_id] = shape.top
+                    self.box[shape_id] = shape.box
+                    self.row[shape_id] = shape.row
+                    self.column[shape_id] = shape.column
+                    points = list(shape.points)
+                    self.points[shape_id] = points + [points[0]] * (most_points + 1 - len(points))
+                    self.edge_valid[shape_id, :len(points)] = True
+                    if layer in PICKUP_LAYERS:
+                        self.slot[shape_id] = pickups
+                        pickups += 1
+                    shape_id += 1
+            self.most_pickups = max(self.most_pickups, pickups)
+
+        # Edge k of a polygon runs from point k to point k + 1, and its
+        # normal is worked out the same way polygons_intersect() does it
+        self.next_points = np.roll(self.points, -1, axis=1)
+        self.normals = np.stack((self.next_points[..., 1] - self.points[..., 1],
+                                 self.points[..., 0] - self.next_points[..., 0]), axis=-1)
+
+    def cell_contents(self, level, layer, left, right, bottom, top, reach_rows, reach_columns):
+        """
+        Shapes of one layer in the cells some boxes touch, found the same way
+        as TileIndex.hits() finds them, but not yet checked for overlap.
+
+        :param level: Level each box is on
+        :param int reach_rows: Most rows a box can touch
+        :param int reach_columns: Most columns a box can touch
+        :returns: Positions of the boxes, and shape ids
+        """
+        tile_width = self.tile_width[level]
+        tile_height = self.tile_height[level]
+        first_column = (left // tile_width).astype(np.int64) + 1
+        last_column = (right // tile_width).astype(np.int64) + 1
+        first_row = self.height[level] - 1 - (top // tile_height).astype(np.int64)
+        last_row = self.height[level] - 1 - (bottom // tile_height).astype(np.int64)
+
+        _, layers, height, width = self.cells.shape
+        rows = first_row[:, None] + np.arange(reach_rows)
+        columns = first_column[:, None] + np.arange(reach_columns)
+        rows_inside = (rows <= last_row[:, None]) & (rows >= 0) & (rows < height)
+        columns_inside = (columns <= last_column[:, None]) & (columns >= 0) & (columns < width)
+        rows = np.where(rows_inside, rows, 0)
+        columns = np.where(columns_inside, columns, 0)
+
+        cells = ((level * layers + layer) * height)[:, None] + rows
+        ids = self.cells.take(cells[:, :, None] * width + columns[:, None, :])
+        ids[~(rows_inside[:, :, None] & columns_inside[:, None, :])] = -1
+        box, row, column = np.nonzero(ids >= 0)
+        return box, ids[box, row, column]
+
+    def boxes_overlap(self, shapes, left, right, bottom, top):
+        """ Which boxes overlap the bounding boxes of shapes, a pair at a time. """
+        return ~((right <= self.left[shapes]) | (self.right[shapes] <= left)
+                 | (top <= self.bottom[shapes]) | (self.top[shapes] <= bottom))
+
+
+def _group_min(count, groups, values):
+    """ Smallest value in each group, or infinity for groups with none. """
+    result = np.full(count, np.inf)
+    np.minimum.at(result, groups, values)
+    return result
+
+
+def _group_max(count, groups, values):
+    """ Largest value in each group, or minus infinity for groups with none. """
+    result = np.full(count, -np.inf)
+    np.maximum.at(result, groups, values)
+    return result
+
+
+def _members(count, groups):
+    """ Which of count positions appear in groups. """
+    result = np.zeros(count, dtype=bool)
+    result[groups] = True
+    return result
+
+
+class BatchEnv:
+    """
+    A batch of independent games, stepped in lockstep.
+
+    Instances that lose, win, or play max_ticks steps are done. They are
+    started again straight away, so the observations step() returns for
+    them are of the new game.
+    """
+
+    def __init__(self, count, level=1, max_ticks=None, grids=None):
+        """
+        :param int count: Number of instances
+        :param int level: Level every game starts on
+        :param int max_ticks: Steps after which a game is done, if it is still going
+        :param LevelGrids grids: Level grids to share with other batches
+        """
+        self.count = count
+        self.start_level = level
+        self.max_ticks = max_ticks
+        self.grids = grids if grids is not None else LevelGrids()
+
+        width, height = image_size(PLAYER_IMAGE)
+        self.width = width * CHARACTER_SCALING
+        self.height = height * CHARACTER_SCALING
+        # Grid cells a body can overlap across and down, at most
+        self.reach_columns = int(self.width // self.grids.tile_width[1:].min()) + 2
+        self.reach_rows = int(self.height // self.grids.tile_height[1:].min()) + 2
+        # Longest move checked in one go on each level, as in TilePhysicsEngine
+        self.max_slice = np.minimum(np.minimum(self.grids.tile_width, self.grids.tile_height),
+                                    min(self.width, self.height)) / 2
+
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.change_x = np.zeros(count)
+        self.change_y = np.zeros(count)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.health = np.zeros(count, dtype=np.int64)
+        self.level = np.zeros(count, dtype=np.int64)
+        self.state = np.zeros(count, dtype=np.int8)
+        self.ticks = np.zeros(count, dtype=np.int64)
+        # Ticks played on the current level, which decide where its enemies are
+        self.level_ticks = np.zeros(count, dtype=np.int64)
+        # Pick-ups each instance has taken on its current level, by slot
+        self.collected = np.zeros((count, self.grids.most_pickups), dtype=bool)
+
+    def reset(self):
+        """ Start every instance over. Returns the observations. """
+        self.start_games(np.arange(self.count))
+        return self.observations()
+
+    def start_games(self, which):
+        """ Start some instances over, on the starting level. """
+        self.score[which] = 0
+        self.health[which] = PLAYER_START_HEALTH
+        self.level[which] = self.start_level
+        self.state[which] = GAME_RUNNING
+        self.ticks[which] = 0
+        self._start_level(which)
+
+    def observations(self):
+        """ Every instance's OBSERVATION_FIELDS, one row each. """
+        return np.column_stack((self.x, self.y, self.change_x, self.change_y,
+                                self.health, self.score, self.level)).astype(np.float32)
+
+    def step(self, actions):
+        """
+        Play one tick of every instance.
+
+        :param actions: Controls held by each instance, as bits
+        :returns: Observations, rewards with REWARD_SCORE and REWARD_HEALTH
+                  columns, and which instances are done
+        """
+        actions = np.asarray(actions)
+        score = self.score.copy()
+        health = self.health.copy()
+
+        running = np.flatnonzero(self.state == GAME_RUNNING)
+        self.level_ticks[running] += 1
+        self._control(running, actions[running])
+        self.change_y[running] -= GRAVITY
+        self._move_y(running)
+        self._move_x(running)
+        self._collect_pickups(running)
+        self._check_hazards(running)
+        self._check_level_end(running)
+        self.ticks[running] += 1
+
+        rewards = np.column_stack((self.score - score, self.health - health))
+        done = self.state != GAME_RUNNING
+        if self.max_ticks is not None:
+            done |= self.ticks >= self.max_ticks
+        self.start_games(np.flatnonzero(done))
+        return self.observations(), rewards, done
+
+    # Edges are rounded the way Body rounds them, and setting one moves the center
+
+    def _edges(self, which):
+        x, y = self.x[which], self.y[which]
+        return (np.round(x - self.width / 2, 2), np.round(x + self.width / 2, 2),
+                np.round(y - self.height / 2, 2), np.round(y + self.height / 2, 2))
+
+    def _set_left(self, which, value):
+        self.x[which] += value - np.round(self.x[which] - self.width / 2, 2)
+
+    def _set_right(self, which, value):
+        self.x[which] -= np.round(self.x[which] + self.width / 2, 2) - value
+
+    def _set_bottom(self, which, value):
+        self.y[which] += value - np.round(self.y[which] - self.height / 2, 2)
+
+    def _set_top(self, which, value):
+        self.y[which] -= np.round(self.y[which] + self.height / 2, 2) - value
+
+    def _hits(self, layer, which):
+        """
+        Tiles of one layer that some instances overlap, as TileIndex.hits()
+        finds them.
+
+        :returns: Positions in which, and shape ids, of every hit
+        """
+        grids = self.grids
+        left, right, bottom, top = self._edges(which)
+        hit, shapes = grids.cell_contents(self.level[which], layer, left, right, bottom, top,
+                                          self.reach_rows, self.reach_columns)
+
+        if layer in PICKUP_LAYERS:
+            keep = ~self.collected[which[hit], grids.slot[shapes]]
+            hit, shapes = hit[keep], shapes[keep]
+
+        left, right, bottom, top = left[hit], right[hit], bottom[hit], top[hit]
+        keep = grids.boxes_overlap(shapes, left, right, bottom, top)
+        polygons = keep & ~grids.box[shapes]
+        if polygons.any():
+            keep[polygons] = self._polygons_intersect(shapes[polygons], left[polygons], right[polygons],
+                                                      bottom[polygons], top[polygons])
+        return hit[keep], shapes[keep]
+
+    def _polygons_intersect(self, shapes, left, right, bottom, top):
+        """ polygons_intersect() of boxes and shapes' hit boxes, a pair at a time. """
+        grids = self.grids
+        body = np.stack((np.stack((left, bottom), axis=-1), np.stack((right, bottom), axis=-1),
+                         np.stack((right, top), axis=-1), np.stack((left, top), axis=-1)), axis=1)
+        body_next = np.roll(body, -1, axis=1)
+        body_normals = np.stack((body_next[..., 1] - body[..., 1], body[..., 0] - body_next[..., 0]), axis=-1)
+
+        normals = np.concatenate((body_normals, grids.normals[shapes]), axis=1)
+        valid = np.concatenate((np.ones((len(shapes), 4), dtype=bool), grids.edge_valid[shapes]), axis=1)
+        points = grids.points[shapes]
+
+        projected_a = normals[:, :, None, 0] * body[:, None, :, 0] + normals[:, :, None, 1] * body[:, None, :, 1]
+        projected_b = normals[:, :, None, 0] * points[:, None, :, 0] + normals[:, :, None, 1] * points[:, None, :, 1]
+        separated = (projected_a.max(axis=2) <= projected_b.min(axis=2)) \
+            | (projected_b.max(axis=2) <= projected_a.min(axis=2))
+        return ~(separated & valid).any(axis=1)
+
+    def _surface_heights(self, shapes, left, right):
+        """ surface_height() of shapes, each over its own span. """
+        grids = self.grids
+        heights = grids.top[shapes]
+        ramps = ~grids.box[shapes]
+        if not ramps.any():
+            return heights
+
+        ramp_shapes = shapes[ramps]
+        left = left[ramps][:, None]
+        right = right[ramps][:, None]
+        x1, y1 = grids.points[ramp_shapes, :, 0], grids.points[ramp_shapes, :, 1]
+        x2, y2 = grids.next_points[ramp_shapes, :, 0], grids.next_points[ramp_shapes, :, 1]
+        swap = x1 > x2
+        x1, y1, x2, y2 = np.where(swap, x2, x1), np.where(swap, y2, y1), np.where(swap, x1, x2), np.where(swap, y1, y2)
+
+        # Clip each edge to the span, and take the higher end of what's left
+        start, end = np.maximum(x1, left), np.minimum(x2, right)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = (y2 - y1) / (x2 - x1)
+            sloped = np.maximum(y1 + slope * (start - x1), y1 + slope * (end - x1))
+        height = np.where(x1 == x2, np.maximum(y1, y2), sloped)
+        height = np.where((start <= end) & grids.edge_valid[ramp_shapes], height, -np.inf)
+        highest = height.max(axis=1)
+        heights[ramps] = np.where(highest > -np.inf, highest, grids.top[ramp_shapes])
+        return heights
+
+    def _control(self, which, actions):
+        """ Walk and jump, as Simulation.press() does for held controls. """
+        right = (actions >> CONTROL_RIGHT) & 1
+        left = (actions >> CONTROL_LEFT) & 1
+        self.change_x[which] = (right - left) * PLAYER_MOVEMENT_SPEED
+
+        # Only players standing on a platform can jump
+        jumping = which[(actions >> CONTROL_JUMP) & 1 == 1]
+        self.y[jumping] -= 2
+        hit, shapes = self._hits(WALLS, jumping)
+        self.y[jumping] += 2
+        self.change_y[jumping[np.unique(hit)]] = PLAYER_JUMP_SPEED
+
+    def _slices(self, which, distance):
+        count = np.maximum(1, np.ceil(np.abs(distance) / self.max_slice[self.level[which]])).astype(np.int64)
+        return count, distance / count
+
+    def _move_y(self, which):
+        """ TilePhysicsEngine._move_y() for some instances. """
+        count, step = self._slices(which, self.change_y[which])
+        for slice_index in range(int(count.max(initial=0))):
+            moving = count > slice_index
+            which, count, step = which[moving], count[moving], step[moving]
+            self.y[which] += step
+            hit, shapes = self._hits(WALLS, which)
+            if len(hit) == 0:
+                continue
+
+            stopped = _members(len(which), hit)
+            rising = step[hit] > 0
+            ceiling = _group_min(len(which), hit[rising], self.grids.bottom[shapes[rising]])
+            left, right, _, _ = self._edges(which[hit[~rising]])
+            floor = _group_max(len(which), hit[~rising],
+                               self._surface_heights(shapes[~rising], left, right))
+
+            # Bumped heads, and landed on the highest surface underneath
+            bumped = stopped & (step > 0)
+            landed = stopped & (step <= 0)
+            self._set_top(which[bumped], ceiling[bumped])
+            self._set_bottom(which[landed], floor[landed])
+            self.change_y[which[stopped]] = 0
+            which, count, step = which[~stopped], count[~stopped], step[~stopped]
+
+    def _move_x(self, which):
+        """ TilePhysicsEngine._move_x() for some instances. """
+        count, step = self._slices(which, self.change_x[which])
+        for slice_index in range(int(count.max(initial=0))):
+            moving = count > slice_index
+            which, count, step = which[moving], count[moving], step[moving]
+            self.x[which] += step
+            hit, shapes = self._hits(WALLS, which)
+            if len(hit) == 0:
+                continue
+
+            touching = _members(len(which), hit)
+            left, right, bottom, _ = self._edges(which)
+            rise = _group_max(len(which), hit,
+                              self._surface_heights(shapes, left[hit], right[hit])) - bottom
+
+            # Walk up ramps and small steps, no higher than we moved sideways
+            climbing = np.flatnonzero(touching & (rise > 0) & (rise <= np.abs(step) + STEP_TOLERANCE))
+            self.y[which[climbing]] += rise[climbing]
+            still_hit, _ = self._hits(WALLS, which[climbing])
+            failed = climbing[np.unique(still_hit)]
+            self.y[which[failed]] -= rise[failed]
+            climbed = np.zeros(len(which), dtype=bool)
+            climbed[climbing] = True
+            climbed[failed] = False
+
+            # Blocked, so stand against the wall
+            blocked = touching & ~climbed
+            walls_left = _group_min(len(which), hit, self.grids.left[shapes])
+            walls_right = _group_max(len(which), hit, self.grids.right[shapes])
+            to_right = blocked & (step > 0)
+            to_left = blocked & (step <= 0)
+            self._set_right(which[to_right], walls_left[to_right])
+            self._set_left(which[to_left], walls_right[to_left])
+            which, count, step = which[~blocked], count[~blocked], step[~blocked]
+
+    def _collect(self, layer, which):
+        """ Take every pick-up of a layer that instances touch. Returns how many each took. """
+        hit, shapes = self._hits(layer, which)
+        self.collected[which[hit], self.grids.slot[shapes]] = True
+        return np.bincount(hit, minlength=len(which))
+
+    def _collect_pickups(self, which):
+        self.score[which] += self._collect(COINS, which)
+        self.health[which] += self._collect(HEARTS, which)
+        self.health[which] -= self._collect(POISONS, which)
+
+    def _respawn(self, which):
+        self.x[which] = PLAYER_START_X
+        self.y[which] = PLAYER_START_Y
+
+    def _check_hazards(self, which):
+        """ Take a life for falling off the map or touching a hazard. """
+        fell = which[self.y[which] < FALL_LIMIT_Y]
+        self.health[fell] -= 1
+        self._respawn(fell)
+
+        hit, _ = self._hits(DONT_TOUCH, which)
+        touched = which[np.unique(hit)]
+        self.health[touched] -= 1
+        self._respawn(touched)
+
+        # Enemies are worked out for each level's instances at once, each
+        # at its own tick into the level
+        for level in np.unique(self.level[which]):
+            enemies = self.grids.enemies[level]
+            if not len(enemies):
+                continue
+            on_level = which[self.level[which] == level]
+            x, y, _ = enemies.positions(self.level_ticks[on_level])
+            left, right, bottom, top = self._edges(on_level)
+            hurt = enemies.touching(x, y, left[:, None], right[:, None], bottom[:, None], top[:, None]).any(axis=1)
+            self.health[on_level[hurt]] -= 1
+            self._respawn(on_level[hurt])
+
+        lost = which[self.health[which] < 0]
+        self.state[lost] = YOU_LOST
+        self._respawn(lost)
+
+    def _check_level_end(self, which):
+        """ Move instances that reached the end of their level on to the next. """
+        ended = which[self.x[which] >= self.grids.end_of_map[self.level[which]]]
+        last = self.level[ended] == MAX_LEVEL
+        self.state[ended[last]] = YOU_WON
+        self.level[ended[~last]] += 1
+        self._start_level(ended)
+
+    def _start_level(self, which):
+        self._respawn(which)
+        self.change_x[which] = 0
+        self.change_y[which] = 0
+        self.level_ticks[which] = 0
+        self.collected[which] = False
+
+
+def _serve_shard(connection, count, options):
+    """ Run a BatchEnv in a worker process, stepping it when asked. """
+    env = BatchEnv(count, **options)
+    while True:
+        command, actions = connection.recv()
+        if command == "step":
+            connection.send(env.step(actions))
+        elif command == "reset":
+            connection.send(env.reset())
+        else:
+            break
+    connection.close()
+
+
+class ShardedBatchEnv:
+    """
+    A BatchEnv split across worker processes, one shard each, with the
+    same reset and step methods. Each step sends every shard its actions
+    and waits for them all.
+    """
+
+    def __init__(self, count, processes=None, **options):
+        """
+        :param int count: Number of instances, in all
+        :param int processes: Number of worker processes, by default one per CPU
+        :param options: Passed on to each shard's BatchEnv
+        """
+        processes = min(count, processes or os.cpu_count() or 1)
+        sizes = [count // processes + (index < count % processes) for index in range(processes)]
+        self.count = count
+        self.bounds = np.cumsum([0] + sizes)
+        self.connections = []
+        self.processes = []
+        for size in sizes:
+            connection, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve_shard, args=(child, size, options), daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def reset(self):
+        """ Start every instance over. Returns the observations. """
+        for connection in self.connections:
+            connection.send(("reset", None))
+        return np.concatenate([connection.recv() for connection in self.connections])
+
+    def step(self, actions):
+        """ Play one tick of every instance. Returns the same as BatchEnv.step(). """
+        actions = np.asarray(actions)
+        for connection, start, end in zip(self.connections, self.bounds, self.bounds[1:]):
+            connection.send(("step", actions[start:end]))
+        results = [connection.recv() for connection in self.connections]
+        return tuple(np.concatenate(parts) for parts in zip(*results))
+
+    def close(self):
+        """ Stop the worker processes. """
+        for connection in self.connections:
+            connection.send(("close", None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+
+def main():
+    """ Main method """
+    parser = argparse.ArgumentParser(description="Time a batch of games played with random controls.")
+    parser.add_argument("--envs", type=int, default=4096, help="number of games in the batch")
+    parser.add_argument("--steps", type=int, default=600, help="number of steps to time")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="split the batch across this many processes")
+    parser.add_argument("--max-ticks", type=int, default=3600, help="steps after which a game starts over")
+    args = parser.parse_args()
+
+    if args.processes:
+        env = ShardedBatchEnv(args.envs, args.processes, max_ticks=args.max_ticks)
+    else:
+        env = BatchEnv(args.envs, max_ticks=args.max_ticks)
+    env.reset()
+
+    random = np.random.default_rng(0)
+    controls = 1 << np.array([CONTROL_JUMP, CONTROL_LEFT, CONTROL_RIGHT])
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        held = random.random((args.envs, len(controls))) < (0.05, 0.2, 0.6)
+        env.step((held * controls).sum(axis=1))
+    elapsed = time.perf_counter() - start
+
+    if args.processes:
+        env.close()
+    print(f"{args.envs * args.steps / elapsed:,.0f} game steps a second "
+          f"({args.steps / elapsed:,.1f} batch steps of {args.envs})")
+
+
+if __name__ == "__main__":
+    main()
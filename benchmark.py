@@ -0,0 +1,263 @@
+"""
+Benchmarks for every level: how long setting a level up takes, what a tick
+costs and where it goes, and what drawing each layer costs.
+
+The player is moved by a scripted input trace, so every run of a level plays
+out the same way. Results are written as JSON, and can be compared against
+an earlier run to catch anything that got slower.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+from constants import *
+from level_cache import LevelLoader, cache_file, map_file
+from profiler import PHASES, FrameProfiler
+from replay import Input, Recording, Replayer, Result
+from simulation import Simulation
+
+# Health to play the benchmark with, so dying never ends a run early
+BENCHMARK_HEALTH = 1000000
+
+# Draw order of the layers in MyGame.draw_game()
+DRAW_LAYERS = (BACKGROUND_LAYER_NAME, PLATFORMS_LAYER_NAME, COINS_LAYER_NAME, DONT_TOUCH_LAYER_NAME,
+               HEARTS_LAYER_NAME, POISONS_LAYER_NAME, "Enemies", "Player", FOREGROUND_LAYER_NAME)
+
+
+def scripted_trace(ticks, jump_every=45):
+    """
+    Input trace that holds right, and jumps every so often, which gets
+    through a good part of most levels.
+    """
+    recording = Recording(1, 0, BENCHMARK_HEALTH)
+    recording.inputs.append(Input(0, True, CONTROL_RIGHT))
+    for tick in range(0, ticks, jump_every):
+        recording.inputs.append(Input(tick, True, CONTROL_JUMP))
+    recording.result = Result(ticks, 1, 0, BENCHMARK_HEALTH, GAME_RUNNING, 0, 0)
+    return recording
+
+
+def trace_from_file(path, ticks):
+    """ The inputs of a recording, as a trace to play on any level. """
+    recording = Recording.load(path)
+    trace = Recording(1, 0, BENCHMARK_HEALTH)
+    trace.inputs = recording.inputs
+    trace.result = Result(ticks, 1, 0, BENCHMARK_HEALTH, GAME_RUNNING, 0, 0)
+    return trace
+
+
+def time_setup(level, repeats, prepare):
+    """
+    Seconds to set a level up: cold, with no compiled cache, then the
+    median of some warm runs, with the cache in place.
+    """
+    try:
+        os.remove(cache_file(map_file(level)))
+    except OSError:
+        pass
+
+    simulation = Simulation(LevelLoader(prepare=prepare, background=False))
+    start = time.perf_counter()
+    simulation.setup(level)
+    cold = time.perf_counter() - start
+
+    warm = []
+    for _ in range(repeats):
+        simulation = Simulation(LevelLoader(prepare=prepare, background=False))
+        start = time.perf_counter()
+        simulation.setup(level)
+        warm.append(time.perf_counter() - start)
+    return cold, statistics.median(warm)
+
+
+def play_level(level, trace, view_samples):
+    """
+    Play a trace on one level, timing every tick with the simulation's
+    profiler, each tick a frame of it.
+
+    :returns: Ticks played, seconds spent in each phase the simulation
+              timed, and viewports seen along the way, for the draw benchmark
+    """
+    simulation = Simulation(LevelLoader(background=False))
+    simulation.setup(level)
+    simulation.controller = Replayer(trace, simulation)
+
+    ticks = trace.result.ticks
+    # Room for every tick, so none is overwritten before being counted
+    profiler = simulation.profiler = FrameProfiler(capacity=max(ticks, 1))
+    profiler.toggle()
+    profiler.end_frame()
+
+    sample_every = max(1, ticks // view_samples)
+    viewports = []
+    played = 0
+    while played < ticks and simulation.level == level and simulation.current_state == GAME_RUNNING:
+        simulation.update()
+        profiler.end_frame()
+        played += 1
+        if played % sample_every == 0:
+            viewports.append((simulation.view_left, simulation.view_bottom))
+
+    totals = profiler.frames().sum(axis=0)
+    timings = {phase: float(seconds) for phase, seconds in zip(PHASES, totals) if seconds > 0}
+    return played, timings, viewports
+
+
+def time_draws(window, level, viewports, repeats):
+    """ Median microseconds to draw each layer, over the sampled viewports. """
+    import arcade
+    from pyglet import gl
+
+    from Game import Player, build_level_sprites
+    from renderer import MovingSpriteList, enemy_sprites
+
+    simulation = Simulation(LevelLoader(prepare=build_level_sprites, background=False))
+    simulation.setup(level)
+    layers = simulation.prepared.sprites
+    player_list = MovingSpriteList()
+    player = Player()
+    player_list.append(player)
+    enemy_list = enemy_sprites(simulation.map.enemies)
+
+    samples = {name: [] for name in DRAW_LAYERS}
+    for view_left, view_bottom in viewports:
+        arcade.set_viewport(view_left, view_left + SCREEN_WIDTH, view_bottom, view_bottom + SCREEN_HEIGHT)
+        viewport = (view_left, view_bottom, view_left + SCREEN_WIDTH, view_bottom + SCREEN_HEIGHT)
+        player.animate(view_left + SCREEN_WIDTH / 2, view_bottom + SCREEN_HEIGHT / 2, 0, False, 0)
+        for _ in range(repeats):
+            arcade.start_render()
+            for name in DRAW_LAYERS:
+                # Wait for the GPU each time, so its work is counted too
+                gl.glFinish()
+                start = time.perf_counter()
+                if name == "Player":
+                    player_list.draw()
+                elif name == "Enemies":
+                    enemy_list.draw()
+                else:
+                    layers[name].draw(*viewport)
+                gl.glFinish()
+                samples[name].append(time.perf_counter() - start)
+            window.flip()
+    return {name: statistics.median(values) * 1e6 for name, values in samples.items() if values}
+
+
+def run(levels, ticks, repeats, trace, draw):
+    """ Benchmark some levels, and return the results as a dictionary. """
+    prepare = None
+    window = None
+    if draw:
+        import arcade
+
+        import textures
+        from Game import build_level_sprites
+        prepare = build_level_sprites
+        window = arcade.Window(SCREEN_WIDTH, SCREEN_HEIGHT, "Benchmark")
+        textures.atlas()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ticks": ticks,
+        "levels": {},
+    }
+    for level in levels:
+        cold, warm = time_setup(level, repeats, prepare)
+        played, timings, viewports = play_level(level, trace, view_samples=30)
+        tick = {phase: seconds / max(played, 1) * 1e6 for phase, seconds in timings.items()}
+        tick["total"] = sum(timings.values()) / max(played, 1) * 1e6
+        result = {
+            "setup_cold_ms": cold * 1e3,
+            "setup_warm_ms": warm * 1e3,
+            "ticks_played": played,
+            "tick_us": tick,
+        }
+        if window is not None:
+            result["draw_us"] = time_draws(window, level, viewports, repeats)
+        results["levels"][str(level)] = result
+        print(f"Level {level}: setup {cold * 1e3:.1f} ms cold, {warm * 1e3:.1f} ms warm, "
+              f"{tick['total']:.1f} us a tick over {played} ticks")
+
+    if window is not None:
+        window.close()
+    return results
+
+
+def _flatten(results, prefix=""):
+    """ Every timing in a result dictionary, keyed by its path. """
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, float):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline, results, threshold):
+    """
+    Timings that got slower than the baseline by more than threshold, as
+    a fraction (0.1 is 10%), as (name, baseline, now) tuples. Timings that
+    were zero in the baseline have nothing to be a fraction of, and are
+    left out.
+    """
+    before = _flatten(baseline["levels"], "level ")
+    after = _flatten(results["levels"], "level ")
+    return [(name, before[name], after[name]) for name in sorted(after)
+            if before.get(name, 0) > 0 and after[name] > before[name] * (1 + threshold)]
+
+
+def main():
+    """ Main method """
+    parser = argparse.ArgumentParser(description="Benchmark every level of the game.")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(range(1, MAX_LEVEL + 1)),
+                        help="levels to benchmark")
+    parser.add_argument("--ticks", type=int, default=1200,
+                        help="most ticks to play on each level")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="how many times to repeat warm setups and draws")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="play the inputs of a recording made with Game.py --record, "
+                             "instead of the scripted trace")
+    parser.add_argument("--draw", action="store_true",
+                        help="also time drawing each layer, which needs a window")
+    parser.add_argument("--output", metavar="FILE", help="write the results to FILE as JSON")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare against the results in FILE, failing on regressions")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="how much slower a timing can get before it is a regression")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = trace_from_file(args.trace, args.ticks)
+    else:
+        trace = scripted_trace(args.ticks)
+
+    results = run(args.levels, args.ticks, args.repeats, trace, args.draw)
+
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+
+    if args.compare:
+        with open(args.compare) as source:
+            baseline = json.load(source)
+        regressions = compare(baseline, results, args.threshold)
+        for name, before, after in regressions:
+            change = f"+{(after / before - 1) * 100:.0f}%" if before else f"+{after - before:.2f}"
+            print(f"Regression, {name}: {before:.2f} -> {after:.2f} ({change})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold * 100:.0f}%.")
+
+
+if __name__ == "__main__":
+    main()
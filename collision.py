@@ -0,0 +1,203 @@
+"""
+Collision tests between the player's box and tiles, and the grids tiles
+and enemies are looked up by.
+"""
+import numpy as np
+
+
+def polygons_intersect(poly_a, poly_b):
+    """ Separating axis test. Touching edges do not count as a hit. """
+    for polygon in (poly_a, poly_b):
+        for i1 in range(len(polygon)):
+            x1, y1 = polygon[i1]
+            x2, y2 = polygon[(i1 + 1) % len(polygon)]
+            normal_x, normal_y = y2 - y1, x1 - x2
+
+            projected = [normal_x * x + normal_y * y for x, y in poly_a]
+            min_a, max_a = min(projected), max(projected)
+            projected = [normal_x * x + normal_y * y for x, y in poly_b]
+            min_b, max_b = min(projected), max(projected)
+
+            if max_a <= min_b or max_b <= min_a:
+                return False
+    return True
+
+
+def check_for_collision(body, shape):
+    """ True if the body overlaps a tile shape. """
+    if body.right <= shape.left or shape.right <= body.left \
+            or body.top <= shape.bottom or shape.top <= body.bottom:
+        return False
+
+    # Two boxes that overlap on both axes intersect. Only tiles with a hit
+    # box polygon need the full test.
+    if shape.box:
+        return True
+    return polygons_intersect(body.points, shape.points)
+
+
+def check_for_collision_with_list(body, shapes):
+    """ All tile shapes the body overlaps. """
+    return [shape for shape in shapes if check_for_collision(body, shape)]
+
+
+def surface_height(shape, left, right):
+    """
+    Highest point of a tile between two x coordinates: where something
+    standing on it over that span would rest. For a box it is the top, for
+    a ramp it depends on how far up the slope the span reaches.
+    """
+    if shape.box:
+        return shape.top
+
+    highest = None
+    points = shape.points
+    for i1 in range(len(points)):
+        x1, y1 = points[i1]
+        x2, y2 = points[(i1 + 1) % len(points)]
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+
+        # Clip the edge to the span, and take the higher end of what's left
+        start, end = max(x1, left), min(x2, right)
+        if start > end:
+            continue
+        if x1 == x2:
+            height = max(y1, y2)
+        else:
+            slope = (y2 - y1) / (x2 - x1)
+            height = max(y1 + slope * (start - x1), y1 + slope * (end - x1))
+        if highest is None or height > highest:
+            highest = height
+
+    return shape.top if highest is None else highest
+
+
+class TileIndex:
+    """
+    The tiles of one layer, looked up by grid cell.
+
+    Finding what the player overlaps only looks at the few cells under the
+    player's box, so the cost doesn't grow with the number of tiles in the
+    layer. Iterating gives the tiles in the order they were added.
+    """
+
+    def __init__(self, shapes, tile_width, tile_height, map_height):
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.map_height = map_height
+        # The tiles the index was made with, to put back when a level
+        # restarts, and a bitmask of those taken out, by their position
+        self.shapes = shapes
+        self.positions = {shape: position for position, shape in enumerate(shapes)}
+        self.taken = 0
+        self.cells = {(shape.row, shape.column): shape for shape in shapes}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells.values())
+
+    def add(self, shape):
+        """ Put a tile in the index. """
+        self.cells[shape.row, shape.column] = shape
+
+    def remove(self, shape):
+        """ Take a tile out of the index, for example once it is picked up. """
+        del self.cells[shape.row, shape.column]
+        position = self.positions.get(shape)
+        if position is not None:
+            self.taken |= 1 << position
+
+    def restore(self):
+        """
+        Put back every tile the index was made with, such as the coins picked
+        up the last time its level was played, in their first order. Only
+        for indexes that have had tiles taken out, not added.
+        """
+        if len(self.cells) != len(self.shapes):
+            self.cells = {(shape.row, shape.column): shape for shape in self.shapes}
+        self.taken = 0
+
+    def take(self, taken):
+        """
+        Have exactly the tiles in a bitmask like ``taken`` be out of the
+        index, putting back or taking out only those that differ.
+        """
+        cells = self.cells
+        changed = self.taken ^ taken
+        while changed:
+            bit = changed & -changed
+            shape = self.shapes[bit.bit_length() - 1]
+            if taken & bit:
+                del cells[shape.row, shape.column]
+            else:
+                cells[shape.row, shape.column] = shape
+            changed ^= bit
+        self.taken = taken
+
+    def discard(self, shape):
+        """ Take a tile out of the index, if it is still in it. """
+        if self.cells.get((shape.row, shape.column)) is shape:
+            del self.cells[shape.row, shape.column]
+
+    def hits(self, body):
+        """ All tiles the body overlaps. """
+        # A tile in column c covers x from (c - 1) to c tile widths, and a tile
+        # in row r covers y from (map_height - r - 1) to (map_height - r).
+        first_column = int(body.left // self.tile_width) + 1
+        last_column = int(body.right // self.tile_width) + 1
+        first_row = self.map_height - 1 - int(body.top // self.tile_height)
+        last_row = self.map_height - 1 - int(body.bottom // self.tile_height)
+
+        cells = self.cells
+        hit_list = []
+        for row in range(first_row, last_row + 1):
+            for column in range(first_column, last_column + 1):
+                shape = cells.get((row, column))
+                if shape is not None and check_for_collision(body, shape):
+                    hit_list.append(shape)
+        return hit_list
+
+
+class SpatialHash:
+    """
+    Points that move, like the enemies' centers, filed under the square cell
+    they are in. It is filled in all at once after they move, by sorting
+    them by cell, and a box only looks at the points in the cells it covers.
+    """
+
+    # Rows and columns are packed into one key, with rows offset to be positive
+    _ROWS = 1 << 32
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+        # Each point's key, in the order the points were given
+        self.cells = self.keys
+
+    def build(self, x, y):
+        """
+        File points away, replacing the ones filed before. If none of them
+        has changed cell, they aren't sorted again.
+        """
+        columns = np.floor_divide(x, self.cell_size).astype(np.int64)
+        rows = np.floor_divide(y, self.cell_size).astype(np.int64)
+        keys = columns * self._ROWS + rows + self._ROWS // 2
+        if np.array_equal(keys, self.cells):
+            return
+        self.cells = keys
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def query(self, left, right, bottom, top):
+        """ Positions of the points in the cells a box covers. Some may be outside the box itself. """
+        size = self.cell_size
+        columns = np.arange(int(left // size), int(right // size) + 1, dtype=np.int64)
+        rows = np.arange(int(bottom // size), int(top // size) + 1, dtype=np.int64)
+        wanted = (columns[:, None] * self._ROWS + rows + self._ROWS // 2).ravel()
+        starts = np.searchsorted(self.keys, wanted, side="left")
+        ends = np.searchsorted(self.keys, wanted, side="right")
+        return np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
@@ -0,0 +1,223 @@
+"""
+Constants shared by the game window and the headless simulation.
+"""
+
+SCREEN_WIDTH = 1280
+SCREEN_HEIGHT = 720
+SCREEN_TITLE = "Platformer"
+
+# These numbers represent "states" that the game can be in.
+INSTRUCTIONS_PAGE_0 = 0
+INSTRUCTIONS_PAGE_1 = 1
+GAME_RUNNING = 2
+YOU_LOST = 3
+YOU_WON = 4
+MAX_LEVEL = 10
+
+# Constants used to scale our sprites from their original size
+CHARACTER_SCALING = 0.8
+TILE_SCALING = 0.4
+COIN_SCALING = 0.4
+SPRITE_PIXEL_SIZE = 128
+GRID_PIXEL_SIZE = (SPRITE_PIXEL_SIZE * TILE_SCALING)
+
+# Movement speed of player, in pixels per tick
+PLAYER_MOVEMENT_SPEED = 8
+GRAVITY = 1.2
+PLAYER_JUMP_SPEED = 20
+
+# The game logic runs at a fixed rate, whatever the frame rate is
+FIXED_TIMESTEP = 1 / 60
+# Most ticks to run in one frame, so a long stall doesn't snowball
+MAX_STEPS_PER_FRAME = 5
+
+# How many pixels to keep as a minimum margin between the character
+# and the edge of the screen.
+LEFT_VIEWPORT_MARGIN = 200
+RIGHT_VIEWPORT_MARGIN = 200
+BOTTOM_VIEWPORT_MARGIN = 150
+TOP_VIEWPORT_MARGIN = 100
+
+# Static layers are drawn in square chunks of this many tiles a side
+CHUNK_TILES = 8
+CHUNK_PIXEL_SIZE = CHUNK_TILES * GRID_PIXEL_SIZE
+
+# Streamed levels are read in square chunks of this many tiles a side. The
+# chunks on screen, and this many more all round, are kept loaded; others
+# are dropped once more than the budget are loaded.
+STREAM_CHUNK_TILES = 8
+STREAM_MARGIN_CHUNKS = 1
+STREAM_CHUNK_BUDGET = 48
+
+# Images packed into the texture atlas, and the size of its pages
+ATLAS_DIRECTORIES = ("images/tiles", "images/items", "images/enemies",
+                     "images/player_1", "images/player_2", "images/alien")
+ATLAS_PAGE_SIZE = 2048
+# Gap between images, so filtering doesn't bleed one into the next
+ATLAS_PADDING = 2
+
+# Heads up display: its text, icons, and how far it sits from the corner of
+# the screen and between items
+HUD_FONTS = ("arial.ttf", "calibri.ttf", "DejaVuSans.ttf", "NotoSans-Regular.ttf", "FreeSans.ttf")
+HUD_FONT_SIZE = 22
+HUD_TEXT_COLOR = (0, 0, 0)
+HUD_COIN_ICON = "images/items/gemBlue.png"
+HUD_HEART_ICON = "images/items/gemRed.png"
+HUD_ICON_SCALING = 0.25
+HUD_MARGIN = 10
+HUD_SPACING = 6
+
+# How many frames the profiler keeps, and how often its overlay is worked
+# out again, in frames
+PROFILER_FRAMES = 600
+PROFILER_OVERLAY_REFRESH = 30
+# The overlay is drawn in a fixed width font, as columns of numbers
+PROFILER_FONTS = ("cour.ttf", "consola.ttf", "DejaVuSansMono.ttf", "NotoSansMono-Regular.ttf", "FreeMono.ttf")
+PROFILER_FONT_SIZE = 11
+PROFILER_LINE_HEIGHT = 16
+PROFILER_TEXT_COLOR = (255, 255, 255)
+
+# Instruction pages, in the order they're shown, then the game over and
+# you won pages
+INSTRUCTION_PAGES = ("images/instructions/1.png", "images/instructions/2.png",
+                     "images/instructions/GameOver.png", "images/instructions/YouWon.png")
+
+COIN_SOUND = "sounds/coin1.wav"
+JUMP_SOUND = "sounds/jump1.wav"
+GAME_OVER_SOUND = "sounds/gameover1.wav"
+# Each sound's file, and the category of voices it plays on, by name. A
+# category only plays so many sounds at once.
+SOUNDS = {
+    "coin": (COIN_SOUND, "pickups"),
+    "jump": (JUMP_SOUND, "player"),
+    "game over": (GAME_OVER_SOUND, "game"),
+}
+SOUND_VOICES = {"pickups": 4, "player": 2, "game": 1}
+
+# Threads that load images, sounds and the first level while the first
+# instruction page is up, and the loading bar drawn until they're done
+ASSET_LOADER_THREADS = 3
+LOADING_BAR_WIDTH = 400
+LOADING_BAR_HEIGHT = 12
+LOADING_BAR_COLOR = (0, 0, 0)
+
+PLAYER_START_X = 80
+PLAYER_START_Y = 294
+PLAYER_IMAGE = "images/player_1/player_stand.png"
+
+# What a character can be seen doing
+ANIMATION_IDLE = 0
+ANIMATION_WALK = 1
+ANIMATION_JUMP = 2
+ANIMATION_CLIMB = 3
+# Each character's frames for each of those, in the order they're shown.
+# Characters are scaled to stand as tall as the player's body.
+CHARACTER_FRAMES = {
+    "player_1": ((PLAYER_IMAGE, ),
+                 ("images/player_1/female_walk1.png", "images/player_1/female_walk2.png"),
+                 ("images/player_1/female_jump.png", ),
+                 ("images/player_1/female_back.png", )),
+    "player_2": (("images/player_2/player_stand.png", ),
+                 ("images/player_2/player_walk1.png", "images/player_2/player_walk2.png"),
+                 ("images/player_2/player_jump.png", ),
+                 ("images/player_2/player_back.png", )),
+    "alien": (("images/alien/alienBlue_front.png", ),
+              ("images/alien/alienBlue_walk1.png", "images/alien/alienBlue_walk2.png"),
+              ("images/alien/alienBlue_jump.png", ),
+              ("images/alien/alienBlue_climb1.png", "images/alien/alienBlue_climb2.png")),
+}
+# Ticks each frame of a character, and of an enemy, is shown for
+ANIMATION_FRAME_TICKS = 6
+ENEMY_FRAME_TICKS = 15
+# Our character, and those of other players in a multiplayer game, taken
+# in turn
+PLAYER_CHARACTER = "player_1"
+OTHER_PLAYER_CHARACTERS = ("player_2", "alien")
+
+# Ticks played that can be rewound, and the file the last checkpoint is
+# saved to
+REWIND_TICKS = 600
+SAVE_FILE = "savegame.bin"
+
+# Multiplayer: the server's UDP port and most players, how often it sends
+# a snapshot, in ticks, and how many ticks of snapshots both ends keep to
+# send changes against. Each input packet repeats the last few inputs, in
+# case some are lost, and the server only queues a few ticks of them.
+SERVER_PORT = 7777
+MAX_PLAYERS = 16
+SNAPSHOT_INTERVAL_TICKS = 2
+SNAPSHOT_HISTORY_TICKS = 64
+INPUT_REDUNDANCY = 8
+INPUT_QUEUE_TICKS = 4
+# Other players are drawn this many ticks in the past, between two snapshots
+INTERPOLATION_TICKS = 6
+# Seconds before a client that has gone quiet is dropped, or a join is sent again
+CLIENT_TIMEOUT = 5.0
+JOIN_RETRY = 0.5
+# Ticks the server waits after a game is won, or everyone is out, before
+# starting over on level 1
+RESTART_TICKS = 180
+
+# Enemies: where their images are, which are named in the map, and how
+# fast each kind goes by default, in pixels per tick. A patrol walks its
+# platform, and flies and saws follow a path. Flies with no path bob up
+# and down this far. Enemies are scaled with the tiles, and swap between
+# their image and its "_move" frame, if it has one.
+ENEMY_IMAGE_DIRECTORY = "images/enemies"
+ENEMY_SPEEDS = {"patrol": 2, "fly": 3, "saw": 4}
+ENEMY_BOB = GRID_PIXEL_SIZE / 2
+# Degrees a saw turns each pixel it moves
+ENEMY_SAW_SPIN = 4
+# Side of the cells enemies are found by, when checking what the player touches
+ENEMY_GRID_CELL = 2 * GRID_PIXEL_SIZE
+# Levels with up to this many enemies check them one at a time, rather than
+# as arrays filed in the spatial hash
+ENEMY_SCALAR_LIMIT = 32
+
+# Telemetry, when it's turned on: the folder session files go in, and how
+# often the writer thread appends what has been queued, in seconds. The
+# aggregator reads this many files or more in a process pool, and draws
+# each tile of a heatmap this many pixels across.
+TELEMETRY_DIRECTORY = "telemetry"
+TELEMETRY_FLUSH_SECONDS = 1.0
+TELEMETRY_POOL_FILES = 32
+HEATMAP_CELL_PIXELS = 8
+
+# Health the player starts the game with
+PLAYER_START_HEALTH = 5
+
+# Falling below this height costs a life
+FALL_LIMIT_Y = -100
+
+TEXTURE_LEFT = 0
+TEXTURE_RIGHT = 1
+
+# Controls the player has. Keys are mapped onto these, and recordings of a
+# game store them.
+CONTROL_JUMP = 0
+CONTROL_LEFT = 1
+CONTROL_RIGHT = 2
+
+# Where the level maps live, and the names of the layers inside them
+LEVEL_DIRECTORY = "levels"
+# Compiled levels are cached in this folder, inside LEVEL_DIRECTORY
+LEVEL_CACHE_DIRECTORY = ".cache"
+PLATFORMS_LAYER_NAME = 'Platforms'
+COINS_LAYER_NAME = 'Coins'
+FOREGROUND_LAYER_NAME = 'Foreground'
+BACKGROUND_LAYER_NAME = 'Background'
+POISONS_LAYER_NAME = 'Poisons'
+DONT_TOUCH_LAYER_NAME = "Don't Touch"
+HEARTS_LAYER_NAME = 'Hearts'
+# Object layer the enemies are placed in
+ENEMIES_LAYER_NAME = 'Enemies'
+
+# Layers the simulation collides with, and those of them whose tiles are
+# picked up
+COLLISION_LAYER_NAMES = (PLATFORMS_LAYER_NAME, COINS_LAYER_NAME, HEARTS_LAYER_NAME,
+                         POISONS_LAYER_NAME, DONT_TOUCH_LAYER_NAME)
+PICKUP_LAYER_NAMES = (COINS_LAYER_NAME, HEARTS_LAYER_NAME, POISONS_LAYER_NAME)
+
+# Levels the level loader keeps once they're loaded. Every new game starts
+# on level 1, so starting over doesn't load anything.
+KEPT_LEVELS = (1,)
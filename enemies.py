@@ -0,0 +1,217 @@
+"""
+The enemies of a level, all moved at once.
+
+An enemy's place depends only on how long its level has been played: a
+patrol walks its platform and back, a fly follows its path there and back,
+and a saw goes round its path, all at a steady speed. So each tick every
+enemy of the level is worked out in a few NumPy operations on arrays of
+their paths, rather than by moving sprites one at a time, and so the
+batched environment can work them out for many games at once the same way.
+
+They are only worked out when something looks at them. Most levels have a
+handful of enemies, too few for NumPy to pay for itself, so finding the ones
+the player touches skips enemies whose whole path is away from the player,
+and works out the rest one at a time in plain Python. Levels with more than
+ENEMY_SCALAR_LIMIT enemies are moved as arrays instead, and filed in a
+spatial hash, so the check only looks at the few near the player.
+"""
+from bisect import bisect_right
+
+import numpy as np
+
+from collision import SpatialHash
+from constants import *
+
+
+def boxes_touch(left, right, bottom, top, enemy_left, enemy_right, enemy_bottom, enemy_top):
+    """ True where boxes overlap. Touching edges don't count, as for tiles. """
+    return ~((right <= enemy_left) | (enemy_right <= left) | (top <= enemy_bottom) | (enemy_top <= bottom))
+
+
+class EnemySet:
+    """ The enemies of one level, as arrays with one entry per enemy. """
+
+    def __init__(self, spawns):
+        """
+        :param spawns: EnemySpawns of the level's map
+        """
+        self.spawns = spawns
+        count = len(spawns)
+
+        # Each path's points, padded out by repeating the last one. Paths
+        # gone round get their first point again at the end.
+        paths = [list(spawn.path) + [spawn.path[0]] if spawn.loop else list(spawn.path) for spawn in spawns]
+        most_points = max((len(path) for path in paths), default=2)
+        self.points = np.zeros((count, most_points, 2))
+        self.segments = np.zeros(count, dtype=np.int64)
+        for index, path in enumerate(paths):
+            self.points[index] = path + [path[-1]] * (most_points - len(path))
+            self.segments[index] = max(len(path) - 1, 1)
+
+        # How far along its path each point is. Past the end is infinitely far.
+        steps = np.hypot(*np.diff(self.points, axis=1).transpose(2, 0, 1))
+        self.distances = np.concatenate((np.zeros((count, 1)), np.cumsum(steps, axis=1)), axis=1)
+        self.length = self.distances[np.arange(count), self.segments] if count else np.zeros(0)
+        self.distances[np.arange(most_points) > self.segments[:, None]] = np.inf
+
+        self.loop = np.array([spawn.loop for spawn in spawns], dtype=bool)
+        self.speed = np.array([spawn.speed for spawn in spawns], dtype=float)
+        self.saw = np.array([spawn.kind == "saw" for spawn in spawns], dtype=bool)
+        box = np.array([spawn.box for spawn in spawns], dtype=float).reshape(count, 4)
+        self.box_left, self.box_right, self.box_bottom, self.box_top = box.T
+        # Furthest any part of an enemy is from its center
+        self.reach = float(np.abs(box).max(initial=0))
+
+        # Which way each enemy faces on each segment of its path, going along
+        # it and coming back. Going straight up or down, it keeps facing the
+        # way it did on the segment before.
+        steps_x = np.diff(self.points[..., 0], axis=1)
+        self.facing_along = np.full((count, most_points), TEXTURE_LEFT)
+        self.facing_back = np.full((count, most_points), TEXTURE_LEFT)
+        for index in range(count):
+            segments = range(self.segments[index])
+            facing = TEXTURE_LEFT
+            # Paths gone round are gone round twice, so the first segments
+            # follow on from the last ones
+            for segment in list(segments) * 2 if self.loop[index] else segments:
+                facing = self._facing(steps_x[index, segment], facing)
+                self.facing_along[index, segment] = facing
+            for segment in reversed(segments):
+                facing = self._facing(-steps_x[index, segment], facing)
+                self.facing_back[index, segment] = facing
+
+        # Everything about each enemy as plain Python numbers, for working
+        # them out one at a time, and the box its whole path covers
+        self.scalars = list(zip(self.points.tolist(), self.distances.tolist(), self.segments.tolist(),
+                                self.length.tolist(), self.loop.tolist(), self.speed.tolist(), box.tolist()))
+        self.path_boxes = list(zip((self.points[..., 0].min(axis=1) + self.box_left).tolist(),
+                                   (self.points[..., 0].max(axis=1) + self.box_right).tolist(),
+                                   (self.points[..., 1].min(axis=1) + self.box_bottom).tolist(),
+                                   (self.points[..., 1].max(axis=1) + self.box_top).tolist()))
+
+        # The tick the enemies are at, and the tick they were last worked out for
+        self.tick = 0
+        self._placed = None
+        self._x = self.points[:, 0, 0].copy()
+        self._y = self.points[:, 0, 1].copy()
+        self._facing = np.full(count, TEXTURE_LEFT)
+        self._angle = np.zeros(count)
+        self.grid = SpatialHash(ENEMY_GRID_CELL)
+
+    def __len__(self):
+        return len(self.spawns)
+
+    def positions(self, ticks):
+        """
+        Where every enemy is some ticks into the level.
+
+        :param ticks: Ticks into the level, or an array of them, one for each game
+        :returns: Arrays of x, y, and the way each faces, TEXTURE_LEFT or
+                  TEXTURE_RIGHT, with a column for each enemy
+        """
+        count = len(self.spawns)
+        travelled = self.speed * np.asarray(ticks, dtype=float)[..., None]
+        length = np.where(self.length > 0, self.length, 1)
+        around = travelled % length
+        there_and_back = travelled % (2 * length)
+        coming_back = ~self.loop & (there_and_back > length)
+        along = np.where(self.loop, around, np.where(coming_back, 2 * length - there_and_back, there_and_back))
+        along = np.where(self.length > 0, along, 0)
+
+        enemies = np.arange(count)
+        segment = np.minimum((self.distances <= along[..., None]).sum(axis=-1) - 1, self.segments - 1)
+        start = self.points[enemies, segment]
+        end = self.points[enemies, segment + 1]
+        start_distance = self.distances[enemies, segment]
+        span = self.distances[enemies, segment + 1] - start_distance
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(span > 0, (along - start_distance) / span, 0)
+        x = start[..., 0] + (end[..., 0] - start[..., 0]) * fraction
+        y = start[..., 1] + (end[..., 1] - start[..., 1]) * fraction
+        facing = np.where(coming_back, self.facing_back[enemies, segment], self.facing_along[enemies, segment])
+        return x, y, facing
+
+    def position(self, index, tick):
+        """ Where one enemy is some ticks into the level, worked out as positions() does. """
+        points, distances, segments, length, loop, speed, box = self.scalars[index]
+        travelled = speed * float(tick)
+        if length <= 0:
+            along = 0.0
+        elif loop:
+            along = travelled % length
+        else:
+            along = travelled % (2 * length)
+            if along > length:
+                along = 2 * length - along
+        segment = min(bisect_right(distances, along) - 1, segments - 1)
+        (start_x, start_y), (end_x, end_y) = points[segment], points[segment + 1]
+        span = distances[segment + 1] - distances[segment]
+        fraction = (along - distances[segment]) / span if span > 0 else 0
+        return start_x + (end_x - start_x) * fraction, start_y + (end_y - start_y) * fraction
+
+    def update(self, tick):
+        """
+        Have every enemy be where it is some ticks into the level. They are
+        worked out when they are next looked at, so this costs nothing.
+        """
+        self.tick = tick
+
+    @property
+    def x(self):
+        return self._place()._x
+
+    @property
+    def y(self):
+        return self._place()._y
+
+    @property
+    def facing(self):
+        return self._place()._facing
+
+    @property
+    def angle(self):
+        return self._place()._angle
+
+    def _place(self):
+        """ Work every enemy out at once, if they have moved since they last were. """
+        if self._placed != self.tick and len(self.spawns):
+            tick = self.tick
+            self._x, self._y, self._facing = self.positions(tick)
+            self._angle = np.where(self.saw, -self.speed * tick * ENEMY_SAW_SPIN % 360, 0)
+            self._placed = tick
+        return self
+
+    @staticmethod
+    def _facing(step_x, facing):
+        """ The way an enemy faces after moving step_x across. """
+        if step_x > 0:
+            return TEXTURE_RIGHT
+        if step_x < 0:
+            return TEXTURE_LEFT
+        return facing
+
+    def touching(self, x, y, left, right, bottom, top, which=slice(None)):
+        """ True where boxes overlap enemies, given where the enemies are. """
+        return boxes_touch(left, right, bottom, top, x + self.box_left[which], x + self.box_right[which],
+                           y + self.box_bottom[which], y + self.box_top[which])
+
+    def hits(self, body):
+        """ Positions of the enemies a body overlaps. """
+        left, right, bottom, top = body.left, body.right, body.bottom, body.top
+        if len(self.spawns) <= ENEMY_SCALAR_LIMIT:
+            hit = []
+            for index, (path_left, path_right, path_bottom, path_top) in enumerate(self.path_boxes):
+                if right <= path_left or path_right <= left or top <= path_bottom or path_top <= bottom:
+                    continue
+                x, y = self.position(index, self.tick)
+                box_left, box_right, box_bottom, box_top = self.scalars[index][-1]
+                if not (right <= x + box_left or x + box_right <= left
+                        or top <= y + box_bottom or y + box_top <= bottom):
+                    hit.append(index)
+            return hit
+        self._place()
+        self.grid.build(self._x, self._y)
+        reach = self.reach
+        near = self.grid.query(left - reach, right + reach, bottom - reach, top + reach)
+        hit = self.touching(self._x[near], self._y[near], left, right, bottom, top, near)
+        return near[hit]
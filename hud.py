@@ -0,0 +1,215 @@
+"""
+Heads up display: score, level and health, drawn over the game in screen
+coordinates, so it stays put however the camera moves.
+
+Text isn't laid out again every frame. Every digit is drawn into a texture
+once, and a number on the HUD is a row of digit sprites, which are only
+swapped when the number changes. The profiler's overlay is a grid of
+character sprites, drawn from a texture for each character it shows.
+"""
+import math
+import string
+
+import arcade
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+
+import textures
+from constants import *
+from renderer import MovingSpriteList
+
+# Characters numbers are made of
+DIGITS = "0123456789-"
+# Characters the profiler's overlay is made of, a space first
+PROFILER_CHARACTERS = " " + string.digits + string.ascii_letters + "_.-"
+
+
+def load_font(size, names=HUD_FONTS):
+    """ The first of some fonts found, or Pillow's own if none are. """
+    for name in names:
+        try:
+            return PIL.ImageFont.truetype(name, size)
+        except OSError:
+            pass
+    return PIL.ImageFont.load_default(size)
+
+
+def text_texture(text, font, color):
+    """
+    Draw some text into a texture. Every texture made with the same font is
+    as tall as the font, with its baseline in the same place, so they line
+    up when put side by side.
+    """
+    ascent, descent = font.getmetrics()
+    image = PIL.Image.new("RGBA", (max(1, math.ceil(font.getlength(text))), ascent + descent))
+    PIL.ImageDraw.Draw(image).text((0, 0), text, font=font, fill=tuple(color))
+    return arcade.Texture(f"hud:{text}:{font.getname()}:{font.size}:{tuple(color)}", image)
+
+
+class NumberField:
+    """ A number on the HUD, left aligned at a point. """
+
+    def __init__(self, hud, left, bottom):
+        self.hud = hud
+        self.left = left
+        self.bottom = bottom
+        self.value = None
+        self.sprites = []
+
+    def set(self, value):
+        """ Show a value. Nothing happens if it is already showing. """
+        if value == self.value:
+            return
+        self.value = value
+
+        for sprite in self.sprites:
+            sprite.remove_from_sprite_lists()
+
+        # Reuse the digit sprites we have, and make more if the number got longer
+        text = str(value)
+        while len(self.sprites) < len(text):
+            self.sprites.append(arcade.Sprite())
+        left = self.left
+        for character, sprite in zip(text, self.sprites):
+            sprite.texture = self.hud.glyphs[character]
+            sprite.left = left
+            sprite.bottom = self.bottom
+            left += sprite.width
+            self.hud.sprite_list.append(sprite)
+
+
+class Hud:
+    """
+    Labels, icons and numbers drawn in screen space, all from one sprite list.
+    """
+
+    def __init__(self, color=HUD_TEXT_COLOR, font_size=HUD_FONT_SIZE, fonts=HUD_FONTS, characters=DIGITS):
+        self.font = load_font(font_size, fonts)
+        self.color = color
+        self.sprite_list = arcade.SpriteList()
+        self.glyphs = {character: text_texture(character, self.font, color) for character in characters}
+
+    def add_label(self, text, left, bottom):
+        """ Fixed text. Returns the x coordinate of its right edge. """
+        sprite = arcade.Sprite()
+        sprite.texture = text_texture(text, self.font, self.color)
+        sprite.left = left
+        sprite.bottom = bottom
+        self.sprite_list.append(sprite)
+        return sprite.right
+
+    def add_icon(self, path, left, bottom, scale=HUD_ICON_SCALING):
+        """ An image, sitting on the same line as the text. Returns the x coordinate of its right edge. """
+        sprite = arcade.Sprite()
+        sprite.texture = textures.load_texture(path, scale=scale)
+        sprite.left = left
+        sprite.center_y = bottom + sum(self.font.getmetrics()) / 2
+        self.sprite_list.append(sprite)
+        return sprite.right
+
+    def add_number(self, left, bottom):
+        """ A number that can change. """
+        return NumberField(self, left, bottom)
+
+    def draw(self):
+        """ Draw over whatever is on screen, ignoring where the camera is. """
+        viewport = arcade.get_viewport()
+        arcade.set_viewport(0, SCREEN_WIDTH, 0, SCREEN_HEIGHT)
+        self.sprite_list.draw()
+        arcade.set_viewport(*viewport)
+
+
+class GameHud(Hud):
+    """ The HUD shown while playing: coins scored, the level and health left. """
+
+    def __init__(self):
+        super().__init__()
+        left = self.add_icon(HUD_COIN_ICON, HUD_MARGIN, HUD_MARGIN)
+        self.score = self.add_number(left + HUD_SPACING, HUD_MARGIN)
+        left = self.add_label("Level", 150, HUD_MARGIN)
+        self.level = self.add_number(left + HUD_SPACING, HUD_MARGIN)
+        left = self.add_icon(HUD_HEART_ICON, 310, HUD_MARGIN)
+        self.health = self.add_number(left + HUD_SPACING, HUD_MARGIN)
+
+    def update(self, simulation):
+        """ Show the simulation's score, level and health. """
+        self.score.set(simulation.score)
+        self.level.set(simulation.level)
+        self.health.set(simulation.health)
+
+
+class ProfilerHud(Hud):
+    """
+    The profiler's overlay: the p50 and p99 time of each part of a frame,
+    and a graph of the time between frames, in the top right corner.
+
+    The text is a grid of sprites, a character to each, which all show
+    their new character in one move of a MovingSpriteList, so the list's
+    buffer is only built once each time the numbers change.
+    """
+
+    COLUMNS = 31
+
+    def __init__(self):
+        super().__init__(PROFILER_TEXT_COLOR, PROFILER_FONT_SIZE, PROFILER_FONTS, PROFILER_CHARACTERS)
+        self.textures = [self.glyphs[character] for character in PROFILER_CHARACTERS]
+        self.advance = max(texture.width for texture in self.textures)
+        self.left = SCREEN_WIDTH - 300
+        self.top = SCREEN_HEIGHT - 20
+        self.sprite_list = MovingSpriteList()
+        self.x = self.y = None
+        # Where the graph goes, under the text
+        self.bottom = self.top - 100
+        self.intervals = []
+
+    def update(self, profiler):
+        """
+        Show the profiler's numbers. They are only worked out again every
+        few frames, so the overlay doesn't cost much itself.
+        """
+        self.intervals = profiler.frames()[-280:, -1]
+        if profiler.count % PROFILER_OVERLAY_REFRESH != 0 and self.x is not None:
+            return
+
+        lines = [f"{'ms':<16}{'p50':>7}{'p99':>8}"]
+        lines += [f"{name:<16}{p50 * 1000:7.3f}{p99 * 1000:8.3f}" for name, p50, p99 in profiler.percentiles()]
+        if self.x is None or len(self.x) != len(lines) * self.COLUMNS:
+            self._make_grid(len(lines))
+
+        # Anything the overlay has no glyph for is left blank
+        text = "".join(line[:self.COLUMNS].ljust(self.COLUMNS) for line in lines)
+        characters = np.array([max(PROFILER_CHARACTERS.find(character), 0) for character in text])
+        self.sprite_list.move(self.x, self.y, characters, np.zeros(len(characters)))
+
+    def _make_grid(self, rows):
+        """ A sprite for each character of some lines of text, a line below the top one. """
+        self.sprite_list = MovingSpriteList()
+        for _ in range(rows * self.COLUMNS):
+            sprite = arcade.Sprite()
+            sprite.textures = self.textures
+            sprite.set_texture(0)
+            self.sprite_list.append(sprite)
+        row, column = np.divmod(np.arange(rows * self.COLUMNS), self.COLUMNS)
+        self.x = self.left + (column + 0.5) * self.advance
+        self.y = self.top - (row + 1) * PROFILER_LINE_HEIGHT + self.textures[0].height / 2
+        self.bottom = self.top - rows * PROFILER_LINE_HEIGHT - 110
+
+    def draw(self):
+        """ Draw over whatever is on screen, ignoring where the camera is. """
+        viewport = arcade.get_viewport()
+        arcade.set_viewport(0, SCREEN_WIDTH, 0, SCREEN_HEIGHT)
+        left = self.left
+        bottom = self.bottom
+        arcade.draw_lrtb_rectangle_filled(left - 10, left + 290, self.top + 10, bottom - 10, (0, 0, 0, 160))
+        self.sprite_list.draw()
+
+        # Time between frames, a pixel across per frame and two pixels up
+        # per millisecond, with a line where 60 frames a second would be
+        arcade.draw_line(left, bottom + 2000 / 60, left + 280, bottom + 2000 / 60, arcade.color.GREEN)
+        if len(self.intervals) > 1:
+            points = [(left + index, bottom + min(interval * 2000, 100))
+                      for index, interval in enumerate(self.intervals)]
+            arcade.draw_line_strip(points, arcade.color.YELLOW)
+        arcade.set_viewport(*viewport)
@@ -0,0 +1,430 @@
+"""
+Compiled level cache, and a loader that prepares the next level in the
+background.
+
+Parsing a .tmx file means XML, the whole tile set and several compressed
+layers. The first time a level is read it is compiled into a small binary
+file next to the maps; later loads read that instead, until the .tmx
+changes.
+
+Levels that are streamed are compiled into a different file, cut into
+square chunks that can each be read on their own.
+"""
+import io
+import os
+import struct
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from collision import TileIndex
+from constants import *
+from tilemap import EnemySpawn, TiledMap, Tile, layer_shapes, read_map, read_map_blocks
+
+CACHE_MAGIC = b"FANL"
+CACHE_VERSION = 2
+
+STREAM_MAGIC = b"FANS"
+STREAM_VERSION = 2
+
+# magic, version, .tmx modification time, .tmx size, scaling
+_HEADER = struct.Struct("<4sHqqd")
+
+# Where each chunk of a streamed map is in its file: offset and length,
+# with a length of 0 for a chunk with no tiles
+_CHUNK_ENTRY = struct.Struct("<QI")
+
+# A level's map, a TileIndex of each layer in COLLISION_LAYER_NAMES, and
+# whatever the loader's prepare made from the map
+PreparedLevel = namedtuple("PreparedLevel", ["level", "map", "indexes", "sprites"])
+
+
+def map_file(level):
+    """ Path of the .tmx file for a level. """
+    return os.path.join(LEVEL_DIRECTORY, f"MapLevel{level}.tmx")
+
+
+def cache_file(tmx_file, extension=".bin"):
+    """ Path of the compiled cache for a .tmx file. """
+    name = os.path.splitext(os.path.basename(tmx_file))[0] + extension
+    return os.path.join(os.path.dirname(tmx_file), LEVEL_CACHE_DIRECTORY, name)
+
+
+def _write_string(out, text):
+    data = text.encode("utf-8")
+    out.write(struct.pack("<H", len(data)))
+    out.write(data)
+
+
+def _read_string(data, offset):
+    length, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _write_tile_set(out, tile_set):
+    out.write(struct.pack("<H", len(tile_set)))
+    for key, tile in tile_set.items():
+        out.write(struct.pack("<IHH", int(key), tile.width, tile.height))
+        _write_string(out, tile.source)
+        points = tile.points or ()
+        out.write(struct.pack("<B", tile.points is not None))
+        out.write(struct.pack("<H", len(points)))
+        for x, y in points:
+            out.write(struct.pack("<hh", x, y))
+
+
+def _read_tile_set(data, offset, tile_set):
+    tile_count, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    for _ in range(tile_count):
+        gid, width, height = struct.unpack_from("<IHH", data, offset)
+        source, offset = _read_string(data, offset + 8)
+        has_points, point_count = struct.unpack_from("<BH", data, offset)
+        offset += 3
+        values = struct.unpack_from(f"<{point_count * 2}h", data, offset)
+        offset += point_count * 4
+        points = list(zip(values[0::2], values[1::2])) if has_points else None
+        tile_set[str(gid)] = Tile(source, width, height, points)
+    return offset
+
+
+def _write_enemies(out, enemies):
+    out.write(struct.pack("<H", len(enemies)))
+    for enemy in enemies:
+        _write_string(out, enemy.kind)
+        _write_string(out, enemy.image)
+        out.write(struct.pack("<4dBdH", *enemy.box, enemy.loop, enemy.speed, len(enemy.path)))
+        for x, y in enemy.path:
+            out.write(struct.pack("<dd", x, y))
+
+
+def _read_enemies(data, offset):
+    enemies = []
+    enemy_count, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    for _ in range(enemy_count):
+        kind, offset = _read_string(data, offset)
+        image, offset = _read_string(data, offset)
+        left, right, bottom, top, loop, speed, point_count = struct.unpack_from("<4dBdH", data, offset)
+        offset += struct.calcsize("<4dBdH")
+        values = struct.unpack_from(f"<{point_count * 2}d", data, offset)
+        offset += point_count * 16
+        enemies.append(EnemySpawn(kind, image, (left, right, bottom, top),
+                                  tuple(zip(values[0::2], values[1::2])), bool(loop), speed))
+    return enemies, offset
+
+
+def compile_map(my_map):
+    """
+    Pack a map into bytes. Layers are stored sparsely, as the cell index
+    and tile id of every placed tile, which is also where its sprite goes.
+    """
+    out = io.BytesIO()
+    out.write(struct.pack("<HHHH", my_map.width, my_map.height, my_map.tilewidth, my_map.tileheight))
+    out.write(struct.pack("<B3B", my_map.backgroundcolor is not None, *(my_map.backgroundcolor or (0, 0, 0))))
+    _write_tile_set(out, my_map.global_tile_set)
+
+    out.write(struct.pack("<H", len(my_map.layers_int_data)))
+    for name, grid in my_map.layers_int_data.items():
+        _write_string(out, name)
+        width = len(grid[0]) if grid else 0
+        placed = [(row_index * width + column_index, item)
+                  for row_index, row in enumerate(grid)
+                  for column_index, item in enumerate(row) if item]
+        out.write(struct.pack("<HHI", width, len(grid), len(placed)))
+        out.write(struct.pack(f"<{len(placed)}I", *(index for index, item in placed)))
+        out.write(struct.pack(f"<{len(placed)}I", *(item for index, item in placed)))
+
+    _write_enemies(out, my_map.enemies)
+    return zlib.compress(out.getvalue())
+
+
+def decompile_map(blob):
+    """ Rebuild a map from the bytes made by compile_map. """
+    data = zlib.decompress(blob)
+    my_map = TiledMap()
+    my_map.width, my_map.height, my_map.tilewidth, my_map.tileheight = struct.unpack_from("<HHHH", data, 0)
+    has_color, red, green, blue = struct.unpack_from("<B3B", data, 8)
+    if has_color:
+        my_map.backgroundcolor = (red, green, blue)
+    offset = _read_tile_set(data, 12, my_map.global_tile_set)
+
+    layer_count, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    for _ in range(layer_count):
+        name, offset = _read_string(data, offset)
+        width, height, count = struct.unpack_from("<HHI", data, offset)
+        offset += 8
+        indices = struct.unpack_from(f"<{count}I", data, offset)
+        offset += count * 4
+        items = struct.unpack_from(f"<{count}I", data, offset)
+        offset += count * 4
+
+        cells = [0] * (width * height)
+        for index, item in zip(indices, items):
+            cells[index] = item
+        my_map.layers_int_data[name] = [cells[start:start + width] for start in range(0, len(cells), width)]
+
+    my_map.enemies, offset = _read_enemies(data, offset)
+    return my_map
+
+
+def load_map(tmx_file, scaling):
+    """
+    Read a map, from its compiled cache if that is still current. The cache
+    is rebuilt whenever the .tmx file's modification time or size changes.
+    """
+    stat = os.stat(tmx_file)
+    compiled = cache_file(tmx_file)
+
+    try:
+        with open(compiled, "rb") as cache:
+            header = cache.read(_HEADER.size)
+            magic, version, mtime, size, cached_scaling = _HEADER.unpack(header)
+            if (magic, version, mtime, size, cached_scaling) == \
+                    (CACHE_MAGIC, CACHE_VERSION, stat.st_mtime_ns, stat.st_size, scaling):
+                return decompile_map(cache.read())
+    except (OSError, struct.error, zlib.error):
+        pass
+
+    my_map = read_map(tmx_file, scaling)
+
+    # A stale or missing cache is rebuilt. Failing to write it (read-only
+    # checkout, for example) only costs us the speed up.
+    try:
+        os.makedirs(os.path.dirname(compiled), exist_ok=True)
+        temporary = compiled + f".{os.getpid()}.tmp"
+        with open(temporary, "wb") as cache:
+            cache.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, stat.st_mtime_ns, stat.st_size, scaling))
+            cache.write(compile_map(my_map))
+        os.replace(temporary, compiled)
+    except OSError:
+        pass
+
+    return my_map
+
+
+def compile_stream(my_map, blocks, out, chunk_tiles=STREAM_CHUNK_TILES):
+    """
+    Write a map to a file cut into chunks of chunk_tiles by chunk_tiles
+    cells. After a description of the map comes a table with an entry for
+    every chunk, in rows, and then each chunk's tiles, compressed on their
+    own, so any one chunk can be read with two seeks.
+
+    :param my_map: Map, without its layers
+    :param dict blocks: Blocks of each layer, from ``read_map_blocks``
+    :param out: File open for writing, positioned after the header
+    """
+    # File each tile under its chunk, as its cell inside the chunk
+    chunks = {}
+    last_column = my_map.width - 1 if not my_map.infinite else None
+    layer_names = list(blocks)
+    for layer_index, name in enumerate(layer_names):
+        for first_column, first_row, width, height, values in blocks[name]:
+            for index, item in enumerate(values):
+                if not item:
+                    continue
+                column = first_column + index % width
+                row = first_row + index // width
+                key = (column // chunk_tiles, row // chunk_tiles)
+                cell = row % chunk_tiles * chunk_tiles + column % chunk_tiles
+                chunks.setdefault(key, {}).setdefault(layer_index, []).append((cell, item))
+                if my_map.infinite and (last_column is None or column > last_column):
+                    last_column = column
+
+    if chunks:
+        first_x = min(key[0] for key in chunks)
+        first_y = min(key[1] for key in chunks)
+        chunks_x = max(key[0] for key in chunks) - first_x + 1
+        chunks_y = max(key[1] for key in chunks) - first_y + 1
+    else:
+        first_x = first_y = chunks_x = chunks_y = 0
+
+    description = io.BytesIO()
+    description.write(struct.pack("<IIHH", my_map.width, my_map.height, my_map.tilewidth, my_map.tileheight))
+    description.write(struct.pack("<B3B", my_map.backgroundcolor is not None,
+                                  *(my_map.backgroundcolor or (0, 0, 0))))
+    description.write(struct.pack("<BHiiIIi", my_map.infinite, chunk_tiles, first_x, first_y,
+                                  chunks_x, chunks_y, last_column or 0))
+    _write_tile_set(description, my_map.global_tile_set)
+    description.write(struct.pack("<H", len(layer_names)))
+    for name in layer_names:
+        _write_string(description, name)
+    # Enemies aren't cut into chunks, since they move between them
+    _write_enemies(description, my_map.enemies)
+    description = zlib.compress(description.getvalue())
+    out.write(struct.pack("<I", len(description)))
+    out.write(description)
+
+    # The table is filled in once we know where each chunk ended up
+    table_offset = out.tell()
+    table = [(0, 0)] * (chunks_x * chunks_y)
+    out.seek(table_offset + _CHUNK_ENTRY.size * len(table))
+    for (chunk_x, chunk_y), layers in sorted(chunks.items(), key=lambda item: (item[0][1], item[0][0])):
+        data = io.BytesIO()
+        data.write(struct.pack("<H", len(layers)))
+        for layer_index, placed in layers.items():
+            data.write(struct.pack("<HH", layer_index, len(placed)))
+            data.write(struct.pack(f"<{len(placed)}H", *(cell for cell, item in placed)))
+            data.write(struct.pack(f"<{len(placed)}I", *(item for cell, item in placed)))
+        data = zlib.compress(data.getvalue())
+        table[(chunk_y - first_y) * chunks_x + chunk_x - first_x] = (out.tell(), len(data))
+        out.write(data)
+
+    out.seek(table_offset)
+    for entry in table:
+        out.write(_CHUNK_ENTRY.pack(*entry))
+
+
+class StreamedMap(TiledMap):
+    """
+    A map read from a compiled stream file a chunk at a time. It has the
+    attributes of a TiledMap, except that no layers are held in memory;
+    ``read_chunk`` reads the tiles of one chunk.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.file = open(path, "rb")
+        self.file.seek(_HEADER.size)
+        length, = struct.unpack("<I", self.file.read(4))
+        data = zlib.decompress(self.file.read(length))
+        self.table_offset = _HEADER.size + 4 + length
+
+        self.width, self.height, self.tilewidth, self.tileheight = struct.unpack_from("<IIHH", data, 0)
+        has_color, red, green, blue = struct.unpack_from("<B3B", data, 12)
+        if has_color:
+            self.backgroundcolor = (red, green, blue)
+        (infinite, self.chunk_tiles, self.first_chunk_x, self.first_chunk_y,
+         self.chunks_x, self.chunks_y, self.last_column) = struct.unpack_from("<BHiiIIi", data, 16)
+        self.infinite = bool(infinite)
+        offset = _read_tile_set(data, 39, self.global_tile_set)
+
+        layer_count, = struct.unpack_from("<H", data, offset)
+        offset += 2
+        self.layer_names = []
+        for _ in range(layer_count):
+            name, offset = _read_string(data, offset)
+            self.layer_names.append(name)
+        self.enemies, offset = _read_enemies(data, offset)
+
+    def read_chunk(self, chunk_x, chunk_y):
+        """
+        The tiles in one chunk, as a dictionary from layer name to a list of
+        (row, column, tile id). Chunks outside the map are empty.
+        """
+        column = chunk_x - self.first_chunk_x
+        row = chunk_y - self.first_chunk_y
+        if not (0 <= column < self.chunks_x and 0 <= row < self.chunks_y):
+            return {}
+        self.file.seek(self.table_offset + (row * self.chunks_x + column) * _CHUNK_ENTRY.size)
+        offset, length = _CHUNK_ENTRY.unpack(self.file.read(_CHUNK_ENTRY.size))
+        if length == 0:
+            return {}
+
+        self.file.seek(offset)
+        data = zlib.decompress(self.file.read(length))
+        size = self.chunk_tiles
+        first_column = chunk_x * size
+        first_row = chunk_y * size
+        layers = {}
+        layer_count, = struct.unpack_from("<H", data, 0)
+        offset = 2
+        for _ in range(layer_count):
+            layer_index, count = struct.unpack_from("<HH", data, offset)
+            offset += 4
+            cells = struct.unpack_from(f"<{count}H", data, offset)
+            offset += count * 2
+            items = struct.unpack_from(f"<{count}I", data, offset)
+            offset += count * 4
+            layers[self.layer_names[layer_index]] = [(first_row + cell // size, first_column + cell % size, item)
+                                                     for cell, item in zip(cells, items)]
+        return layers
+
+    def close(self):
+        self.file.close()
+
+
+def open_stream(tmx_file, scaling):
+    """
+    Open a map for streaming, compiling it first if its stream file is
+    missing or older than the .tmx file. Opening only reads the map's
+    description, however big the map is.
+    """
+    stat = os.stat(tmx_file)
+    compiled = cache_file(tmx_file, ".chunks")
+
+    try:
+        with open(compiled, "rb") as stream:
+            magic, version, mtime, size, cached_scaling = _HEADER.unpack(stream.read(_HEADER.size))
+        if (magic, version, mtime, size, cached_scaling) == \
+                (STREAM_MAGIC, STREAM_VERSION, stat.st_mtime_ns, stat.st_size, scaling):
+            return StreamedMap(compiled)
+    except (OSError, struct.error):
+        pass
+
+    # Unlike the level cache, a stream file has to be written to be played
+    my_map, blocks = read_map_blocks(tmx_file, scaling)
+    os.makedirs(os.path.dirname(compiled), exist_ok=True)
+    temporary = compiled + f".{os.getpid()}.tmp"
+    with open(temporary, "wb") as stream:
+        stream.write(_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, stat.st_mtime_ns, stat.st_size, scaling))
+        compile_stream(my_map, blocks, stream)
+    os.replace(temporary, compiled)
+    return StreamedMap(compiled)
+
+
+class LevelLoader:
+    """
+    Hands out levels, and can get the next one ready on a worker thread
+    while the current one is being played.
+
+    ``prepare`` is called with the map on the worker thread, and whatever it
+    returns is handed back as the level's ``sprites``. Levels are given out
+    once, except for those in ``keep``, which are held on to once loaded and
+    given out again each time they're asked for. Whoever plays a level again
+    puts back its picked up tiles first.
+
+    With ``background`` off, nothing is loaded ahead of time, so that
+    timing a level isn't disturbed by the next one loading.
+    """
+
+    def __init__(self, prepare=None, scaling=TILE_SCALING, background=True, keep=KEPT_LEVELS):
+        self.prepare = prepare
+        self.scaling = scaling
+        self.background = background
+        self.keep = keep
+        self.pending = {}
+        self.kept = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-loader")
+
+    def _load(self, level):
+        my_map = load_map(map_file(level), self.scaling)
+        tile_width = my_map.tilewidth * self.scaling
+        tile_height = my_map.tileheight * self.scaling
+        indexes = {name: TileIndex(layer_shapes(my_map, name, self.scaling), tile_width, tile_height, my_map.height)
+                   for name in COLLISION_LAYER_NAMES}
+        sprites = self.prepare(my_map) if self.prepare is not None else None
+        return PreparedLevel(level, my_map, indexes, sprites)
+
+    def prefetch(self, level):
+        """ Start getting a level ready in the background. Returns its future, if it is loading. """
+        if self.background and level not in self.pending and level not in self.kept:
+            self.pending[level] = self.executor.submit(self._load, level)
+        return self.pending.get(level)
+
+    def get(self, level):
+        """ A ready level, waiting for or doing the loading if needed. """
+        prepared = self.kept.get(level)
+        if prepared is not None:
+            return prepared
+        future = self.pending.pop(level, None)
+        prepared = self._load(level) if future is None else future.result()
+        if level in self.keep:
+            self.kept[level] = prepared
+        return prepared
+
+    def keeps(self, prepared):
+        """ True if a level is held on to, to be given out again. """
+        return self.kept.get(prepared.level) is prepared
@@ -0,0 +1,694 @@
+"""
+Multiplayer over UDP: an authoritative server that plays the game for
+every player, and clients that predict their own player and draw the
+others a little in the past.
+
+The server runs on asyncio at the game's fixed tick rate. Each player is a
+Simulation of their own, with the same rules as a single player game, but
+they all play the same copy of the level, so a coin one of them picks up
+is gone for everyone. Reaching the end of a level takes everyone to the
+next one. Each player's Simulation moves one tick for each input the
+client sends, so a client playing its inputs ahead of the server ends up
+exactly where the server does.
+
+Snapshots are sent as changes from the last snapshot the client said it
+got: only the fields of each player that changed, and the pick-ups taken
+or put back since. A player standing still costs nothing.
+
+    python multiplayer.py server
+    python multiplayer.py bots --players 4
+    python multiplayer.py bench --players 1 2 4 8 16
+
+``bench`` starts a server in a process of its own, connects bots to it
+over localhost, and reports the server's CPU time per tick and the bytes
+per snapshot for each player count.
+"""
+import argparse
+import asyncio
+import json
+import random
+import struct
+import subprocess
+import sys
+import time
+from collections import deque, namedtuple
+
+from constants import *
+from level_cache import LevelLoader
+from simulation import Simulation
+
+PROTOCOL_VERSION = 2
+
+# Kinds of message
+JOIN = 1
+WELCOME = 2
+FULL = 3
+INPUT = 4
+SNAPSHOT = 5
+LEAVE = 6
+
+# kind, protocol version
+_JOIN = struct.Struct("<BH")
+# kind, player id
+_WELCOME = struct.Struct("<BB")
+# kind, newest input's sequence number, newest snapshot tick the client
+# has, number of inputs, then that many held control bitmasks, oldest first
+_INPUT = struct.Struct("<BIIB")
+# kind, tick, tick of the snapshot it's the changes from (0 for none),
+# sequence number of the client's last input played, level
+_SNAPSHOT = struct.Struct("<BIIIH")
+# players changed, players gone
+_COUNTS = struct.Struct("<BB")
+# player id, bitmask of the fields that follow
+_PLAYER = struct.Struct("<BB")
+# pick-ups of one layer taken or put back
+_PICKUP_COUNT = struct.Struct("<H")
+
+# What's sent about each player, and how each field is packed. Positions
+# and speeds are sent exactly, so a client's prediction lands where the
+# server's player is.
+PLAYER_FIELDS = ("x", "y", "change_x", "change_y", "score", "health", "state", "level_tick")
+_FIELD_STRUCTS = tuple(struct.Struct(code) for code in ("<d", "<d", "<d", "<d", "<i", "<i", "<B", "<I"))
+
+# The game at one tick: its level, each player's fields by player id, and a
+# bitmask of the pick-ups taken in each layer of PICKUP_LAYER_NAMES
+WorldState = namedtuple("WorldState", ["tick", "level", "players", "taken"])
+
+
+def player_record(simulation):
+    """ The fields of PLAYER_FIELDS for one player's simulation. """
+    player = simulation.player
+    return (player.center_x, player.center_y, player.change_x, player.change_y,
+            simulation.score, simulation.health, simulation.current_state, simulation.level_tick)
+
+
+def pickup_indexes(simulation):
+    return [simulation.coin_list, simulation.hearts_list, simulation.poisons_list]
+
+
+def encode_changes(state, baseline):
+    """
+    A state, as the changes from an earlier one. With no baseline, or one
+    on another level, everything is sent.
+    """
+    if baseline is not None and baseline.level != state.level:
+        baseline = None
+    old_players = baseline.players if baseline is not None else {}
+    old_taken = baseline.taken if baseline is not None else (0,) * len(state.taken)
+
+    changed = []
+    for player_id, record in state.players.items():
+        old = old_players.get(player_id)
+        mask = 0
+        for field, value in enumerate(record):
+            if old is None or old[field] != value:
+                mask |= 1 << field
+        if mask:
+            changed.append((player_id, mask, record))
+    gone = [player_id for player_id in old_players if player_id not in state.players]
+
+    out = bytearray(_COUNTS.pack(len(changed), len(gone)))
+    for player_id, mask, record in changed:
+        out += _PLAYER.pack(player_id, mask)
+        for field, packer in enumerate(_FIELD_STRUCTS):
+            if mask >> field & 1:
+                out += packer.pack(record[field])
+    out += bytes(gone)
+    for taken, old in zip(state.taken, old_taken):
+        flipped = taken ^ old
+        positions = []
+        while flipped:
+            bit = flipped & -flipped
+            positions.append(bit.bit_length() - 1)
+            flipped ^= bit
+        out += _PICKUP_COUNT.pack(len(positions))
+        out += struct.pack(f"<{len(positions)}H", *positions)
+    return bytes(out)
+
+
+def decode_changes(data, offset, tick, level, baseline):
+    """ The state that encode_changes() made data from, given the same baseline. """
+    if baseline is not None and baseline.level != level:
+        baseline = None
+    players = dict(baseline.players) if baseline is not None else {}
+    taken = list(baseline.taken) if baseline is not None else [0] * len(PICKUP_LAYER_NAMES)
+
+    changed, gone = _COUNTS.unpack_from(data, offset)
+    offset += _COUNTS.size
+    for _ in range(changed):
+        player_id, mask = _PLAYER.unpack_from(data, offset)
+        offset += _PLAYER.size
+        record = list(players.get(player_id, (0,) * len(PLAYER_FIELDS)))
+        for field, packer in enumerate(_FIELD_STRUCTS):
+            if mask >> field & 1:
+                record[field], = packer.unpack_from(data, offset)
+                offset += packer.size
+        players[player_id] = tuple(record)
+    for player_id in data[offset:offset + gone]:
+        players.pop(player_id, None)
+    offset += gone
+    for layer in range(len(taken)):
+        count, = _PICKUP_COUNT.unpack_from(data, offset)
+        offset += _PICKUP_COUNT.size
+        for position in struct.unpack_from(f"<{count}H", data, offset):
+            taken[layer] ^= 1 << position
+        offset += count * 2
+    return WorldState(tick, level, players, tuple(taken))
+
+
+class World:
+    """
+    The game every player is in: a Simulation for each, all playing the
+    same copy of the current level.
+    """
+
+    def __init__(self, loader=None):
+        # Every level is kept once loaded, so each player is handed the
+        # same one, tile indexes and all
+        self.loader = loader if loader is not None else LevelLoader(keep=range(1, MAX_LEVEL + 1))
+        self.players = {}
+        self.level = 1
+        self.tick = 0
+        # Tick to start over on, once the game is won or everyone is out
+        self.restart_tick = None
+
+    def pickups(self):
+        """ Tile indexes of the current level's pick-ups, shared by every player. """
+        indexes = self.loader.get(self.level).indexes
+        return [indexes[name] for name in PICKUP_LAYER_NAMES]
+
+    def add_player(self, player_id):
+        """ Put a new player at the start of the current level. """
+        simulation = Simulation(self.loader)
+        self.enter(simulation, self.level)
+        self.players[player_id] = simulation
+
+    def remove_player(self, player_id):
+        self.players.pop(player_id, None)
+
+    def enter(self, simulation, level):
+        """ Set a player up on a level, leaving taken pick-ups taken. """
+        taken = [index.taken for index in self.pickups()] if level == self.level else None
+        simulation.setup(level)
+        if taken is not None:
+            for index, bits in zip(pickup_indexes(simulation), taken):
+                index.take(bits)
+        simulation.current_state = GAME_RUNNING
+
+    def play(self, player_id, controls):
+        """ Move one player a tick, with the controls they held. """
+        simulation = self.players[player_id]
+        simulation.hold(controls)
+        simulation.update()
+
+    def step(self):
+        """
+        End a tick: take everyone on once someone reaches the end of the
+        level, and start over once the game is won or everyone is out.
+        """
+        self.tick += 1
+        players = list(self.players.values())
+        if self.restart_tick is not None:
+            if self.tick >= self.restart_tick:
+                self.restart_tick = None
+                self.level = 1
+                for simulation in players:
+                    simulation.setup(1)
+                    simulation.current_state = GAME_RUNNING
+            return
+
+        if any(simulation.current_state == YOU_WON for simulation in players):
+            for simulation in players:
+                simulation.current_state = YOU_WON
+            self.restart_tick = self.tick + RESTART_TICKS
+            return
+
+        level = max((simulation.level for simulation in players), default=self.level)
+        if level != self.level:
+            # Players who were out come back for the new level
+            self.level = level
+            for simulation in players:
+                if simulation.level != level or simulation.current_state != GAME_RUNNING:
+                    if simulation.health < 0:
+                        simulation.health = PLAYER_START_HEALTH
+                    self.enter(simulation, level)
+        elif players and all(simulation.current_state == YOU_LOST for simulation in players):
+            self.restart_tick = self.tick + RESTART_TICKS
+
+    def state(self):
+        return WorldState(self.tick, self.level,
+                          {player_id: player_record(simulation) for player_id, simulation in self.players.items()},
+                          tuple(index.taken for index in self.pickups()))
+
+
+class Connection:
+    """ What the server knows about one client. """
+
+    def __init__(self, player_id, heard):
+        self.player_id = player_id
+        # Inputs not played yet, as (sequence number, controls)
+        self.inputs = deque()
+        self.newest = 0
+        # Last input played, and the newest snapshot the client has
+        self.played = 0
+        self.acked = 0
+        self.heard = heard
+
+
+class NetStats:
+    """ The server's CPU time for each tick, and the size of each snapshot it sent. """
+
+    def __init__(self):
+        self.tick_seconds = []
+        self.snapshot_bytes = []
+        self.players = 0
+
+    def report(self):
+        """ Averages and 99th percentiles, as a dictionary. """
+        def percentile(values, fraction):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0
+
+        ticks = self.tick_seconds
+        sizes = self.snapshot_bytes
+        return {
+            "players": self.players,
+            "ticks": len(ticks),
+            "tick_us_mean": sum(ticks) / max(len(ticks), 1) * 1e6,
+            "tick_us_p99": percentile(ticks, 0.99) * 1e6,
+            "snapshots": len(sizes),
+            "snapshot_bytes_mean": sum(sizes) / max(len(sizes), 1),
+            "snapshot_bytes_p99": percentile(sizes, 0.99),
+            "snapshot_bytes_max": max(sizes, default=0),
+        }
+
+
+class GameServer(asyncio.DatagramProtocol):
+    """
+    Runs the world at the fixed tick rate, playing each client's inputs as
+    they come in and sending every client snapshots.
+    """
+
+    def __init__(self, world=None, max_players=MAX_PLAYERS, snapshot_interval=SNAPSHOT_INTERVAL_TICKS):
+        self.world = world if world is not None else World()
+        self.max_players = max_players
+        self.snapshot_interval = snapshot_interval
+        self.connections = {}
+        # Snapshots sent recently, by tick, to send changes against
+        self.history = {}
+        self.stats = NetStats()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if not data:
+            return
+        kind = data[0]
+        connection = self.connections.get(address)
+        try:
+            if kind == JOIN:
+                self.join(data, address)
+            elif kind == INPUT and connection is not None:
+                self.receive_inputs(connection, data)
+            elif kind == LEAVE and connection is not None:
+                self.drop(address)
+        except struct.error:
+            # Not one of ours, or cut short
+            pass
+
+    def join(self, data, address):
+        _, version = _JOIN.unpack_from(data)
+        if version != PROTOCOL_VERSION:
+            return
+        connection = self.connections.get(address)
+        if connection is None:
+            taken = {connection.player_id for connection in self.connections.values()}
+            free = [player_id for player_id in range(1, self.max_players + 1) if player_id not in taken]
+            if not free:
+                self.transport.sendto(bytes([FULL]), address)
+                return
+            connection = Connection(free[0], time.monotonic())
+            self.connections[address] = connection
+            self.world.add_player(connection.player_id)
+        # Sent again if the client joins again, in case the first was lost
+        self.transport.sendto(_WELCOME.pack(WELCOME, connection.player_id), address)
+
+    def receive_inputs(self, connection, data):
+        _, newest, acked, count = _INPUT.unpack_from(data)
+        connection.heard = time.monotonic()
+        connection.acked = max(connection.acked, acked)
+        first = newest - count + 1
+        for offset, controls in enumerate(data[_INPUT.size:_INPUT.size + count]):
+            sequence = first + offset
+            if sequence > connection.newest:
+                connection.inputs.append((sequence, controls))
+        connection.newest = max(connection.newest, newest)
+
+    def drop(self, address):
+        connection = self.connections.pop(address)
+        self.world.remove_player(connection.player_id)
+
+    def tick(self):
+        """ Play one tick, and send snapshots if one is due. """
+        start = time.process_time()
+        world = self.world
+        for connection in self.connections.values():
+            # One input a tick, or more to catch up if they've piled up
+            inputs = connection.inputs
+            while inputs:
+                sequence, controls = inputs.popleft()
+                world.play(connection.player_id, controls)
+                connection.played = sequence
+                if len(inputs) <= INPUT_QUEUE_TICKS:
+                    break
+        world.step()
+
+        if world.tick % self.snapshot_interval == 0:
+            self.send_snapshots()
+
+        now = time.monotonic()
+        for address in [address for address, connection in self.connections.items()
+                        if now - connection.heard > CLIENT_TIMEOUT]:
+            self.drop(address)
+        self.stats.tick_seconds.append(time.process_time() - start)
+        self.stats.players = max(self.stats.players, len(self.connections))
+
+    def send_snapshots(self):
+        state = self.world.state()
+        self.history[state.tick] = state
+        for old in [old for old in self.history if old <= state.tick - SNAPSHOT_HISTORY_TICKS]:
+            del self.history[old]
+
+        # Most clients have the same snapshot, so each set of changes is
+        # only worked out once a tick
+        changes = {}
+        for address, connection in self.connections.items():
+            baseline = self.history.get(connection.acked)
+            since = connection.acked if baseline is not None else 0
+            if since not in changes:
+                changes[since] = encode_changes(state, baseline)
+            packet = _SNAPSHOT.pack(SNAPSHOT, state.tick, since, connection.played, state.level) + changes[since]
+            self.transport.sendto(packet, address)
+            self.stats.snapshot_bytes.append(len(packet))
+
+    async def run(self, seconds=None):
+        """ Tick at the game's fixed rate, for some seconds or for ever. """
+        loop = asyncio.get_running_loop()
+        start = next_tick = loop.time()
+        while seconds is None or loop.time() - start < seconds:
+            self.tick()
+            next_tick += FIXED_TIMESTEP
+            delay = next_tick - loop.time()
+            if delay < -FIXED_TIMESTEP * MAX_STEPS_PER_FRAME:
+                # Fell well behind, so drop the backlog rather than rush
+                next_tick = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+
+class GameClient(asyncio.DatagramProtocol):
+    """
+    One player's end. Its simulation plays the player's own inputs straight
+    away, and is put right by each snapshot: moved to where the server has
+    the player, then the inputs the server hasn't played yet are played
+    again on top. Other players are worked out between two snapshots.
+    """
+
+    def __init__(self, simulation=None):
+        self.simulation = simulation if simulation is not None else Simulation()
+        self.transport = None
+        self.player_id = None
+        self.refused = False
+        self.join_sent = 0
+        # Inputs sent and not played by the server yet, as (sequence, controls)
+        self.sequence = 0
+        self.pending = deque(maxlen=SNAPSHOT_HISTORY_TICKS)
+        # Snapshots received, by tick, to decode the next ones against
+        self.states = {}
+        self.latest = None
+        # Where the server is thought to be now, in ticks
+        self.server_tick = 0.0
+        # Set by each snapshot that put our player right
+        self.corrected = False
+        # Input that took our player on to another level before the server had
+        self.ahead_from = None
+        # Bytes and snapshots received, and how often the prediction was off
+        self.bytes_received = 0
+        self.snapshots_received = 0
+        self.mispredictions = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.join()
+
+    def join(self):
+        self.join_sent = time.monotonic()
+        self.transport.sendto(_JOIN.pack(JOIN, PROTOCOL_VERSION))
+
+    def leave(self):
+        if self.transport is not None:
+            self.transport.sendto(bytes([LEAVE]))
+            self.transport.close()
+
+    @property
+    def playing(self):
+        """ True once the client has joined and had its first snapshot. """
+        return self.latest is not None
+
+    def datagram_received(self, data, address):
+        if not data:
+            return
+        try:
+            if data[0] == WELCOME:
+                _, self.player_id = _WELCOME.unpack_from(data)
+            elif data[0] == FULL:
+                self.refused = True
+            elif data[0] == SNAPSHOT and self.player_id is not None:
+                self.receive_snapshot(data)
+        except struct.error:
+            pass
+
+    def receive_snapshot(self, data):
+        _, tick, since, played, level = _SNAPSHOT.unpack_from(data)
+        if self.latest is not None and tick <= self.latest.tick:
+            return
+        baseline = self.states.get(since) if since else None
+        if since and baseline is None:
+            # Changes against a snapshot we no longer have
+            return
+        state = decode_changes(data, _SNAPSHOT.size, tick, level, baseline)
+        self.states[tick] = state
+        for old in [old for old in self.states if old <= tick - SNAPSHOT_HISTORY_TICKS]:
+            del self.states[old]
+        self.latest = state
+        self.server_tick = tick
+        self.bytes_received += len(data)
+        self.snapshots_received += 1
+        if self.player_id in state.players:
+            self.correct(state, played)
+
+    def correct(self, state, played):
+        """ Put our player where the server has it, then play the inputs it hasn't yet again. """
+        simulation = self.simulation
+        predicted = (simulation.player.center_x, simulation.player.center_y)
+
+        while self.pending and self.pending[0][0] <= played:
+            self.pending.popleft()
+        if self.ahead_from is not None:
+            if simulation.level != state.level and self.ahead_from > played:
+                # We reached the end of the level and the server hasn't
+                # played that far yet. Going back would load the old level
+                # only to leave it again.
+                return
+            self.ahead_from = None
+
+        moved = simulation.level != state.level or simulation.map is None
+        if moved:
+            simulation.setup(state.level)
+        for index, bits in zip(pickup_indexes(simulation), state.taken):
+            index.take(bits)
+        player = simulation.player
+        (player.center_x, player.center_y, player.change_x, player.change_y, simulation.score,
+         simulation.health, simulation.current_state, simulation.level_tick) = state.players[self.player_id]
+
+        for sequence, controls in self.pending:
+            level = simulation.level
+            simulation.hold(controls)
+            simulation.update()
+            if simulation.level != level and self.ahead_from is None:
+                self.ahead_from = sequence
+        simulation.scroll()
+
+        if not moved and (abs(player.center_x - predicted[0]) > 0.01 or abs(player.center_y - predicted[1]) > 0.01):
+            self.mispredictions += 1
+        self.corrected = True
+
+    def step(self, controls):
+        """
+        Play a tick of our own player with the controls held, and send them
+        to the server.
+
+        :returns: Events of the tick, and whether the player jumped
+        """
+        self.server_tick += 1
+        if not self.playing:
+            if self.player_id is None and time.monotonic() - self.join_sent > JOIN_RETRY:
+                self.join()
+            return [], False
+
+        self.sequence += 1
+        self.pending.append((self.sequence, controls))
+        level = self.simulation.level
+        jumped = self.simulation.hold(controls)
+        events = self.simulation.update()
+        if self.simulation.level != level and self.ahead_from is None:
+            self.ahead_from = self.sequence
+
+        recent = list(self.pending)[-INPUT_REDUNDANCY:]
+        packet = _INPUT.pack(INPUT, self.sequence, self.latest.tick, len(recent))
+        self.transport.sendto(packet + bytes(controls for sequence, controls in recent))
+        return events, jumped
+
+    def others(self):
+        """
+        Every other player's fields, as they were INTERPOLATION_TICKS ago,
+        worked out between the two snapshots either side of then.
+        """
+        if self.latest is None:
+            return {}
+        when = self.server_tick - INTERPOLATION_TICKS
+        before = after = None
+        for tick in sorted(self.states):
+            if tick <= when:
+                before = self.states[tick]
+            else:
+                after = self.states[tick]
+                break
+        if before is None or after is None or before.level != after.level:
+            before = after = before or after
+
+        fraction = 0.0 if after.tick == before.tick else (when - before.tick) / (after.tick - before.tick)
+        others = {}
+        for player_id, record in after.players.items():
+            if player_id == self.player_id:
+                continue
+            old = before.players.get(player_id, record)
+            x = old[0] + (record[0] - old[0]) * fraction
+            y = old[1] + (record[1] - old[1]) * fraction
+            others[player_id] = (x, y) + record[2:]
+        return others
+
+
+async def run_bots(host, port, count, seconds, seed=0):
+    """
+    Connect some bots to a server, holding right and jumping at random,
+    for some seconds.
+
+    :returns: The bots' clients
+    """
+    loop = asyncio.get_running_loop()
+    random_inputs = random.Random(seed)
+    clients = []
+    for _ in range(count):
+        client = GameClient(Simulation(LevelLoader(background=False)))
+        await loop.create_datagram_endpoint(lambda client=client: client, remote_addr=(host, port))
+        clients.append(client)
+
+    controls = [1 << CONTROL_RIGHT] * count
+    start = next_tick = loop.time()
+    while loop.time() - start < seconds:
+        for index, client in enumerate(clients):
+            if random_inputs.random() < 0.05:
+                controls[index] = random_inputs.choice((1 << CONTROL_RIGHT, 1 << CONTROL_RIGHT | 1 << CONTROL_JUMP,
+                                                        1 << CONTROL_LEFT, 0))
+            client.step(controls[index])
+        next_tick += FIXED_TIMESTEP
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+
+    for client in clients:
+        client.leave()
+    return clients
+
+
+def client_report(clients):
+    """ What the bots received, as a dictionary. """
+    snapshots = sum(client.snapshots_received for client in clients)
+    return {
+        "clients": len(clients),
+        "joined": sum(client.playing for client in clients),
+        "snapshots_received": snapshots,
+        "bytes_per_snapshot": sum(client.bytes_received for client in clients) / max(snapshots, 1),
+        "mispredictions": sum(client.mispredictions for client in clients),
+    }
+
+
+async def serve(port, max_players, seconds=None, report=False):
+    loop = asyncio.get_running_loop()
+    server = GameServer(max_players=max_players)
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=("127.0.0.1" if report else "0.0.0.0", port))
+    print(f"Listening on UDP port {port}", flush=True)
+    try:
+        await server.run(seconds)
+    finally:
+        transport.close()
+    if report:
+        print(json.dumps(server.stats.report()), flush=True)
+
+
+def bench(player_counts, seconds, port):
+    """
+    For each player count, start a server in its own process and connect
+    that many bots to it. Prints what a tick cost the server, and how big
+    its snapshots were.
+    """
+    print(f"{'players':>7} {'tick us':>9} {'p99 us':>9} {'bytes':>7} {'p99':>5} {'max':>5} {'/player':>8} {'mispredicted':>12}")
+    for count in player_counts:
+        server = subprocess.Popen([sys.executable, __file__, "server", "--port", str(port),
+                                   "--players", str(max(count, MAX_PLAYERS)), "--seconds", str(seconds + 1),
+                                   "--report"], stdout=subprocess.PIPE, text=True)
+        server.stdout.readline()
+        clients = asyncio.run(run_bots("127.0.0.1", port, count, seconds))
+        output, _ = server.communicate()
+        stats = json.loads(output.strip().splitlines()[-1])
+        received = client_report(clients)
+        print(f"{count:>7} {stats['tick_us_mean']:>9.1f} {stats['tick_us_p99']:>9.1f} "
+              f"{stats['snapshot_bytes_mean']:>7.1f} {stats['snapshot_bytes_p99']:>5} {stats['snapshot_bytes_max']:>5} "
+              f"{stats['snapshot_bytes_mean'] / count:>8.1f} {received['mispredictions']:>12}")
+
+
+def main():
+    """ Main method """
+    parser = argparse.ArgumentParser(description="Multiplayer server, bots and benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    server = commands.add_parser("server", help="run a game server")
+    server.add_argument("--port", type=int, default=SERVER_PORT)
+    server.add_argument("--players", type=int, default=MAX_PLAYERS, help="most players at once")
+    server.add_argument("--seconds", type=float, help="stop after this long")
+    server.add_argument("--report", action="store_true",
+                        help="only listen on localhost, and print the server's timings as JSON when it stops")
+
+    bots = commands.add_parser("bots", help="connect bots to a server")
+    bots.add_argument("--host", default="127.0.0.1")
+    bots.add_argument("--port", type=int, default=SERVER_PORT)
+    bots.add_argument("--players", type=int, default=4)
+    bots.add_argument("--seconds", type=float, default=10)
+
+    benchmark = commands.add_parser("bench", help="time a local server with more and more bots")
+    benchmark.add_argument("--port", type=int, default=SERVER_PORT)
+    benchmark.add_argument("--players", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    benchmark.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    if args.command == "server":
+        asyncio.run(serve(args.port, args.players, args.seconds, args.report))
+    elif args.command == "bots":
+        clients = asyncio.run(run_bots(args.host, args.port, args.players, args.seconds))
+        print(json.dumps(client_report(clients)))
+    else:
+        bench(args.players, args.seconds, args.port)
+
+
+if __name__ == "__main__":
+    main()
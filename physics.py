@@ -0,0 +1,118 @@
+"""
+Platformer physics against the tile grid, stepped at a fixed rate.
+"""
+import math
+
+from collision import surface_height
+from constants import *
+
+# Slack allowed when deciding if a ramp is shallow enough to walk up, since
+# hit box points are whole pixels and body edges are rounded
+STEP_TOLERANCE = 0.01
+
+
+class FixedTimestep:
+    """
+    Turns the time between frames into a whole number of fixed ticks, so
+    the game plays the same at 30, 60 or 144 frames a second. Time left
+    over is carried to the next frame.
+    """
+
+    def __init__(self, step=FIXED_TIMESTEP, max_steps=MAX_STEPS_PER_FRAME):
+        self.step = step
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def steps(self, delta_time):
+        """ How many ticks to run for a frame that took delta_time seconds. """
+        self.accumulator += delta_time
+        count = int(self.accumulator / self.step)
+        self.accumulator -= count * self.step
+
+        # After a long stall, drop the backlog instead of trying to catch up
+        if count > self.max_steps:
+            count = self.max_steps
+            self.accumulator = 0.0
+        return count
+
+
+class TilePhysicsEngine:
+    """
+    Moves a box through the Platforms layer. Movement is swept in slices no
+    taller or wider than half a tile, each slice checked against only the
+    grid cells it touches, so a step costs the same however wide the level
+    is. Tiles with a hit box polygon, like the hills, act as ramps.
+    """
+
+    def __init__(self, body, walls, gravity_constant):
+        """
+        :param body: Box to move, with center, change and edge attributes
+        :param walls: TileIndex of the Platforms layer
+        :param float gravity_constant: Downward speed added every tick
+        """
+        self.body = body
+        self.walls = walls
+        self.gravity_constant = gravity_constant
+        self.max_slice = min(walls.tile_width, walls.tile_height, body.width, body.height) / 2
+
+    def can_jump(self):
+        """ True if there is a platform right under the body. """
+        self.body.center_y -= 2
+        hit_list = self.walls.hits(self.body)
+        self.body.center_y += 2
+        return len(hit_list) > 0
+
+    def _slices(self, distance):
+        count = max(1, math.ceil(abs(distance) / self.max_slice))
+        return count, distance / count
+
+    def update(self):
+        """ Run one tick: apply gravity, then move and resolve collisions. """
+        body = self.body
+        body.change_y -= self.gravity_constant
+        self._move_y(body.change_y)
+        self._move_x(body.change_x)
+
+    def _move_y(self, distance):
+        body = self.body
+        count, step = self._slices(distance)
+        for _ in range(count):
+            body.center_y += step
+            hit_list = self.walls.hits(body)
+            if not hit_list:
+                continue
+
+            if step > 0:
+                # Bumped our head
+                body.top = min(item.bottom for item in hit_list)
+            else:
+                # Landed, on the highest surface under us
+                left, right = body.left, body.right
+                body.bottom = max(surface_height(item, left, right) for item in hit_list)
+            body.change_y = 0
+            return
+
+    def _move_x(self, distance):
+        body = self.body
+        count, step = self._slices(distance)
+        for _ in range(count):
+            body.center_x += step
+            hit_list = self.walls.hits(body)
+            if not hit_list:
+                continue
+
+            # Walk up ramps and small steps, no higher than we moved sideways
+            left, right = body.left, body.right
+            rise = max(surface_height(item, left, right) for item in hit_list) - body.bottom
+            if 0 < rise <= abs(step) + STEP_TOLERANCE:
+                body.center_y += rise
+                if not self.walls.hits(body):
+                    continue
+                body.center_y -= rise
+
+            # Blocked, so stand against the wall
+            if step > 0:
+                body.right = min(item.left for item in hit_list)
+            else:
+                body.left = max(item.right for item in hit_list)
+            return
@@ -0,0 +1,102 @@
+"""
+Frame time profiler. It keeps how long each part of the last few hundred
+frames took, so stutter can be pinned on physics, loading, sound or drawing.
+
+Code being timed calls ``lap(phase)`` after each part, which adds the time
+since the previous lap to that phase. While the profiler is off, lap and
+the other calls return straight away.
+"""
+import time
+
+import numpy as np
+
+from constants import *
+
+# Parts of a frame that are timed, in the order they usually happen
+PHASES = (
+    # Simulation.update(), once per tick
+    "enemies", "physics", "coins", "hearts", "poisons", "hazards", "level_end", "scroll", "stream",
+    # MyGame.update()
+    "pickup_sprites", "sound", "load_sprites", "enemy_sprites", "player_sprite", "viewport",
+    # MultiplayerGame.update()
+    "other_players",
+    # MyGame.on_draw()
+    "draw_background", "draw_platforms", "draw_coins", "draw_dont_touch", "draw_hearts",
+    "draw_poisons", "draw_enemies", "draw_player", "draw_foreground", "hud",
+)
+
+# Extra columns of each frame: all the timed work, and the time since the
+# frame before, which is what the player notices.
+FRAME_COLUMNS = ("work", "interval")
+
+
+class FrameProfiler:
+    """ Timings of the last few frames, in seconds, in a ring buffer. """
+
+    def __init__(self, capacity=PROFILER_FRAMES):
+        self.enabled = False
+        self.columns = {phase: index for index, phase in enumerate(PHASES)}
+        self.samples = np.zeros((capacity, len(PHASES) + len(FRAME_COLUMNS)))
+        # Frames recorded so far, the one being recorded, and when the last
+        # lap was
+        self.count = 0
+        self.current = [0.0] * len(PHASES)
+        self.last = 0.0
+        self.frame_start = None
+
+    def toggle(self):
+        """ Turn profiling on or off. Turning it on starts from an empty buffer. """
+        self.enabled = not self.enabled
+        self.count = 0
+        self.frame_start = None
+
+    def start(self):
+        """ Start timing from now, without adding the time so far to any phase. """
+        if self.enabled:
+            self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """ Add the time since the last lap to a phase. """
+        if self.enabled:
+            now = time.perf_counter()
+            self.current[self.columns[phase]] += now - self.last
+            self.last = now
+
+    def end_frame(self):
+        """ File the frame's timings in the buffer, and start the next frame. """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            row = self.samples[self.count % len(self.samples)]
+            row[:len(PHASES)] = self.current
+            row[-2] = sum(self.current)
+            row[-1] = now - self.frame_start
+            self.count += 1
+        self.frame_start = self.last = now
+        self.current = [0.0] * len(PHASES)
+
+    def frames(self):
+        """ The frames in the buffer, oldest first. """
+        size = len(self.samples)
+        if self.count <= size:
+            return self.samples[:self.count]
+        start = self.count % size
+        return np.concatenate((self.samples[start:], self.samples[:start]))
+
+    def percentiles(self):
+        """ (phase, p50, p99) in seconds, for every phase and frame column, over the buffer. """
+        frames = self.frames()
+        if len(frames) == 0:
+            return []
+        p50, p99 = np.percentile(frames, (50, 99), axis=0)
+        names = PHASES + FRAME_COLUMNS
+        return list(zip(names, p50, p99))
+
+    def dump_csv(self, path):
+        """ Write the frames in the buffer to a CSV file, in milliseconds. """
+        header = ",".join(("frame", ) + PHASES + FRAME_COLUMNS)
+        frames = self.frames() * 1000
+        numbered = np.column_stack((np.arange(self.count - len(frames), self.count), frames))
+        np.savetxt(path, numbered, delimiter=",", header=header, comments="",
+                   fmt=["%d"] + ["%.4f"] * frames.shape[1])
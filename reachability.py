@@ -0,0 +1,548 @@
+"""
+Checks every level can be played through, without playing it.
+
+Each level's Platforms grid is turned into a graph: a node for every cell
+the player can stand in, joined by walking, and by jump and fall arcs
+worked out from the game's movement speed, gravity and jump speed. From
+where the player starts, the graph shows whether the end of the level
+can be reached, which coins and hearts can be picked up, and how close
+the quickest way through runs to the Don't Touch tiles.
+
+How the player moves through the air for each move is only worked out once
+for each set of physics numbers. Arcs are then followed a tick at a time
+against the level, stopping against walls and bumping heads on ceilings
+as the real player does, for all of a cell's moves at once. Levels are
+analysed side by side in a process pool.
+
+    python reachability.py
+    python reachability.py --levels 3 4 --jump-speed 18 --path
+
+The player can go above the top of the map, as in the game, so the grids
+have empty rows above it for the player to jump through and stand in.
+
+Enemies are not timed: every cell an enemy passes through on its path is
+treated like a Don't Touch tile, so a way through found here is safe
+wherever the enemies happen to be.
+
+Arcs land on the bounding boxes of ramps, rather than their slopes, and
+only a few moves are tried from each cell, so a level this passes can be
+played through, but one it fails might still be beaten with a trick it
+missed.
+"""
+import argparse
+import functools
+import heapq
+import math
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from batch_env import COINS, DONT_TOUCH, HEARTS, WALLS, LevelGrids
+from constants import *
+from tilemap import image_size
+
+# Ticks each arc is followed for, at most
+ARC_TICKS = 90
+# Ticks to wait before pressing left or right, and how long to hold it for
+ARC_DELAYS = (0, 6, 12, 18, 24)
+ARC_HOLDS = (3, 6, 9, 12, 15, 18, 21, 24, 27, 30, 33, 36, ARC_TICKS)
+
+# How close, in pixels, the path can come to a Don't Touch tile before
+# it's reported as running past it
+HAZARD_MARGIN = GRID_PIXEL_SIZE / 2
+
+# Levels no way through is found for, with the moves tried here. They are
+# still checked and reported, but don't make the run fail, so it can be
+# used as a check after editing levels. Take a level off once it's fixed.
+KNOWN_UNFINISHABLE = (6, 9, 10)
+
+# A way to leave a cell: jump or just drop, then hold left (-1) or right (1)
+# for hold ticks, starting after delay ticks. Walking to the next cell is a
+# move with no arc.
+Move = namedtuple("Move", ["jump", "direction", "delay", "hold"])
+WALK = Move(False, 0, 0, 0)
+
+Arcs = namedtuple("Arcs", ["moves", "steps"])
+
+# Arcs followed from somewhere in a level: where they went, the tick they
+# ended on and the tick they got past the end of the level, the cell they
+# landed in if they did, and the ids of the pick-ups they touched
+Flight = namedtuple("Flight", ["x", "y", "ends", "goals", "targets", "touched"])
+
+# One step of the quickest path: the cell it left, the move, and where in
+# the cell it started from
+Step = namedtuple("Step", ["node", "move", "x"])
+
+LevelReport = namedtuple("LevelReport", [
+    "level", "end_reachable", "ticks", "path", "coins", "coins_reachable", "hearts",
+    "hearts_reachable", "unreachable", "hazards_passed", "nodes", "seconds"])
+
+
+def _first(condition):
+    """ First column where each row of condition is true, or the number of columns if never. """
+    return np.where(condition.any(axis=1), condition.argmax(axis=1), condition.shape[1])
+
+
+@functools.lru_cache()
+def jump_arcs(speed=PLAYER_MOVEMENT_SPEED, gravity=GRAVITY, jump_speed=PLAYER_JUMP_SPEED, ticks=ARC_TICKS):
+    """
+    How the player moves through the air for every move, in free flight.
+
+    :returns: The moves, and an array of how far the player moves across
+              and up on each tick of each move
+    :rtype: Arcs
+    """
+    moves = [Move(jump, 0, 0, 0) for jump in (True, False)]
+    moves += [Move(jump, direction, delay, hold) for jump in (True, False) for direction in (-1, 1)
+              for delay in ARC_DELAYS for hold in ARC_HOLDS]
+
+    tick = np.arange(ticks)
+    steps = np.zeros((len(moves), ticks, 2))
+    for index, (jump, direction, delay, hold) in enumerate(moves):
+        # The same steps as TilePhysicsEngine.update(), with nothing in the way
+        held = (tick >= delay) & (tick < delay + hold)
+        steps[index, :, 0] = held * direction * speed
+        steps[index, :, 1] = (jump_speed if jump else 0) - gravity * (tick + 1)
+    return Arcs(moves, steps)
+
+
+class LevelAnalyzer:
+    """ The movement graph of one level, and what can be reached in it. """
+
+    def __init__(self, level, arcs, speed=PLAYER_MOVEMENT_SPEED):
+        self.level = level
+        self.arcs = arcs
+        self.grids = LevelGrids(levels=(level, ))
+        self.walk_ticks = math.ceil(GRID_PIXEL_SIZE / speed)
+
+        width, height = image_size(PLAYER_IMAGE)
+        self.width = width * CHARACTER_SCALING
+        self.height = height * CHARACTER_SCALING
+        self.reach_columns = int(self.width // self.grids.tile_width[level]) + 2
+        self.reach_rows = int(self.height // self.grids.tile_height[level]) + 2
+
+        self.end_of_map = self.grids.end_of_map[level]
+        self.rows = int(self.grids.height[level])
+        walls = self.grids.cells[level, WALLS, :self.rows]
+
+        # The grids go on above the top of the map, empty, for as high as a
+        # jump goes, so the player can stand on the highest tiles and jump
+        # from them. Rows still count from the top of the map, so the rows
+        # above it are negative, and are found pad rows into the grids.
+        self.pad = math.ceil((np.cumsum(arcs.steps[..., 1], axis=1).max() + self.height) / GRID_PIXEL_SIZE) + 1
+        above_map = ((self.pad, 0), (0, 0))
+        self.solid = np.pad(walls >= 0, above_map)
+        self.ramp = np.pad((walls >= 0) & ~self.grids.box[walls], above_map)
+
+        # Cells the player fits in, with a platform under them. The player
+        # is more than a tile tall, so the cell above has to be free too.
+        below = np.zeros_like(self.solid)
+        below[:-1] = self.solid[1:]
+        above = np.zeros_like(self.solid)
+        above[1:] = self.solid[:-1]
+        self.standable = below & ~self.solid & ~above
+
+        # Every cell any part of an enemy passes through, going along its
+        # whole path, is as deadly as a Don't Touch tile, and can't be
+        # stood in, so a level that passes can be finished whenever its
+        # enemies are wherever they are
+        self.enemy_cells = np.zeros_like(self.solid)
+        enemies = self.grids.enemies[level]
+        for index in range(len(enemies)):
+            path = enemies.points[index, :enemies.segments[index] + 1]
+            for start, end in zip(path[:-1], path[1:]):
+                first_column, last_column, first_row, last_row = self._cell_span(
+                    min(start[0], end[0]) + enemies.box_left[index], max(start[0], end[0]) + enemies.box_right[index],
+                    min(start[1], end[1]) + enemies.box_bottom[index], max(start[1], end[1]) + enemies.box_top[index])
+                self.enemy_cells[max(first_row + self.pad, 0):max(last_row + self.pad + 1, 0),
+                                 max(first_column, 0):max(last_column + 1, 0)] = True
+        above[1:] = self.enemy_cells[:-1]
+        self.standable &= ~self.enemy_cells & ~above
+
+    def _cell_span(self, left, right, bottom, top):
+        """ First and last column and row a box covers, as LevelGrids.cell_contents() finds them. """
+        return (int(left // GRID_PIXEL_SIZE) + 1, int(right // GRID_PIXEL_SIZE) + 1,
+                self.rows - 1 - int(top // GRID_PIXEL_SIZE), self.rows - 1 - int(bottom // GRID_PIXEL_SIZE))
+
+    def near_enemies(self, x, y):
+        """ True where the player, standing at some points, is in a cell an enemy passes through. """
+        if not self.enemy_cells.any():
+            return np.zeros(len(x), dtype=bool)
+        first_column = ((x - self.width / 2) // GRID_PIXEL_SIZE).astype(np.int64) + 1
+        last_column = ((x + self.width / 2) // GRID_PIXEL_SIZE).astype(np.int64) + 1
+        first_row = self.rows - 1 - ((y + self.height / 2) // GRID_PIXEL_SIZE).astype(np.int64)
+        last_row = self.rows - 1 - ((y - self.height / 2) // GRID_PIXEL_SIZE).astype(np.int64)
+
+        height, width = self.enemy_cells.shape
+        rows = first_row[:, None] + np.arange(self.reach_rows) + self.pad
+        columns = first_column[:, None] + np.arange(self.reach_columns)
+        rows_inside = (rows <= last_row[:, None] + self.pad) & (rows >= 0) & (rows < height)
+        columns_inside = (columns <= last_column[:, None]) & (columns >= 0) & (columns < width)
+        cells = self.enemy_cells[np.where(rows_inside, rows, 0)[:, :, None], np.where(columns_inside, columns, 0)[:, None, :]]
+        return (cells & rows_inside[:, :, None] & columns_inside[:, None, :]).any(axis=(1, 2))
+
+    def _cell(self, grid, row, column):
+        rows, columns = grid.shape
+        row += self.pad
+        return 0 <= row < rows and 0 <= column < columns and bool(grid[row, column])
+
+    def can_stand(self, row, column):
+        return self._cell(self.standable, row, column)
+
+    def floor(self, row):
+        """ Height of the bottom of the player standing in a row. """
+        return (self.rows - row - 1) * GRID_PIXEL_SIZE
+
+    def starts(self, node):
+        """
+        Where in a cell to set off from: the middle, and hanging over any
+        edge that drops away.
+        """
+        row, column = node
+        right = column * GRID_PIXEL_SIZE
+        left = right - GRID_PIXEL_SIZE
+        starts = [left + GRID_PIXEL_SIZE / 2]
+        if not self.can_stand(row, column - 1):
+            starts.append(left - self.width / 2 + 1)
+        if not self.can_stand(row, column + 1):
+            starts.append(right + self.width / 2 - 1)
+        return starts
+
+    def overlapping(self, layer, x, y, margin=0):
+        """
+        Shapes of a layer that the player overlaps, standing at some points,
+        going by the shapes' bounding boxes.
+
+        :returns: Indices of the points, and shape ids
+        """
+        left = x - self.width / 2 - margin
+        right = x + self.width / 2 + margin
+        bottom = y - self.height / 2 - margin
+        top = y + self.height / 2 + margin
+        level = np.full(len(x), self.level)
+        reach_rows = self.reach_rows + math.ceil(2 * margin / GRID_PIXEL_SIZE)
+        reach_columns = self.reach_columns + math.ceil(2 * margin / GRID_PIXEL_SIZE)
+        point, shapes = self.grids.cell_contents(level, layer, left, right, bottom, top, reach_rows, reach_columns)
+        keep = self.grids.boxes_overlap(shapes, left[point], right[point], bottom[point], top[point])
+        return point[keep], shapes[keep]
+
+    def _touching(self, layer, x, y, live):
+        """ Arc, tick and shape id of everything in a layer the arcs touch while live. """
+        arc, tick = np.nonzero(live)
+        point, shapes = self.overlapping(layer, x[arc, tick], y[arc, tick])
+        return arc[point], tick[point], shapes
+
+    def cell_of(self, shape):
+        """ Row and column of a shape's cell. """
+        return int(self.grids.row[shape]), int(self.grids.column[shape])
+
+    def fly(self, starts, start_y):
+        """
+        Follow every arc from some starting points, all at one height, a
+        tick at a time, until it lands on a platform, touches a Don't Touch
+        tile, or falls off the map. As in TilePhysicsEngine, the player
+        moves up or down and then across each tick, stops against walls,
+        and stops rising when they bump their head.
+
+        :returns: A Flight, with an arc for every start and move, in that order
+        """
+        steps = self.arcs.steps
+        moves, ticks = steps.shape[:2]
+        count = len(starts) * moves
+        step_x = np.tile(steps[..., 0], (len(starts), 1))
+        step_y = np.tile(steps[..., 1], (len(starts), 1))
+        tick_numbers = np.arange(ticks)
+
+        # Where each arc is after each tick, while it's flying
+        x = np.full((count, ticks), np.nan)
+        y = np.full((count, ticks), np.nan)
+        at_x = np.repeat(np.asarray(starts, dtype=float), moves)
+        at_y = np.full(count, float(start_y))
+        # Added to the free flight speed up, once a head has been bumped
+        bump = np.zeros(count)
+        walls = np.full(count, ticks)
+        targets = np.full((count, 2), -1)
+
+        flying = np.arange(count)
+        for tick in range(ticks):
+            rising = step_y[flying, tick] + bump[flying] > 0
+            at_y[flying] += step_y[flying, tick] + bump[flying]
+            point, shapes = self.overlapping(WALLS, at_x[flying], at_y[flying])
+            up = rising[point]
+            bumped, first = np.unique(point[up], return_index=True)
+            if len(bumped):
+                ceilings = np.full(len(flying), np.inf)
+                np.minimum.at(ceilings, point[up], self.grids.bottom[shapes[up]])
+                bumped = flying[bumped]
+                at_y[bumped] = ceilings[point[up][first]] - self.height / 2
+                bump[bumped] = -step_y[bumped, tick]
+            landed = np.unique(point[~up])
+            if len(landed):
+                tops = np.full(len(flying), -np.inf)
+                np.maximum.at(tops, point[~up], self.grids.top[shapes[~up]])
+                at_y[flying[landed]] = tops[landed] + self.height / 2
+                targets[flying[landed]] = self._landings(flying[point[~up]], shapes[~up], at_x)
+                walls[flying[landed]] = tick
+
+            at_x[flying] += step_x[flying, tick]
+            point, shapes = self.overlapping(WALLS, at_x[flying], at_y[flying])
+            if len(point):
+                # Blocked, so stand against the wall
+                to_right = step_x[flying[point], tick] > 0
+                stops = np.where(to_right, self.grids.left[shapes] - self.width / 2,
+                                 self.grids.right[shapes] + self.width / 2)
+                stop = np.full(len(flying), np.nan)
+                np.fmin.at(stop, point[to_right], stops[to_right])
+                np.fmax.at(stop, point[~to_right], stops[~to_right])
+                blocked = np.unique(point)
+                at_x[flying[blocked]] = stop[blocked]
+
+            x[flying, tick] = at_x[flying]
+            y[flying, tick] = at_y[flying]
+            # Nothing after landing, falling off the map or getting past the end matters
+            done = np.zeros(len(flying), dtype=bool)
+            done[landed] = True
+            done |= (at_y[flying] < FALL_LIMIT_Y) | (at_x[flying] >= self.end_of_map)
+            flying = flying[~done]
+            if not len(flying):
+                break
+
+        falls = _first(y < FALL_LIMIT_Y)
+        goals = _first(x >= self.end_of_map)
+        live = tick_numbers < np.minimum(np.minimum(falls, goals + 1), walls + 1)[:, None]
+        arc, tick, _ = self._touching(DONT_TOUCH, x, y, live)
+        hazards = np.full(count, ticks)
+        np.minimum.at(hazards, arc, tick)
+        arc, tick = np.nonzero(live)
+        near = self.near_enemies(x[arc, tick], y[arc, tick])
+        np.minimum.at(hazards, arc[near], tick[near])
+        ends = np.minimum(np.minimum(walls, hazards), falls)
+
+        # Pick-ups can be touched anywhere on an arc before it ends
+        live &= tick_numbers < ends[:, None]
+        touched = set()
+        for layer in (COINS, HEARTS):
+            _, _, shapes = self._touching(layer, x, y, live)
+            touched.update(shapes.tolist())
+
+        landed = (ends == walls) & (targets[:, 0] >= 0)
+        return Flight(x, y, ends, goals, np.where(landed[:, None], targets, -1), touched)
+
+    def _landings(self, arcs, shapes, x):
+        """
+        The cell each arc lands in, when it comes down on platforms: on top
+        of the highest of them, nearest the middle of the player, or (-1, -1)
+        if there isn't room to stand there.
+
+        :param arcs: Arc of each shape the arcs came down on
+        :param shapes: Shape ids of those platforms
+        :param x: Where each arc is across
+        :returns: The cell of each of the arcs, in order
+        """
+        grids = self.grids
+        tops = np.full(len(x), -np.inf)
+        np.maximum.at(tops, arcs, grids.top[shapes])
+        highest = grids.top[shapes] == tops[arcs]
+        arcs, shapes = arcs[highest], shapes[highest]
+
+        distance = np.abs((grids.left[shapes] + grids.right[shapes]) / 2 - x[arcs])
+        order = np.lexsort((distance, arcs))
+        arcs, first = np.unique(arcs[order], return_index=True)
+        shapes = shapes[order][first]
+        # The cell on top of a platform in the map's top row is above the
+        # map, in the padding, rather than wrapping round to the bottom row
+        rows, columns = grids.row[shapes] - 1, grids.column[shapes]
+        standable = self.standable[rows + self.pad, columns]
+        return np.where(standable[:, None], np.column_stack((rows, columns)), -1)
+
+    def walks(self, node):
+        """ Cells next to a cell that can be walked to, up and down ramps too. """
+        row, column = node
+        for step in (-1, 1):
+            if self.can_stand(row, column + step):
+                yield row, column + step
+            # Up onto a ramp, or down off the one we're standing on
+            if self._cell(self.ramp, row, column + step) and self.can_stand(row - 1, column + step):
+                yield row - 1, column + step
+            if self._cell(self.ramp, row + 1, column) and self.can_stand(row + 1, column + step):
+                yield row + 1, column + step
+
+    def expand(self, node):
+        """
+        Everywhere a cell leads, and the pick-ups touched on the way.
+
+        :returns: {cell: (ticks, step)} for the quickest way to every cell it
+                  leads to, with None for the end of the level, and the ids
+                  of the pick-ups touched
+        """
+        row, _ = node
+        starts = self.starts(node)
+        stand_y = self.floor(row) + self.height / 2
+        edges = {}
+
+        def add(target, ticks, step):
+            if target != node and ticks < edges.get(target, (math.inf, ))[0]:
+                edges[target] = (ticks, step)
+
+        for neighbour in self.walks(node):
+            add(neighbour, self.walk_ticks, Step(node, WALK, starts[0]))
+        if max(starts) >= self.end_of_map:
+            add(None, 0, Step(node, WALK, max(starts)))
+
+        flight = self.fly(starts, stand_y)
+        moves = self.arcs.moves
+        for index in np.flatnonzero(flight.goals < flight.ends):
+            add(None, flight.goals[index] + 1, Step(node, moves[index % len(moves)], starts[index // len(moves)]))
+        for index in np.flatnonzero(flight.targets[:, 0] >= 0):
+            add(tuple(flight.targets[index].tolist()), flight.ends[index] + 1,
+                Step(node, moves[index % len(moves)], starts[index // len(moves)]))
+
+        # Pick-ups touched while standing in the cell count too
+        touched = set(flight.touched)
+        for layer in (COINS, HEARTS):
+            _, shapes = self.overlapping(layer, np.array(starts), np.full(len(starts), stand_y))
+            touched.update(shapes.tolist())
+        return edges, touched
+
+    def spawn(self):
+        """ The cell the player lands in after appearing at the start, or None. """
+        flight = self.fly([PLAYER_START_X], PLAYER_START_Y)
+        row, column = flight.targets[self.arcs.moves.index(Move(False, 0, 0, 0))].tolist()
+        return (row, column) if row >= 0 else None
+
+    def path_points(self, path):
+        """ Every point the player passes on a path. """
+        xs, ys = [], []
+        for node, move, start in path:
+            stand_y = self.floor(node[0]) + self.height / 2
+            xs.append(start)
+            ys.append(stand_y)
+            if move != WALK:
+                flight = self.fly([start], stand_y)
+                index = self.arcs.moves.index(move)
+                end = min(flight.ends[index], flight.goals[index])
+                xs.extend(flight.x[index, :end + 1])
+                ys.extend(flight.y[index, :end + 1])
+        return np.array(xs), np.array(ys)
+
+    def analyse(self):
+        """ Search the level from the start, and report what was found. """
+        started = time.perf_counter()
+        start = self.spawn()
+
+        # Quickest way to every cell, in ticks, and the step that got there
+        best = {start: 0}
+        came_from = {start: None}
+        touched = set()
+        end_ticks = None
+        end_step = None
+        queue = [(0, start)] if start is not None else []
+        while queue:
+            ticks, node = heapq.heappop(queue)
+            if ticks > best[node]:
+                continue
+            edges, node_touched = self.expand(node)
+            touched |= node_touched
+            for target, (cost, step) in edges.items():
+                total = ticks + cost
+                if target is None:
+                    if end_ticks is None or total < end_ticks:
+                        end_ticks, end_step = total, step
+                elif total < best.get(target, math.inf):
+                    best[target] = total
+                    came_from[target] = step
+                    heapq.heappush(queue, (total, target))
+
+        path = []
+        step = end_step
+        while step is not None:
+            path.append(step)
+            step = came_from[step.node]
+        path.reverse()
+
+        hazards = []
+        if path:
+            x, y = self.path_points(path)
+            _, shapes = self.overlapping(DONT_TOUCH, x, y, margin=HAZARD_MARGIN)
+            hazards = sorted({self.cell_of(shape) for shape in shapes.tolist()})
+
+        items = {COINS: [], HEARTS: []}
+        for layer in items:
+            shapes = np.unique(self.grids.cells[self.level, layer])
+            items[layer] = shapes[shapes >= 0].tolist()
+        unreachable = [(name, *self.cell_of(shape)) for layer, name in ((COINS, "coin"), (HEARTS, "heart"))
+                       for shape in items[layer] if shape not in touched]
+
+        return LevelReport(
+            self.level, end_step is not None, end_ticks, path,
+            len(items[COINS]), sum(shape in touched for shape in items[COINS]),
+            len(items[HEARTS]), sum(shape in touched for shape in items[HEARTS]),
+            unreachable, hazards, len(best) if start is not None else 0, time.perf_counter() - started)
+
+
+def analyse_level(level, arcs):
+    """ Analyse one level. Runs in a worker process. """
+    return LevelAnalyzer(level, arcs).analyse()
+
+
+def analyse_levels(levels, speed=PLAYER_MOVEMENT_SPEED, gravity=GRAVITY, jump_speed=PLAYER_JUMP_SPEED,
+                   processes=None):
+    """ Analyse some levels side by side. Returns a LevelReport for each, in order. """
+    arcs = jump_arcs(speed, gravity, jump_speed)
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(analyse_level, levels, repeat(arcs)))
+
+
+def main():
+    """ Main method """
+    parser = argparse.ArgumentParser(description="Check every level can be played through.")
+    parser.add_argument("--levels", type=int, nargs="+", default=list(range(1, MAX_LEVEL + 1)),
+                        help="levels to check")
+    parser.add_argument("--speed", type=float, default=PLAYER_MOVEMENT_SPEED, help="walking speed to try")
+    parser.add_argument("--gravity", type=float, default=GRAVITY, help="gravity to try")
+    parser.add_argument("--jump-speed", type=float, default=PLAYER_JUMP_SPEED, help="jump speed to try")
+    parser.add_argument("--processes", type=int, help="worker processes, by default one per CPU")
+    parser.add_argument("--path", action="store_true", help="print the quickest path through each level")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = analyse_levels(args.levels, args.speed, args.gravity, args.jump_speed, args.processes)
+    for report in reports:
+        if report.end_reachable:
+            summary = f"end reachable in {report.ticks} ticks"
+        elif report.level in KNOWN_UNFINISHABLE:
+            summary = "end not reachable, as known"
+        else:
+            summary = "END NOT REACHABLE"
+        print(f"Level {report.level}: {summary}, coins {report.coins_reachable}/{report.coins}, "
+              f"hearts {report.hearts_reachable}/{report.hearts}, {report.nodes} cells reached "
+              f"({report.seconds:.2f} s)")
+        for name, row, column in report.unreachable:
+            print(f"    {name} at row {row}, column {column} can't be reached")
+        if report.hazards_passed:
+            cells = ", ".join(f"({row}, {column})" for row, column in report.hazards_passed)
+            print(f"    quickest path runs past Don't Touch tiles at {cells}")
+        if args.path:
+            for node, move, x in report.path:
+                if move == WALK:
+                    action = "walk"
+                else:
+                    action = ("jump" if move.jump else "drop") + \
+                        (f", holding {'right' if move.direction > 0 else 'left'} for {move.hold} ticks"
+                         f" after {move.delay}" if move.direction else "")
+                print(f"    from row {node[0]}, column {node[1]}, x {x:.0f}: {action}")
+    print(f"Checked {len(reports)} levels in {time.perf_counter() - start:.1f} s")
+
+    for report in reports:
+        if report.end_reachable and report.level in KNOWN_UNFINISHABLE:
+            print(f"Level {report.level} can be finished now, and can come off KNOWN_UNFINISHABLE")
+    if not all(report.end_reachable or report.level in KNOWN_UNFINISHABLE for report in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Drawing for layers whose sprites don't move, sprite lists that draw from
+the shared texture atlas, sprites moved and animated from arrays, and a
+pool of sprites to build levels from.
+"""
+import math
+import threading
+
+import arcade
+import numpy as np
+from arcade import shader
+
+import textures
+from animation import enemy_table
+from constants import *
+from tilemap import layer_shapes
+
+# Building the sprite buffer ourselves leans on how arcade's SpriteList
+# lays it out and draws it, which is only known for the version pinned in
+# requirements.txt. With any other, lists are drawn arcade's own way.
+ATLAS_ARCADE_VERSION = "2.0.9"
+_ATLAS_DRAWING = arcade.version.VERSION == ATLAS_ARCADE_VERSION
+
+# Per sprite data SpriteList's shader reads
+_SPRITE_DATA = np.dtype([('position', '2f4'), ('angle', 'f4'), ('size', '2f4'),
+                         ('sub_tex_coords', '4f4'), ('color', '4B')])
+
+# One quad, instanced once per sprite
+_QUAD = np.array([
+    #  x,    y,   u,   v
+    -1.0, -1.0, 0.0, 0.0,
+    -1.0, 1.0, 0.0, 1.0,
+    1.0, -1.0, 1.0, 0.0,
+    1.0, 1.0, 1.0, 1.0,
+], dtype=np.float32)
+
+# Buffer holding _QUAD, which every AtlasSpriteList shares
+_quad_buffer = None
+
+
+def quad_buffer():
+    """ The shared quad buffer, made the first time a list is drawn. """
+    global _quad_buffer
+    if _quad_buffer is None:
+        _quad_buffer = shader.buffer(_QUAD.tobytes())
+    return _quad_buffer
+
+
+class AtlasSpriteList(arcade.SpriteList):
+    """
+    A SpriteList that draws from a page of the texture atlas.
+
+    arcade's own SpriteList pastes its sprites' images into a new texture
+    for every list. This one points its sprites at their spot in the shared
+    atlas instead, so nothing is pasted or uploaded per list. If some
+    texture isn't in the atlas, or the sprites span pages, it falls back
+    to arcade's way, as it does for every list on versions of arcade other
+    than ATLAS_ARCADE_VERSION.
+
+    The sprite buffer is kept when the sprites change, and written over if
+    it is still big enough, which is what makes pooled lists cheap to reuse.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Vertex array over the current sprite buffer, while it can be reused
+        self.atlas_vao = None
+
+    def _calculate_sprite_buffer(self):
+        if not _ATLAS_DRAWING:
+            super()._calculate_sprite_buffer()
+            return
+        if len(self.sprite_list) == 0:
+            return
+
+        atlas = textures.atlas()
+        found = [atlas.find(sprite.texture) for sprite in self.sprite_list]
+        pages = {item[0] for item in found if item is not None}
+        if None in found or len(pages) != 1:
+            self.atlas_vao = None
+            super()._calculate_sprite_buffer()
+            return
+
+        self._texture = atlas.pages[pages.pop()].gl_texture
+        if self.texture_id is None:
+            self.texture_id = arcade.SpriteList.next_texture_id
+
+        self.sprite_data = np.zeros(len(self.sprite_list), dtype=_SPRITE_DATA)
+        for i, (sprite, (page, coordinates)) in enumerate(zip(self.sprite_list, found)):
+            self.sprite_data[i] = ((sprite.center_x, sprite.center_y), math.radians(sprite.angle),
+                                   (sprite.width / 2, sprite.height / 2), coordinates,
+                                   sprite.color + (sprite.alpha, ))
+
+        data = self.sprite_data.tobytes()
+        if self.atlas_vao is not None and self.sprite_data_buf.size >= len(data):
+            # Only as many sprites as the list has are drawn, so a bigger
+            # buffer than needed is fine
+            self.sprite_data_buf.write(data)
+            self.vao = self.atlas_vao
+            return
+
+        usage = 'static' if self.is_static else 'stream'
+        self.sprite_data_buf = shader.buffer(data, usage=usage)
+        self.vbo_buf = quad_buffer()
+        vbo_buf_desc = shader.BufferDescription(self.vbo_buf, '2f 2f', ('in_vert', 'in_texture'))
+        sprite_buf_desc = shader.BufferDescription(
+            self.sprite_data_buf,
+            '2f 1f 2f 4f 4B',
+            ('in_pos', 'in_angle', 'in_scale', 'in_sub_tex_coords', 'in_color'),
+            normalized=['in_color'], instanced=True)
+        self.vao = shader.vertex_array(self.program, [vbo_buf_desc, sprite_buf_desc])
+        self.atlas_vao = self.vao
+
+
+class MovingSpriteList(AtlasSpriteList):
+    """
+    Sprites moved and animated all at once from arrays, like the enemies. A
+    move writes the positions, angles and frames into the sprite buffer a
+    column at a time, rather than going through each sprite's setters, which
+    would file the sprite in the list's spatial hash again, and for a new
+    texture, build the whole buffer again. The sprites themselves only catch
+    up when the buffer has to be built anyway.
+
+    A sprite's textures are the frames of its animation table, and which
+    one it shows is given by its index.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # Atlas coordinates and half sizes of each sprite's textures, once
+        # they're known, and the rows of the buffer they're written to
+        self.frames = None
+        self.frame_sizes = None
+        self.rows = None
+        # Frames in each sprite's animation, for lists that pick them by tick
+        self.frame_counts = None
+        # What the sprites were last moved to, for them to catch up with
+        self.moved = None
+
+    def _calculate_sprite_buffer(self):
+        if self.moved is not None:
+            for sprite, *place in zip(self.sprite_list, *self.moved):
+                self._show(sprite, *place)
+            self.moved = None
+        # The sprites may not be the same ones
+        self.frames = None
+        super()._calculate_sprite_buffer()
+
+    @staticmethod
+    def _show(sprite, x, y, texture, angle):
+        """ Set a sprite's own position, angle and texture, without telling its lists. """
+        texture = sprite.textures[texture]
+        sprite._position = [x, y]
+        sprite._angle = angle
+        sprite._texture = texture
+        sprite._width = texture.width * texture.scale
+        sprite._height = texture.height * texture.scale
+        sprite._point_list_cache = None
+
+    def _frame_table(self):
+        """ Work out the frames' atlas coordinates, if they aren't yet. False if the list doesn't draw from the atlas. """
+        if self.vao is not self.atlas_vao:
+            return False
+        if self.frames is None:
+            atlas = textures.atlas()
+            most = max(len(sprite.textures) for sprite in self.sprite_list)
+            self.frames = np.zeros((len(self.sprite_list), most, 4), dtype=np.float32)
+            self.frame_sizes = np.zeros((len(self.sprite_list), most, 2), dtype=np.float32)
+            for row, sprite in enumerate(self.sprite_list):
+                for index, texture in enumerate(sprite.textures):
+                    self.frames[row, index] = atlas.find(texture)[1]
+                    self.frame_sizes[row, index] = (texture.width * texture.scale / 2,
+                                                    texture.height * texture.scale / 2)
+            self.rows = np.arange(len(self.sprite_list))
+        return True
+
+    def move(self, x, y, texture, angle):
+        """
+        :param x: Center of each sprite across, in the order they were added
+        :param y: Center of each sprite up
+        :param texture: Index of the texture each sprite shows
+        :param angle: Angle of each sprite, in degrees
+        """
+        self.moved = (x, y, texture, angle)
+        if self.vao is None or not self.sprite_list:
+            # The buffer is made from the sprites when the list is next drawn
+            return
+        if not self._frame_table():
+            # arcade's own buffer has to be made again for new textures
+            self._calculate_sprite_buffer()
+            return
+
+        data = self.sprite_data
+        data['position'][:, 0] = x
+        data['position'][:, 1] = y
+        data['angle'] = np.radians(angle)
+        data['sub_tex_coords'] = self.frames[self.rows, texture]
+        data['size'] = self.frame_sizes[self.rows, texture]
+
+    def place(self, sprite, x, y, texture):
+        """ Move and animate one sprite, for lists whose sprites aren't all moved at once. """
+        changed = sprite._texture is not sprite.textures[texture]
+        self._show(sprite, x, y, texture, sprite._angle)
+        if self.vao is None:
+            return
+        if not self._frame_table():
+            # arcade's own buffer has to be made again for a new texture,
+            # and is only written to directly if its layout is known
+            if changed or not _ATLAS_DRAWING:
+                self._calculate_sprite_buffer()
+            else:
+                self.sprite_data[self.sprite_idx[sprite]]['position'] = (x, y)
+            return
+
+        row = self.sprite_idx[sprite]
+        data = self.sprite_data[row]
+        data['position'] = (x, y)
+        data['sub_tex_coords'] = self.frames[row, texture]
+        data['size'] = self.frame_sizes[row, texture]
+
+
+def enemy_sprites(spawns):
+    """ A MovingSpriteList with a sprite for each enemy of a map, drawn from its animation table. """
+    sprites = MovingSpriteList()
+    counts = []
+    for spawn in spawns:
+        table = enemy_table(spawn.image)
+        sprite = arcade.Sprite()
+        sprite.textures = table.textures
+        sprite.set_texture(TEXTURE_LEFT)
+        sprite.center_x, sprite.center_y = spawn.path[0]
+        sprites.append(sprite)
+        counts.append(table.count[0])
+    sprites.frame_counts = np.array(counts, dtype=np.int64)
+    return sprites
+
+
+class SpritePool:
+    """
+    Tile sprites and chunk sprite lists from levels that have been left, to
+    build later levels from instead of making new ones. Lists keep their
+    sprite buffers, so the GPU memory is reused too.
+
+    Levels are built on the level loader's thread and left on the main one,
+    so taking from the pool and giving back to it are locked.
+    """
+
+    def __init__(self):
+        self.sprites = []
+        self.sprite_lists = []
+        self.lock = threading.Lock()
+
+    def sprite(self):
+        """ A sprite from the pool, or a new one if it's empty. """
+        with self.lock:
+            if self.sprites:
+                return self.sprites.pop()
+        return arcade.Sprite()
+
+    def sprite_list(self):
+        """ An empty static list from the pool, or a new one if it's empty. """
+        with self.lock:
+            if self.sprite_lists:
+                return self.sprite_lists.pop()
+        return AtlasSpriteList(is_static=True)
+
+    def give_back(self, sprites, sprite_lists):
+        """ Take back sprites and lists that won't be drawn again. The lists are emptied. """
+        for sprite_list in sprite_lists:
+            sprite_list.sprite_list.clear()
+            sprite_list.sprite_idx.clear()
+            sprite_list.vao = None
+        for sprite in sprites:
+            sprite.sprite_lists.clear()
+            # arcade only works the hit box out again when the sprite moves
+            sprite._point_list_cache = None
+        with self.lock:
+            self.sprites.extend(sprites)
+            self.sprite_lists.extend(sprite_lists)
+
+
+def layer_sprites(my_map, layer_name, scaling, pool=None):
+    """
+    Sprites for one layer of a map, like ``arcade.generate_sprites`` makes,
+    but sharing textures from the registry instead of loading them per
+    sprite. They come out in the same order as ``layer_shapes``.
+    """
+    return shape_sprites(my_map, layer_shapes(my_map, layer_name, scaling), scaling, pool)
+
+
+def shape_sprites(my_map, shapes, scaling, pool=None):
+    """ A sprite for each tile shape, in the same order, taken from the pool if one is given. """
+    sprites = []
+    for shape in shapes:
+        tile = my_map.global_tile_set[str(shape.gid)]
+        sprite = pool.sprite() if pool is not None else arcade.Sprite()
+        sprite.texture = textures.load_texture(tile.source, scale=scaling)
+        sprite.center_x = shape.center_x
+        sprite.center_y = shape.center_y
+        # A pooled sprite may still have the hit box of its last tile
+        sprite.set_points(tile.points)
+        sprites.append(sprite)
+    return sprites
+
+
+class ChunkedLayer:
+    """
+    A layer of tiles cut into square chunks, each one a static SpriteList.
+
+    A static SpriteList uploads its geometry once, and only builds it again
+    when a sprite is added or removed, so picking up a coin only rebuilds
+    the chunk it was in. Drawing skips every chunk outside the viewport,
+    which keeps the cost tied to the screen size rather than the level size.
+
+    With a pool, chunks come from it, and go back to it with their sprites
+    once they aren't needed.
+    """
+
+    def __init__(self, sprites, chunk_size=CHUNK_PIXEL_SIZE, pool=None):
+        self.chunk_size = chunk_size
+        self.pool = pool
+        self.chunks = {}
+
+        # Every sprite the layer started with, in the order it was generated
+        self.sprites = list(sprites)
+        self._file(self.sprites)
+
+    def _file(self, sprites):
+        chunk_size = self.chunk_size
+        for sprite in sprites:
+            key = (int(sprite.center_x // chunk_size), int(sprite.center_y // chunk_size))
+            if key not in self.chunks:
+                self.chunks[key] = self.pool.sprite_list() if self.pool is not None \
+                    else AtlasSpriteList(is_static=True)
+            self.chunks[key].append(sprite)
+
+    def add(self, sprites):
+        """ Add sprites, as a streamed level loads more of its map. """
+        self._file(sprites)
+
+    def remove(self, sprites):
+        """ Take sprites out, dropping chunks that are left empty. """
+        for sprite in sprites:
+            sprite.remove_from_sprite_lists()
+        empty = [chunk for chunk in self.chunks.values() if len(chunk) == 0]
+        self.chunks = {key: chunk for key, chunk in self.chunks.items() if len(chunk) > 0}
+        if self.pool is not None:
+            self.pool.give_back(sprites, empty)
+
+    def restore(self):
+        """ Put back the sprites taken out since the layer was made, to play its level again. """
+        self._file([sprite for sprite in self.sprites if not sprite.sprite_lists])
+
+    def release(self):
+        """ Give every sprite and chunk back to the pool, once the layer won't be drawn again. """
+        if self.pool is None:
+            return
+        sprites = {sprite for chunk in self.chunks.values() for sprite in chunk}
+        sprites.update(self.sprites)
+        self.pool.give_back(list(sprites), list(self.chunks.values()))
+        self.sprites = []
+        self.chunks = {}
+
+    def draw(self, left, bottom, right, top):
+        """ Draw the chunks that can be seen in a viewport. """
+        # Sprites are filed by their center, so they can hang up to a tile
+        # over the edge of their chunk.
+        size = self.chunk_size
+        first_x = int((left - GRID_PIXEL_SIZE) // size)
+        last_x = int((right + GRID_PIXEL_SIZE) // size)
+        first_y = int((bottom - GRID_PIXEL_SIZE) // size)
+        last_y = int((top + GRID_PIXEL_SIZE) // size)
+
+        chunks = self.chunks
+        for chunk_x in range(first_x, last_x + 1):
+            for chunk_y in range(first_y, last_y + 1):
+                chunk = chunks.get((chunk_x, chunk_y))
+                if chunk is not None:
+                    chunk.draw()
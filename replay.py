@@ -0,0 +1,153 @@
+"""
+Recording a game as the controls pressed on each tick, and playing it back.
+
+The simulation is deterministic: the same level, score and health, with the
+same controls pressed on the same ticks, always plays out the same way. So a
+recording is just where the game started, every press and release, and how
+it ended, which a replay checks it ends the same way again.
+"""
+import struct
+from collections import namedtuple
+
+from constants import *
+from simulation import Simulation
+
+RECORDING_MAGIC = b"FANR"
+RECORDING_VERSION = 1
+
+# magic, version, starting level, score and health, number of inputs
+_HEADER = struct.Struct("<4sHHiiI")
+# tick, then the control shifted left one bit, with pressed in the low bit
+_INPUT = struct.Struct("<IB")
+# ticks played, level, score, health, state, player x and y
+_RESULT = struct.Struct("<IHiiBdd")
+
+Input = namedtuple("Input", ["tick", "pressed", "control"])
+Result = namedtuple("Result", ["ticks", "level", "score", "health", "state", "x", "y"])
+
+
+def result_of(simulation, ticks):
+    """ How a game stands after some number of ticks. """
+    return Result(ticks, simulation.level, simulation.score, simulation.health,
+                  simulation.current_state, simulation.player.center_x, simulation.player.center_y)
+
+
+class Recording:
+    """ Where a game started, the inputs played, and how it ended. """
+
+    def __init__(self, level, score, health):
+        self.level = level
+        self.score = score
+        self.health = health
+        self.inputs = []
+        self.result = None
+
+    def save(self, path):
+        """ Write the recording to a file. """
+        with open(path, "wb") as out:
+            out.write(_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION,
+                                   self.level, self.score, self.health, len(self.inputs)))
+            for tick, pressed, control in self.inputs:
+                out.write(_INPUT.pack(tick, control << 1 | pressed))
+            out.write(_RESULT.pack(*self.result))
+
+    @classmethod
+    def load(cls, path):
+        """ Read a recording written by save(). """
+        with open(path, "rb") as source:
+            data = source.read()
+
+        magic, version, level, score, health, count = _HEADER.unpack_from(data, 0)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError(f"{path} is not a version {RECORDING_VERSION} recording.")
+
+        recording = cls(level, score, health)
+        offset = _HEADER.size
+        for tick, packed in _INPUT.iter_unpack(data[offset:offset + count * _INPUT.size]):
+            recording.inputs.append(Input(tick, bool(packed & 1), packed >> 1))
+        offset += count * _INPUT.size
+        recording.result = Result(*_RESULT.unpack_from(data, offset))
+        return recording
+
+
+class Recorder:
+    """
+    Records the controls pressed in a simulation, from now until finish()
+    is called. Ticks are counted from when recording started.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.start_tick = simulation.tick
+        self.recording = Recording(simulation.level, simulation.score, simulation.health)
+
+    def press(self, control):
+        self.recording.inputs.append(Input(self.simulation.tick - self.start_tick, True, control))
+
+    def release(self, control):
+        self.recording.inputs.append(Input(self.simulation.tick - self.start_tick, False, control))
+
+    def finish(self):
+        """ Note how the game ended, and hand back the recording. """
+        self.recording.result = result_of(self.simulation, self.simulation.tick - self.start_tick)
+        return self.recording
+
+
+class Replayer:
+    """
+    Plays a recording back into a simulation, as its controller. The level
+    the recording starts on must already be set up.
+    """
+
+    def __init__(self, recording, simulation):
+        self.recording = recording
+        simulation.score = recording.score
+        simulation.health = recording.health
+        simulation.current_state = GAME_RUNNING
+        self.start_tick = simulation.tick
+        self.next_input = 0
+        # How the replay ended, once it has
+        self.result = None
+
+    def __call__(self, simulation):
+        tick = simulation.tick - self.start_tick
+        if tick == self.recording.result.ticks and self.result is None:
+            self.result = result_of(simulation, tick)
+
+        inputs = self.recording.inputs
+        while self.next_input < len(inputs) and inputs[self.next_input].tick <= tick:
+            _, pressed, control = inputs[self.next_input]
+            if pressed:
+                simulation.press(control)
+            else:
+                simulation.release(control)
+            self.next_input += 1
+
+    def finished(self, simulation):
+        """ True once the replay has played as many ticks as were recorded, or the game is over. """
+        if self.result is None:
+            tick = simulation.tick - self.start_tick
+            if tick >= self.recording.result.ticks or simulation.current_state != GAME_RUNNING:
+                self.result = result_of(simulation, tick)
+        return self.result is not None
+
+    def mismatches(self):
+        """ Every way the replay ended differently from the recording. """
+        return [f"{field}: recorded {recorded}, replayed {replayed}"
+                for field, recorded, replayed in zip(Result._fields, self.recording.result, self.result)
+                if recorded != replayed]
+
+
+def replay_headless(recording):
+    """
+    Play a recording back without a window, as fast as the CPU allows.
+
+    :returns: The simulation, and the replayer to check the result with
+    """
+    simulation = Simulation()
+    simulation.setup(recording.level)
+    replayer = Replayer(recording, simulation)
+    simulation.controller = replayer
+    while not replayer.finished(simulation):
+        simulation.update()
+    return simulation, replayer
@@ -0,0 +1,460 @@
+"""
+Gameplay state and rules, with no window, textures or sound.
+
+``MyGame`` wraps a ``Simulation`` and turns the events it reports into
+sprites and sounds. On its own, the simulation can be stepped as fast as
+the CPU allows, which is what automated playtests use.
+"""
+import time
+from collections import namedtuple
+
+from collision import TileIndex
+from constants import *
+from enemies import EnemySet
+from level_cache import LevelLoader, map_file, open_stream
+from physics import FixedTimestep, TilePhysicsEngine
+from profiler import FrameProfiler
+from streaming import StreamingLevel
+from tilemap import layer_shapes, image_size, is_infinite
+
+# Kinds of events reported by Simulation.update()
+COIN_COLLECTED = "coin"
+HEART_COLLECTED = "heart"
+POISON_COLLECTED = "poison"
+PLAYER_DIED = "died"
+LEVEL_COMPLETED = "completed"
+LEVEL_CHANGED = "level"
+
+# What killed the player, reported with PLAYER_DIED
+DIED_FALLING = "fall"
+DIED_DONT_TOUCH = "dont_touch"
+DIED_ENEMY = "enemy"
+DIED_HEALTH = "health"
+
+# What happened, and the level and tick into it it happened on. A
+# LEVEL_COMPLETED event's tick is how long the level took.
+Event = namedtuple("Event", ["kind", "item", "level", "tick"])
+# The item of a PLAYER_DIED event: what killed the player, and where
+Death = namedtuple("Death", ["cause", "x", "y"])
+
+
+class Body:
+    """ Axis aligned box that stands in for the player sprite. """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.center_x = 0.0
+        self.center_y = 0.0
+        self.change_x = 0.0
+        self.change_y = 0.0
+
+    # Edges are rounded to two places, the same way arcade rounds sprite
+    # corners, so both collide identically. Setting an edge shifts the center.
+    @property
+    def left(self):
+        return round(self.center_x - self.width / 2, 2)
+
+    @left.setter
+    def left(self, value):
+        self.center_x += value - self.left
+
+    @property
+    def right(self):
+        return round(self.center_x + self.width / 2, 2)
+
+    @right.setter
+    def right(self, value):
+        self.center_x -= self.right - value
+
+    @property
+    def bottom(self):
+        return round(self.center_y - self.height / 2, 2)
+
+    @bottom.setter
+    def bottom(self, value):
+        self.center_y += value - self.bottom
+
+    @property
+    def top(self):
+        return round(self.center_y + self.height / 2, 2)
+
+    @top.setter
+    def top(self, value):
+        self.center_y -= self.top - value
+
+    @property
+    def points(self):
+        left, right, bottom, top = self.left, self.right, self.bottom, self.top
+        return (left, bottom), (right, bottom), (right, top), (left, top)
+
+
+class Simulation:
+    """
+    Everything that decides how a game plays out: the player, the level's
+    tiles, score, health, level and which state the game is in.
+    """
+
+    def __init__(self, loader=None, streaming=False):
+        width, height = image_size(PLAYER_IMAGE)
+        self.player = Body(width * CHARACTER_SCALING, height * CHARACTER_SCALING)
+
+        # Where levels come from. The next level is loaded in the background
+        # while the current one is played.
+        self.loader = loader if loader is not None else LevelLoader()
+
+        # Stream every level, rather than only infinite maps. A streamed
+        # level only has the chunks near the camera loaded, in self.stream.
+        self.streaming = streaming
+        self.stream = None
+        # Whether each level's map is infinite, once its file has been looked at
+        self.infinite = {}
+
+        # The current level's geometry: its parsed map, and its tiles as
+        # collision shapes. Which pick-ups are left is the only part of it
+        # that changes as the level is played.
+        self.prepared = None
+        self.map = None
+        self.wall_list = None
+        self.coin_list = None
+        self.hearts_list = None
+        self.poisons_list = None
+        self.dont_touch_list = None
+        # The level's enemies, and how many ticks the level has been played,
+        # which is all that decides where they are
+        self.enemies = None
+        self.level_tick = 0
+
+        self.physics_engine = None
+
+        # Ticks played so far, and the clock that decides how many to run
+        self.tick = 0
+        self.clock = FixedTimestep()
+
+        # Optional callable, given the simulation before every tick it plays.
+        # Replays use it to press keys at the right moment.
+        self.controller = None
+
+        # Times each part of a tick, when it is turned on
+        self.profiler = FrameProfiler()
+
+        # Used to keep track of our scrolling
+        self.view_bottom = 0
+        self.view_left = 0
+        self.changed_viewport = False
+
+        self.score = 0
+        self.health = PLAYER_START_HEALTH
+        self.level = 1
+        self.current_state = INSTRUCTIONS_PAGE_0
+
+        # Where is the right edge of the map?
+        self.end_of_map = 0
+
+    def setup(self, level):
+        """ Load a level and put the player at the start of it. """
+        self.view_bottom = 0
+        self.view_left = 0
+        self.changed_viewport = True
+
+        # Starting over from the first level resets the score
+        if level == 1:
+            self.score = 0
+            self.health = PLAYER_START_HEALTH
+        self.level = level
+
+        self.player.center_x = PLAYER_START_X
+        self.player.center_y = PLAYER_START_Y
+        self.player.change_x = 0
+        self.player.change_y = 0
+
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        if self.streams(level):
+            # Only the map's description is read now. Its tiles are read
+            # into the indexes by the stream as the camera gets near them.
+            self.prepared = None
+            self.map = open_stream(map_file(level), TILE_SCALING)
+            indexes = {name: self.tile_index(name) for name in COLLISION_LAYER_NAMES}
+        else:
+            # Restarting the level being played, or one the loader keeps,
+            # reuses its tiles. Only the pick-ups taken last time are put back.
+            if self.prepared is None or self.prepared.level != level:
+                self.prepared = self.loader.get(level)
+            self.map = self.prepared.map
+            indexes = self.prepared.indexes
+            for name in PICKUP_LAYER_NAMES:
+                indexes[name].restore()
+
+        # Walls, pick-ups and hazards are all looked up by grid cell
+        self.wall_list = indexes[PLATFORMS_LAYER_NAME]
+        self.coin_list = indexes[COINS_LAYER_NAME]
+        self.hearts_list = indexes[HEARTS_LAYER_NAME]
+        self.poisons_list = indexes[POISONS_LAYER_NAME]
+        self.dont_touch_list = indexes[DONT_TOUCH_LAYER_NAME]
+
+        if self.prepared is None:
+            self.stream = StreamingLevel(self.map, indexes)
+            self.stream.update(*self.viewport())
+            # The rightmost column with a tile in it, which for a fixed
+            # size map is its last column
+            self.end_of_map = self.map.last_column * GRID_PIXEL_SIZE
+        else:
+            # Calculate the right edge of the map in pixels
+            self.end_of_map = (self.map.width - 1) * GRID_PIXEL_SIZE
+
+        # A level played again keeps its enemies' arrays
+        if self.enemies is None or self.enemies.spawns is not self.map.enemies:
+            self.enemies = EnemySet(self.map.enemies)
+        self.level_tick = 0
+        self.enemies.update(0)
+
+        self.physics_engine = TilePhysicsEngine(self.player, self.wall_list, GRAVITY)
+
+        if level < MAX_LEVEL and not self.streams(level + 1):
+            self.loader.prefetch(level + 1)
+
+    def streams(self, level):
+        """ True if a level is streamed, rather than loaded whole. """
+        if self.streaming:
+            return True
+        if level not in self.infinite:
+            self.infinite[level] = is_infinite(map_file(level))
+        return self.infinite[level]
+
+    def viewport(self):
+        """ Left, bottom, right and top of what the camera sees. """
+        return (self.view_left, self.view_bottom,
+                self.view_left + SCREEN_WIDTH, self.view_bottom + SCREEN_HEIGHT)
+
+    def tile_index(self, layer_name):
+        """ Grid index of one layer of the current map. """
+        return TileIndex(layer_shapes(self.map, layer_name, TILE_SCALING),
+                         self.map.tilewidth * TILE_SCALING,
+                         self.map.tileheight * TILE_SCALING,
+                         self.map.height)
+
+    def walk(self, direction):
+        """ Start walking left (-1), right (1), or stop (0). """
+        if self.current_state == GAME_RUNNING:
+            self.player.change_x = direction * PLAYER_MOVEMENT_SPEED
+
+    def jump(self):
+        """ Jump if standing on something. Returns True if we jumped. """
+        if self.current_state == GAME_RUNNING and self.physics_engine.can_jump():
+            self.player.change_y = PLAYER_JUMP_SPEED
+            return True
+        return False
+
+    def press(self, control):
+        """ A control was pressed. Returns True if it made the player jump. """
+        if control == CONTROL_JUMP:
+            return self.jump()
+        if control == CONTROL_LEFT:
+            self.walk(-1)
+        elif control == CONTROL_RIGHT:
+            self.walk(1)
+        return False
+
+    def release(self, control):
+        """ A control was let go. """
+        if control == CONTROL_LEFT or control == CONTROL_RIGHT:
+            self.walk(0)
+
+    def hold(self, controls):
+        """
+        Walk and jump for a bitmask of held controls, the way batch_env and
+        network players play. Returns True if it made the player jump.
+        """
+        self.walk(((controls >> CONTROL_RIGHT) & 1) - ((controls >> CONTROL_LEFT) & 1))
+        if (controls >> CONTROL_JUMP) & 1:
+            return self.jump()
+        return False
+
+    def respawn(self):
+        """ Put the player back at the start, and the camera with them. """
+        self.player.center_x = PLAYER_START_X
+        self.player.center_y = PLAYER_START_Y
+        self.view_left = 0
+        self.view_bottom = 0
+        self.changed_viewport = True
+
+    def _collect(self, items, kind, events):
+        """ Remove every item in a pickup list the player touches. """
+        hit_list = items.hits(self.player)
+        for item in hit_list:
+            items.remove(item)
+            if self.stream is not None:
+                self.stream.collect(item)
+            events.append(Event(kind, item, self.level, self.level_tick))
+        return len(hit_list)
+
+    def advance(self, delta_time):
+        """
+        Run as many ticks as delta_time seconds of play are worth.
+
+        :returns: Events that happened during those ticks
+        :rtype: list
+        """
+        events = []
+        changed_viewport = False
+        for _ in range(self.clock.steps(delta_time)):
+            events.extend(self.update())
+            changed_viewport = changed_viewport or self.changed_viewport
+        self.changed_viewport = changed_viewport
+        return events
+
+    def update(self):
+        """
+        Advance the game by one tick.
+
+        :returns: Events that happened during the tick
+        :rtype: list
+        """
+        events = []
+        self.changed_viewport = False
+
+        # Only move and do things if the game is running.
+        if self.current_state != GAME_RUNNING:
+            return events
+
+        # Only ticks that are played are counted, so a recorded key press
+        # lands on the same tick however the frames fell.
+        if self.controller is not None:
+            self.controller(self)
+        self.tick += 1
+        self.level_tick += 1
+
+        profiler = self.profiler
+        profiler.start()
+        self.enemies.update(self.level_tick)
+        profiler.lap("enemies")
+        self.physics_engine.update()
+        profiler.lap("physics")
+        self.collect_pickups(events)
+        self.check_hazards(events)
+        profiler.lap("hazards")
+        self.check_level_end(events)
+        profiler.lap("level_end")
+        self.scroll()
+        profiler.lap("scroll")
+        if self.stream is not None:
+            self.stream.update(*self.viewport())
+            profiler.lap("stream")
+        return events
+
+    def collect_pickups(self, events):
+        """ Pick up the coins, hearts and poisons the player touches. """
+        self.score += self._collect(self.coin_list, COIN_COLLECTED, events)
+        self.profiler.lap("coins")
+        self.health += self._collect(self.hearts_list, HEART_COLLECTED, events)
+        self.profiler.lap("hearts")
+        self.health -= self._collect(self.poisons_list, POISON_COLLECTED, events)
+        self.profiler.lap("poisons")
+
+    def _died(self, cause, x, y, events):
+        """ Report a death, and put the player back at the start. """
+        self.respawn()
+        events.append(Event(PLAYER_DIED, Death(cause, x, y), self.level, self.level_tick))
+
+    def check_hazards(self, events):
+        """ Take a life for falling off the map or touching a hazard. """
+        # Where the player was, before anything this tick sent them back,
+        # and how many events there were before any deaths this tick
+        x, y = self.player.center_x, self.player.center_y
+        earlier = len(events)
+
+        # Did the player fall off the map?
+        if self.player.center_y < FALL_LIMIT_Y:
+            self.health -= 1
+            self._died(DIED_FALLING, x, y, events)
+
+        # Did the player touch something they should not?
+        if self.dont_touch_list.hits(self.player):
+            self.health -= 1
+            self._died(DIED_DONT_TOUCH, x, y, events)
+
+        # Did the player run into an enemy?
+        if len(self.enemies.hits(self.player)):
+            self.health -= 1
+            self._died(DIED_ENEMY, x, y, events)
+
+        # Did the player health run out ? The death that took the last
+        # life is reported as running out, rather than as a second death.
+        if self.health < 0:
+            self.current_state = YOU_LOST
+            if len(events) > earlier:
+                self.respawn()
+                events[-1] = events[-1]._replace(item=Death(DIED_HEALTH, x, y))
+            else:
+                self._died(DIED_HEALTH, x, y, events)
+
+    def check_level_end(self, events):
+        """ Move on to the next level when the player reaches the end of this one. """
+        # See if the user got to the end of the level
+        if self.player.center_x >= self.end_of_map:
+            events.append(Event(LEVEL_COMPLETED, None, self.level, self.level_tick))
+            if self.level == MAX_LEVEL:
+                self.current_state = YOU_WON
+            else:
+                self.level += 1
+            self.setup(self.level)
+            events.append(Event(LEVEL_CHANGED, self.level, self.level, self.level_tick))
+
+    def scroll(self):
+        """ Keep the player inside the viewport margins. """
+        player = self.player
+
+        # Scroll left
+        left_boundary = self.view_left + LEFT_VIEWPORT_MARGIN
+        if player.left < left_boundary:
+            self.view_left -= left_boundary - player.left
+            self.changed_viewport = True
+
+        # Scroll right
+        right_boundary = self.view_left + SCREEN_WIDTH - RIGHT_VIEWPORT_MARGIN
+        if player.right > right_boundary:
+            self.view_left += player.right - right_boundary
+            self.changed_viewport = True
+
+        # Scroll up
+        top_boundary = self.view_bottom + SCREEN_HEIGHT - TOP_VIEWPORT_MARGIN
+        if player.top > top_boundary:
+            self.view_bottom += player.top - top_boundary
+            self.changed_viewport = True
+
+        # Scroll down
+        bottom_boundary = self.view_bottom + BOTTOM_VIEWPORT_MARGIN
+        if player.bottom < bottom_boundary:
+            self.view_bottom -= bottom_boundary - player.bottom
+            self.changed_viewport = True
+
+        if self.changed_viewport:
+            # Only scroll to integers. Otherwise we end up with pixels that
+            # don't line up on the screen
+            self.view_bottom = int(self.view_bottom)
+            self.view_left = int(self.view_left)
+
+
+def run_headless(ticks, level=1, controller=None, streaming=False):
+    """
+    Run the game without a window, as fast as possible.
+
+    :param int ticks: Number of ticks to simulate
+    :param int level: Level to start on
+    :param controller: Optional callable, given the simulation before every tick played
+    :param bool streaming: Stream every level
+    :returns: The simulation, and how many seconds the run took
+    """
+    simulation = Simulation(streaming=streaming)
+    simulation.setup(level)
+    simulation.current_state = GAME_RUNNING
+    simulation.controller = controller
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        simulation.update()
+    elapsed = time.perf_counter() - start
+    return simulation, elapsed
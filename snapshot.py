@@ -0,0 +1,146 @@
+"""
+Snapshots of a game: everything that decides how it plays on from a tick,
+packed into a few dozen bytes.
+
+A snapshot is a fixed layout header (the player, score, health, level,
+state, viewport and how long the level has been played, which is where its
+enemies are), then a bitset of the coins, hearts and poisons picked
+up in the level, one bit for each tile in the order the level lists them.
+Taking one only packs numbers the simulation already keeps, so the game
+takes one every tick to rewind through. Checkpoints and the save file are
+snapshots too.
+
+Streamed levels don't have all their pick-ups in memory to number, so
+their snapshots end with the cell of each picked up tile instead.
+"""
+import os
+import struct
+from collections import deque
+
+from constants import *
+
+SAVE_MAGIC = b"FANG"
+SAVE_VERSION = 2
+
+# level, state, streamed, tick, ticks into the level, score, health, player
+# x, y and speed across and up, viewport left and bottom, then how many
+# coins, hearts and poisons the level has (0 when it's streamed)
+_STATE = struct.Struct("<HBBIIiiddddiiHHH")
+# How many pick-ups a streamed level has had taken, then each one's row,
+# column and tile id
+_CELL_COUNT = struct.Struct("<I")
+_CELL = struct.Struct("<iiI")
+# magic, version, length of the snapshot that follows
+_SAVE_HEADER = struct.Struct("<4sHI")
+
+
+def _pickup_indexes(simulation):
+    return simulation.coin_list, simulation.hearts_list, simulation.poisons_list
+
+
+def take_snapshot(simulation):
+    """ The state of a simulation, as bytes. """
+    player = simulation.player
+    indexes = _pickup_indexes(simulation)
+    stream = simulation.stream
+    counts = (0, 0, 0) if stream is not None else [len(index.shapes) for index in indexes]
+    header = _STATE.pack(simulation.level, simulation.current_state, stream is not None, simulation.tick,
+                         simulation.level_tick, simulation.score, simulation.health, player.center_x,
+                         player.center_y, player.change_x, player.change_y, simulation.view_left,
+                         simulation.view_bottom, *counts)
+    if stream is None:
+        return header + b"".join(index.taken.to_bytes((count + 7) // 8, "little")
+                                 for index, count in zip(indexes, counts))
+    return header + _CELL_COUNT.pack(len(stream.collected)) + \
+        b"".join(_CELL.pack(*cell) for cell in sorted(stream.collected))
+
+
+def restore_snapshot(simulation, snapshot):
+    """
+    Put a simulation back the way a snapshot has it. The level is only set
+    up if it isn't the one being played; otherwise just the pick-ups that
+    differ are put back or taken out again.
+    """
+    (level, state, streamed, tick, level_tick, score, health, x, y, change_x, change_y,
+     view_left, view_bottom, *counts) = _STATE.unpack_from(snapshot, 0)
+    if bool(streamed) != simulation.streams(level):
+        raise ValueError(f"The snapshot was taken with level {level} "
+                         f"{'streamed' if streamed else 'loaded whole'}, and it isn't now.")
+    if simulation.level != level or simulation.map is None:
+        simulation.setup(level)
+
+    offset = _STATE.size
+    if not streamed:
+        for index, count in zip(_pickup_indexes(simulation), counts):
+            if count != len(index.shapes):
+                raise ValueError(f"The snapshot doesn't match the map of level {level}.")
+            size = (count + 7) // 8
+            index.take(int.from_bytes(snapshot[offset:offset + size], "little"))
+            offset += size
+    else:
+        # Read the chunks near the camera again, without the taken pick-ups
+        count, = _CELL_COUNT.unpack_from(snapshot, offset)
+        offset += _CELL_COUNT.size
+        simulation.stream.collected = set(_CELL.iter_unpack(snapshot[offset:offset + count * _CELL.size]))
+        simulation.stream.reload()
+
+    simulation.current_state = state
+    simulation.tick = tick
+    simulation.level_tick = level_tick
+    simulation.enemies.update(level_tick)
+    simulation.score = score
+    simulation.health = health
+    simulation.player.center_x = x
+    simulation.player.center_y = y
+    simulation.player.change_x = change_x
+    simulation.player.change_y = change_y
+    simulation.view_left = view_left
+    simulation.view_bottom = view_bottom
+    simulation.changed_viewport = True
+    if simulation.stream is not None:
+        simulation.stream.update(*simulation.viewport())
+
+
+class Rewind:
+    """
+    Snapshots of the last ticks played, to step back through. As a
+    simulation's controller, it takes one before every tick.
+    """
+
+    def __init__(self, ticks=REWIND_TICKS):
+        self.snapshots = deque(maxlen=ticks)
+
+    def __call__(self, simulation):
+        self.snapshots.append(take_snapshot(simulation))
+
+    def step_back(self, ticks=1):
+        """ The snapshot from some ticks ago, or the oldest one kept. None if there are none. """
+        snapshot = None
+        for _ in range(min(ticks, len(self.snapshots))):
+            snapshot = self.snapshots.pop()
+        return snapshot
+
+    def clear(self):
+        self.snapshots.clear()
+
+
+def save_game(path, snapshot):
+    """ Write a snapshot to a save file, replacing the file only once it's written. """
+    temporary = path + f".{os.getpid()}.tmp"
+    with open(temporary, "wb") as out:
+        out.write(_SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, len(snapshot)))
+        out.write(snapshot)
+    os.replace(temporary, path)
+
+
+def load_game(path):
+    """ The snapshot in a save file written by save_game(). """
+    with open(path, "rb") as source:
+        data = source.read()
+    try:
+        magic, version, length = _SAVE_HEADER.unpack_from(data, 0)
+    except struct.error:
+        magic, version, length = None, None, 0
+    if magic != SAVE_MAGIC or version != SAVE_VERSION or len(data) != _SAVE_HEADER.size + length:
+        raise ValueError(f"{path} is not a version {SAVE_VERSION} save file.")
+    return data[_SAVE_HEADER.size:]
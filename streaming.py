@@ -0,0 +1,132 @@
+"""
+Streaming levels: only the part of a map around the camera is in memory.
+
+As the camera moves, chunks coming near it are read from the map's stream
+file and their tiles are put in the simulation's tile indexes, which is all
+the physics and pick-ups ever look at. Chunks far away are dropped once
+more are loaded than the budget allows, so memory stays the same however
+big the map is.
+"""
+import math
+
+from constants import *
+from tilemap import tile_shape
+
+
+class StreamingLevel:
+    """
+    The loaded window of a streamed map.
+
+    ``loaded`` maps each loaded chunk to the shapes of its tiles, by layer,
+    for every layer of the map. Layers that have a tile index also have
+    those shapes in it.
+    """
+
+    def __init__(self, streamed_map, indexes, scaling=TILE_SCALING,
+                 margin=STREAM_MARGIN_CHUNKS, budget=STREAM_CHUNK_BUDGET):
+        """
+        :param streamed_map: StreamedMap to read chunks from
+        :param dict indexes: TileIndex of each layer the simulation collides with
+        :param int margin: Chunks to keep loaded past each edge of the viewport
+        :param int budget: Most chunks to keep. Chunks near the viewport are
+                           kept even if there are more of them than this.
+        """
+        self.map = streamed_map
+        self.indexes = indexes
+        self.scaling = scaling
+        self.margin = margin
+        self.budget = budget
+        self.loaded = {}
+        # First and last chunk across and down that are wanted right now
+        self.window = None
+        # Pick-ups already taken, as (row, column, tile id), so they don't
+        # come back when their chunk is loaded again
+        self.collected = set()
+
+    def wanted(self, left, bottom, right, top):
+        """ First and last chunk across and down that should be loaded for a viewport. """
+        tile_width = self.map.tilewidth * self.scaling
+        tile_height = self.map.tileheight * self.scaling
+        size = self.map.chunk_tiles
+
+        # Same cells TileIndex.hits() would look at for a box this size
+        first_column = math.floor(left / tile_width) + 1
+        last_column = math.floor(right / tile_width) + 1
+        first_row = self.map.height - 1 - math.floor(top / tile_height)
+        last_row = self.map.height - 1 - math.floor(bottom / tile_height)
+
+        first_x = max(first_column // size - self.margin, self.map.first_chunk_x)
+        last_x = min(last_column // size + self.margin, self.map.first_chunk_x + self.map.chunks_x - 1)
+        first_y = max(first_row // size - self.margin, self.map.first_chunk_y)
+        last_y = min(last_row // size + self.margin, self.map.first_chunk_y + self.map.chunks_y - 1)
+        return first_x, last_x, first_y, last_y
+
+    def update(self, left, bottom, right, top):
+        """ Load the chunks near a viewport, and drop far ones if over budget. """
+        window = self.wanted(left, bottom, right, top)
+        if window == self.window:
+            return
+        self.window = window
+
+        first_x, last_x, first_y, last_y = window
+        wanted = [(chunk_x, chunk_y) for chunk_y in range(first_y, last_y + 1)
+                  for chunk_x in range(first_x, last_x + 1)]
+        for key in wanted:
+            if key not in self.loaded:
+                self.load(key)
+
+        if len(self.loaded) > self.budget:
+            # Chunks furthest from the middle of the viewport go first
+            size = self.map.chunk_tiles
+            middle_x = (left + right) / 2 / (self.map.tilewidth * self.scaling) / size
+            middle_y = (self.map.height - (bottom + top) / 2 / (self.map.tileheight * self.scaling)) / size
+            wanted = set(wanted)
+            spare = sorted((key for key in self.loaded if key not in wanted),
+                           key=lambda key: (key[0] - middle_x) ** 2 + (key[1] - middle_y) ** 2,
+                           reverse=True)
+            for key in spare[:len(self.loaded) - self.budget]:
+                self.evict(key)
+
+    def load(self, key):
+        """ Read a chunk, and put its tiles in the indexes. """
+        chunk = {}
+        for name, placed in self.map.read_chunk(*key).items():
+            shapes = []
+            for row, column, item in placed:
+                if (row, column, item) in self.collected:
+                    continue
+                shape = tile_shape(self.map, row, column, item, self.scaling)
+                if shape is not None:
+                    shapes.append(shape)
+            index = self.indexes.get(name)
+            if index is not None:
+                for shape in shapes:
+                    index.add(shape)
+            chunk[name] = shapes
+        self.loaded[key] = chunk
+
+    def evict(self, key):
+        """ Drop a chunk, and take its tiles out of the indexes. """
+        for name, shapes in self.loaded.pop(key).items():
+            index = self.indexes.get(name)
+            if index is not None:
+                for shape in shapes:
+                    index.discard(shape)
+
+    def reload(self):
+        """ Drop every loaded chunk, so the next update reads them again, as after ``collected`` changes. """
+        for key in list(self.loaded):
+            self.evict(key)
+        self.window = None
+
+    def collect(self, shape):
+        """ Note that a pick-up was taken, so it stays gone. """
+        self.collected.add((shape.row, shape.column, shape.gid))
+        size = self.map.chunk_tiles
+        chunk = self.loaded.get((shape.column // size, shape.row // size), {})
+        for shapes in chunk.values():
+            if shape in shapes:
+                shapes.remove(shape)
+
+    def close(self):
+        self.map.close()
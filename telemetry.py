@@ -0,0 +1,304 @@
+"""
+Gameplay telemetry: where players die and pick things up, and how long
+each level takes them.
+
+While a game is played with ``--telemetry``, its events go onto an
+in-memory queue, which is all the game's loop does with them. A writer
+thread takes them off it every so often and appends them to the session's
+file in one write, so the game never waits on the disk. A session file is
+a short header, then a fixed size record for each event; a game that
+crashes only loses the events not written yet.
+
+Run as a script, it turns many session files into heatmaps of each level's
+tile grid, reading them in a process pool when there are a lot of them:
+
+    python telemetry.py --levels 2
+    python telemetry.py telemetry/ more_sessions/ --images heatmaps
+"""
+import argparse
+import os
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from constants import *
+from simulation import COIN_COLLECTED, HEART_COLLECTED, POISON_COLLECTED, PLAYER_DIED, LEVEL_COMPLETED, \
+    DIED_FALLING, DIED_DONT_TOUCH, DIED_ENEMY, DIED_HEALTH
+
+TELEMETRY_MAGIC = b"PTEL"
+TELEMETRY_VERSION = 1
+
+# magic, version, when the session started
+_HEADER = struct.Struct("<4sHd")
+# kind, detail, level, tick into the level, x, y
+_RECORD = struct.Struct("<BBHIff")
+_RECORD_DTYPE = np.dtype([("kind", "u1"), ("detail", "u1"), ("level", "<u2"), ("tick", "<u4"),
+                          ("x", "<f4"), ("y", "<f4")])
+
+# Kinds of record. A death's detail is its cause, a pick-up's what it
+# was, and a completed level's tick is how many ticks it took.
+RECORD_DEATH = 0
+RECORD_PICKUP = 1
+RECORD_LEVEL = 2
+
+DEATH_CAUSES = (DIED_FALLING, DIED_DONT_TOUCH, DIED_ENEMY, DIED_HEALTH)
+PICKUPS = (COIN_COLLECTED, HEART_COLLECTED, POISON_COLLECTED)
+_DEATH_DETAILS = {cause: index for index, cause in enumerate(DEATH_CAUSES)}
+_PICKUP_DETAILS = {kind: index for index, kind in enumerate(PICKUPS)}
+
+
+def session_file(directory=TELEMETRY_DIRECTORY):
+    """ Path of a new session file, named after when it started. """
+    return os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}.tel")
+
+
+class TelemetryWriter:
+    """ Queues a game's events, and appends them to a session file from a thread of its own. """
+
+    def __init__(self, path, interval=TELEMETRY_FLUSH_SECONDS):
+        """
+        :param path: Session file, appended to if it is already there
+        :param float interval: Seconds between writes
+        """
+        self.path = path
+        self.interval = interval
+        # Records waiting to be written. A deque's append and popleft are
+        # atomic, so neither the game nor the writer has to take a lock.
+        self.queue = deque()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self.thread.start()
+
+    def record(self, kind, detail, level, tick, x=0.0, y=0.0):
+        """ Queue one record. """
+        self.queue.append((kind, detail, level, tick, x, y))
+
+    def log(self, events):
+        """ Queue the records for the events a simulation reported. """
+        for event in events:
+            if event.kind in _PICKUP_DETAILS:
+                self.record(RECORD_PICKUP, _PICKUP_DETAILS[event.kind], event.level, event.tick,
+                            event.item.center_x, event.item.center_y)
+            elif event.kind == PLAYER_DIED:
+                death = event.item
+                self.record(RECORD_DEATH, _DEATH_DETAILS[death.cause], event.level, event.tick, death.x, death.y)
+            elif event.kind == LEVEL_COMPLETED:
+                self.record(RECORD_LEVEL, 0, event.level, event.tick)
+
+    def close(self):
+        """ Write what is still queued, and stop the writer. """
+        self.stopping.set()
+        self.thread.join()
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as out:
+                if out.tell() == 0:
+                    out.write(_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, time.time()))
+                while True:
+                    stopping = self.stopping.wait(self.interval)
+                    self._write(out)
+                    if stopping:
+                        return
+        except OSError as error:
+            # The game carries on without telemetry
+            print(f"Telemetry stopped: {error}")
+            self.queue = deque(maxlen=0)
+
+    def _write(self, out):
+        """ Append everything queued so far, in one write. """
+        queue = self.queue
+        batch = bytearray()
+        while queue:
+            batch += _RECORD.pack(*queue.popleft())
+        if batch:
+            out.write(batch)
+            out.flush()
+
+
+def read_session(path):
+    """
+    The records of a session file, as an array with a field for each part
+    of a record. A record cut short at the end is left out.
+    """
+    with open(path, "rb") as source:
+        data = source.read()
+    if len(data) < _HEADER.size:
+        raise ValueError(f"{path} is not a telemetry file.")
+    magic, version, _ = _HEADER.unpack_from(data)
+    if magic != TELEMETRY_MAGIC or version != TELEMETRY_VERSION:
+        raise ValueError(f"{path} is not a version {TELEMETRY_VERSION} telemetry file.")
+    count = (len(data) - _HEADER.size) // _RECORD.size
+    return np.frombuffer(data, dtype=_RECORD_DTYPE, count=count, offset=_HEADER.size)
+
+
+def count_sessions(paths):
+    """
+    Count the records of some session files by tile. Runs in a worker
+    process when there are many files.
+
+    :returns: Rows of (level, kind, detail, column, tile row counted up
+              from the bottom of the map) with how many records fell in
+              each, the (level, ticks) of every completed level, and how
+              many sessions were read
+    """
+    sessions = []
+    for path in paths:
+        try:
+            sessions.append(read_session(path))
+        except (OSError, ValueError) as error:
+            print(error)
+    records = np.concatenate(sessions) if sessions else np.zeros(0, dtype=_RECORD_DTYPE)
+
+    places = records[records["kind"] != RECORD_LEVEL]
+    cells = np.stack((places["level"], places["kind"], places["detail"],
+                      np.floor_divide(places["x"], GRID_PIXEL_SIZE),
+                      np.floor_divide(places["y"], GRID_PIXEL_SIZE)), axis=1).astype(np.int64)
+    cells, counts = np.unique(cells.reshape(-1, 5), axis=0, return_counts=True)
+
+    levels = records[records["kind"] == RECORD_LEVEL]
+    times = np.stack((levels["level"], levels["tick"]), axis=1).astype(np.int64)
+    return cells, counts, times, len(sessions)
+
+
+class LevelHeatmap:
+    """
+    How many deaths and pick-ups fell on each tile of one level, one grid
+    for each cause of death and kind of pick-up. Rows and columns are the
+    map's, as Tiled and reachability.py number them. Deaths from falling
+    are counted on the bottom row.
+    """
+
+    def __init__(self, level, rows, columns):
+        self.level = level
+        self.deaths = np.zeros((len(DEATH_CAUSES), rows, columns), dtype=np.int64)
+        self.pickups = np.zeros((len(PICKUPS), rows, columns), dtype=np.int64)
+        # Ticks each completion of the level took
+        self.times = []
+
+    def hottest(self, grids, count):
+        """ The (row, column, total, totals by cause or kind) of the busiest tiles. """
+        total = grids.sum(axis=0)
+        order = np.argsort(total, axis=None, kind="stable")[::-1][:count]
+        rows, columns = np.unravel_index(order, total.shape)
+        return [(row, column, total[row, column], grids[:, row, column])
+                for row, column in zip(rows, columns) if total[row, column]]
+
+    def image(self, grids, path):
+        """ Save a grid's totals as a picture, darkest where there were none. """
+        from PIL import Image
+        total = grids.sum(axis=0).astype(float)
+        heat = (255 * np.sqrt(total / total.max())).astype(np.uint8) if total.max() else total.astype(np.uint8)
+        pixels = np.stack((heat, heat // 4, np.zeros_like(heat)), axis=2)
+        image = Image.fromarray(pixels, "RGB")
+        image = image.resize((image.width * HEATMAP_CELL_PIXELS, image.height * HEATMAP_CELL_PIXELS), Image.NEAREST)
+        image.save(path)
+
+
+def _map_size(level):
+    """ Rows and columns of a level's map, or None if it has no fixed size. """
+    from level_cache import load_map, map_file
+    from tilemap import is_infinite
+    path = map_file(level)
+    if not os.path.exists(path) or is_infinite(path):
+        return None
+    my_map = load_map(path, TILE_SCALING)
+    return my_map.height, my_map.width
+
+
+def aggregate(paths, processes=None):
+    """
+    Heatmaps of every level played in some session files, and how many
+    sessions there were. Many files are shared out over a process pool.
+
+    :returns: (sessions, {level: LevelHeatmap})
+    """
+    if len(paths) < TELEMETRY_POOL_FILES or processes == 1:
+        parts = [count_sessions(paths)]
+    else:
+        workers = processes or os.cpu_count()
+        chunks = [paths[start::workers] for start in range(workers)]
+        with ProcessPoolExecutor(workers) as executor:
+            parts = list(executor.map(count_sessions, chunks))
+
+    cells = np.concatenate([part[0] for part in parts])
+    counts = np.concatenate([part[1] for part in parts])
+    times = np.concatenate([part[2] for part in parts])
+    sessions = sum(part[3] for part in parts)
+
+    heatmaps = {}
+    for level in sorted(set(cells[:, 0].tolist()) | set(times[:, 0].tolist())):
+        mine = cells[cells[:, 0] == level]
+        size = _map_size(level)
+        if size is None:
+            # No fixed size: the grid covers where things happened
+            size = (max(mine[:, 4].max(initial=0), 0) + 1, max(mine[:, 3].max(initial=0), 0) + 2)
+        rows, columns = size
+        heatmap = heatmaps[level] = LevelHeatmap(level, rows, columns)
+        heatmap.times = times[times[:, 0] == level, 1].tolist()
+
+        level_counts = counts[cells[:, 0] == level]
+        kinds, details = mine[:, 1], mine[:, 2]
+        # arcade draws each tile a column left of where Tiled has it
+        columns_hit = np.clip(mine[:, 3] + 1, 0, columns - 1)
+        rows_hit = np.clip(rows - 1 - mine[:, 4], 0, rows - 1)
+        for kind, grids in ((RECORD_DEATH, heatmap.deaths), (RECORD_PICKUP, heatmap.pickups)):
+            chosen = kinds == kind
+            np.add.at(grids, (details[chosen], rows_hit[chosen], columns_hit[chosen]), level_counts[chosen])
+    return sessions, heatmaps
+
+
+def _session_paths(paths):
+    """ Session files given, and those in the folders given. """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".tel")))
+        else:
+            found.append(path)
+    return found
+
+
+def main():
+    """ Main method """
+    parser = argparse.ArgumentParser(description="Turn telemetry session files into per level heatmaps.")
+    parser.add_argument("paths", nargs="*", default=[TELEMETRY_DIRECTORY],
+                        help="session files, or folders of them")
+    parser.add_argument("--levels", type=int, nargs="+", help="levels to report on, by default all played")
+    parser.add_argument("--top", type=int, default=10, help="busiest tiles to list for each level")
+    parser.add_argument("--images", metavar="FOLDER", help="save each level's heatmaps as pictures here")
+    parser.add_argument("--processes", type=int, help="worker processes, by default one per CPU")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = _session_paths(args.paths)
+    sessions, heatmaps = aggregate(paths, args.processes)
+    if args.images:
+        os.makedirs(args.images, exist_ok=True)
+
+    for level, heatmap in heatmaps.items():
+        if args.levels and level not in args.levels:
+            continue
+        deaths = heatmap.deaths.sum(axis=(1, 2))
+        causes = ", ".join(f"{cause} {count}" for cause, count in zip(DEATH_CAUSES, deaths))
+        summary = f"Level {level}: {deaths.sum()} deaths ({causes}), {heatmap.pickups.sum()} pick-ups"
+        if heatmap.times:
+            seconds = np.array(heatmap.times) * FIXED_TIMESTEP
+            summary += f", completed {len(seconds)} times in {np.median(seconds):.1f} s (median)"
+        print(summary)
+        for row, column, total, by_cause in heatmap.hottest(heatmap.deaths, args.top):
+            causes = ", ".join(f"{cause} {count}" for cause, count in zip(DEATH_CAUSES, by_cause) if count)
+            print(f"    row {row}, column {column}: {total} deaths ({causes})")
+        if args.images:
+            heatmap.image(heatmap.deaths, os.path.join(args.images, f"level{level}_deaths.png"))
+            heatmap.image(heatmap.pickups, os.path.join(args.images, f"level{level}_pickups.png"))
+    print(f"Read {sessions} sessions in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
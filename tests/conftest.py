@@ -0,0 +1,10 @@
+"""
+The game's modules load levels and images by paths relative to the game's
+folder, so the tests import them from there, and run there.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
@@ -0,0 +1,92 @@
+"""
+The audio manager's voices, played through the null backend against a
+clock the tests move on by hand.
+"""
+from constants import *
+from audio import AudioManager, NullBackend
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_manager(voices=SOUND_VOICES):
+    clock = Clock()
+    manager = AudioManager(NullBackend(clock), voices, threaded=False)
+    # Sounds are only a length in seconds to the null backend
+    manager.sounds["coin"] = (0.5, "pickups")
+    manager.sounds["gem"] = (0.5, "pickups")
+    manager.sounds["jump"] = (0.3, "player")
+    return manager, clock
+
+
+def test_same_sound_in_a_frame_plays_once():
+    manager, clock = make_manager()
+    for _ in range(5):
+        manager.play("coin")
+    manager.play("jump")
+    manager.flush()
+    assert [name for name, _ in manager.backend.started] == ["coin", "jump"]
+
+    # The next frame plays it again
+    manager.play("coin")
+    manager.flush()
+    assert [name for name, _ in manager.backend.started] == ["coin", "jump", "coin"]
+
+
+def test_busy_category_takes_its_oldest_voice():
+    manager, clock = make_manager({"pickups": 2, "player": 1})
+    started = manager.backend.started
+    manager.play("coin")
+    manager.flush()
+    clock.now = 0.1
+    manager.play("gem")
+    manager.flush()
+    clock.now = 0.2
+    manager.play("coin")
+    manager.flush()
+
+    first, second, third = (voice for _, voice in started)
+    assert first is not second
+    assert third is first
+    assert third == [0.7, "coin"]
+    assert second == [0.6, "gem"]
+
+
+def test_voices_free_up_when_their_sound_ends():
+    manager, clock = make_manager({"pickups": 2, "player": 1})
+    started = manager.backend.started
+    manager.play("coin")
+    manager.flush()
+    clock.now = 0.1
+    manager.play("gem")
+    manager.flush()
+    # The first coin has ended, so its voice is free and the gem keeps playing
+    clock.now = 0.55
+    manager.play("coin")
+    manager.flush()
+    assert started[2][1] is started[0][1]
+    assert started[1][1] == [0.6, "gem"]
+
+
+def test_categories_have_their_own_number_of_voices():
+    manager, clock = make_manager()
+    for category, size in SOUND_VOICES.items():
+        pool = manager.pools[category]
+        assert len(pool.idle) + len(pool.busy) == size
+
+    # However many frames ask for sounds at once, no more play together
+    # than their category has voices
+    for frame in range(10):
+        manager.play("coin" if frame % 2 else "gem")
+        manager.play("jump")
+        manager.flush()
+    for category, size in SOUND_VOICES.items():
+        playing = {id(voice) for name, voice in manager.backend.started
+                   if manager.sounds[name][1] == category and manager.backend.playing(voice)}
+        assert len(playing) <= size
+    assert len({id(voice) for name, voice in manager.backend.started if name == "jump"}) == SOUND_VOICES["player"]
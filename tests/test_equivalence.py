@@ -0,0 +1,124 @@
+"""
+The different ways of playing a game all play it the same way: the batched
+environment and the simulation, a replay and the game it recorded, and a
+restored snapshot and the game it was taken from.
+"""
+import numpy as np
+import pytest
+
+from batch_env import BatchEnv, LevelGrids
+from constants import *
+from level_cache import LevelLoader
+from replay import Recorder, replay_headless
+from simulation import Simulation
+from snapshot import restore_snapshot, take_snapshot
+
+LEVELS = (1, 2, 3)
+GAMES = 16
+TICKS = 1500
+# How often each control is held down, in the random inputs
+HOLD_CHANCES = np.array([0.08, 0.15, 0.6])
+CONTROLS = 1 << np.array([CONTROL_JUMP, CONTROL_LEFT, CONTROL_RIGHT])
+
+
+def random_controls(rng, shape):
+    """ Bitmasks of randomly held controls. """
+    return (rng.random(shape + (len(CONTROLS), )) < HOLD_CHANCES) @ CONTROLS
+
+
+def hold(simulation, controls):
+    """ Walk and jump for a bitmask of held controls, as the batched environment does. """
+    simulation.walk(((controls >> CONTROL_RIGHT) & 1) - ((controls >> CONTROL_LEFT) & 1))
+    if (controls >> CONTROL_JUMP) & 1:
+        simulation.jump()
+
+
+def player_state(simulation):
+    player = simulation.player
+    return (player.center_x, player.center_y, player.change_x, player.change_y,
+            simulation.score, simulation.health, simulation.level)
+
+
+def start(level):
+    # A loader of its own, since a loader's levels keep what was picked up
+    simulation = Simulation(LevelLoader(background=False))
+    simulation.setup(level)
+    simulation.current_state = GAME_RUNNING
+    return simulation
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_batch_env_matches_simulation(level):
+    rng = np.random.default_rng(level)
+    env = BatchEnv(GAMES, level=level, grids=LevelGrids())
+    env.reset()
+    simulations = [start(level) for _ in range(GAMES)]
+    playing = np.ones(GAMES, dtype=bool)
+    for tick in range(TICKS):
+        controls = random_controls(rng, (GAMES, ))
+        for game in np.flatnonzero(playing):
+            hold(simulations[game], controls[game])
+            simulations[game].update()
+        _, _, done = env.step(controls)
+
+        # Games that are done have started over in the batch, so they're
+        # only compared up to then
+        for game in np.flatnonzero(playing):
+            simulation = simulations[game]
+            if done[game]:
+                assert simulation.current_state != GAME_RUNNING, f"game {game}, tick {tick}"
+                playing[game] = False
+                continue
+            batched = (env.x[game], env.y[game], env.change_x[game], env.change_y[game],
+                       env.score[game], env.health[game], env.level[game])
+            assert batched == player_state(simulation), f"game {game}, tick {tick}"
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_replay_reproduces_recording(level):
+    rng = np.random.default_rng(level)
+    simulation = start(level)
+    recorder = Recorder(simulation)
+    held = 0
+    for controls in random_controls(rng, (TICKS, )):
+        # Press and release what changed since the tick before, as keys would
+        for control in (CONTROL_JUMP, CONTROL_LEFT, CONTROL_RIGHT):
+            bit = 1 << control
+            if controls & bit and not held & bit:
+                simulation.press(control)
+                recorder.press(control)
+            elif held & bit and not controls & bit:
+                simulation.release(control)
+                recorder.release(control)
+        held = controls
+        simulation.update()
+        if simulation.current_state != GAME_RUNNING:
+            break
+    recording = recorder.finish()
+
+    _, replayer = replay_headless(recording)
+    assert replayer.mismatches() == []
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_restored_snapshot_plays_on_the_same(level):
+    rng = np.random.default_rng(level)
+    simulation = start(level)
+    for controls in random_controls(rng, (TICKS // 2, )):
+        hold(simulation, controls)
+        simulation.update()
+    snapshot = take_snapshot(simulation)
+
+    later = random_controls(rng, (TICKS // 2, ))
+    expected = []
+    for controls in later:
+        hold(simulation, controls)
+        simulation.update()
+        expected.append(player_state(simulation) + (simulation.current_state, ))
+
+    restored = Simulation(LevelLoader(background=False))
+    restore_snapshot(restored, snapshot)
+    for tick, controls in enumerate(later):
+        hold(restored, controls)
+        restored.update()
+        assert player_state(restored) + (restored.current_state, ) == expected[tick], f"tick {tick}"
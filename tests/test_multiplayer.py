@@ -0,0 +1,40 @@
+"""
+A server and a few bot clients, playing for a second over localhost.
+"""
+import asyncio
+
+from constants import *
+import multiplayer
+from multiplayer import GameServer, client_report, run_bots
+
+BOTS = 3
+SECONDS = 1.0
+
+
+async def play():
+    loop = asyncio.get_running_loop()
+    server = GameServer()
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=("127.0.0.1", 0))
+    host, port = transport.get_extra_info("sockname")[:2]
+    try:
+        serving = asyncio.ensure_future(server.run(SECONDS + 0.5))
+        clients = await run_bots(host, port, BOTS, SECONDS)
+        await serving
+    finally:
+        transport.close()
+    return server, client_report(clients)
+
+
+def test_bots_play_on_a_local_server():
+    server, report = asyncio.run(play())
+    assert report["joined"] == BOTS
+    assert report["snapshots_received"] > 0
+    assert report["mispredictions"] == 0
+
+    # Snapshots only carry what changed, so on average they are smaller
+    # than one with every field of every player
+    player = multiplayer._PLAYER.size + sum(packer.size for packer in multiplayer._FIELD_STRUCTS)
+    full = multiplayer._SNAPSHOT.size + multiplayer._COUNTS.size + BOTS * player \
+        + len(PICKUP_LAYER_NAMES) * multiplayer._PICKUP_COUNT.size
+    assert report["bytes_per_snapshot"] < full
+    assert server.stats.report()["snapshots"] > 0
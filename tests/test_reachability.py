@@ -0,0 +1,17 @@
+"""
+The reachability analysis, on levels known to be playable.
+"""
+from reachability import analyse_level, jump_arcs
+
+
+def test_level_3_is_reachable():
+    # Its way through climbs under ceilings, and over the top of the map
+    report = analyse_level(3, jump_arcs())
+    assert report.end_reachable
+    assert report.coins_reachable == report.coins
+
+
+def test_level_1_is_reachable():
+    report = analyse_level(1, jump_arcs())
+    assert report.end_reachable
+    assert not report.unreachable
@@ -0,0 +1,145 @@
+"""
+Process-wide texture registry, and a texture atlas of the game's sprites.
+
+Every texture is loaded once per (path, mirrored, scale), no matter how
+many sprites, deaths or levels ask for it. The atlas packs the tile, item,
+enemy and character images into a few large pages, so a SpriteList can
+draw all of its sprites from one shared texture.
+"""
+import os
+import threading
+
+import arcade
+import numpy as np
+import PIL.Image
+from arcade import shader
+
+from constants import *
+
+_lock = threading.RLock()
+
+# (path, mirrored, scale) -> arcade.Texture
+_textures = {}
+
+# texture name -> (path, mirrored), so a texture can be found in the atlas
+_sources = {}
+
+_atlas = None
+
+
+def _key(path):
+    return os.path.normpath(path)
+
+
+def load_texture(path, mirrored=False, scale=1):
+    """
+    Load a texture, or get the one already loaded.
+
+    :param str path: Image file
+    :param bool mirrored: Mirror the image left to right
+    :param float scale: Scale sprites using the texture are drawn at
+    """
+    key = (_key(path), mirrored, scale)
+    texture = _textures.get(key)
+    if texture is None:
+        with _lock:
+            texture = _textures.get(key)
+            if texture is None:
+                texture = arcade.load_texture(path, mirrored=mirrored, scale=scale)
+                _sources[texture.name] = (key[0], mirrored)
+                _textures[key] = texture
+    return texture
+
+
+class AtlasPage:
+    """ One packed image, uploaded to the GPU the first time it is drawn. """
+
+    def __init__(self, size):
+        self.image = PIL.Image.new("RGBA", (size, size))
+        self._gl_texture = None
+
+    @property
+    def gl_texture(self):
+        # Needs the window's GL context, so this must run on the main thread
+        if self._gl_texture is None:
+            self._gl_texture = shader.texture(self.image.size, 4, np.asarray(self.image))
+        return self._gl_texture
+
+
+class TextureAtlas:
+    """
+    Images packed onto pages, shelf by shelf. Each image is stored once,
+    mirrored textures read the same pixels the other way round.
+    """
+
+    def __init__(self, page_size=ATLAS_PAGE_SIZE, padding=ATLAS_PADDING):
+        self.page_size = page_size
+        self.padding = padding
+        self.pages = []
+        # path -> (page, x, y, width, height)
+        self.regions = {}
+        self._shelf_x = self._shelf_y = self._shelf_height = 0
+
+    def add(self, path):
+        """ Pack an image file into the atlas, if it isn't in it yet. """
+        key = _key(path)
+        if key in self.regions:
+            return
+        image = PIL.Image.open(path).convert("RGBA")
+        width, height = image.size
+        size, padding = self.page_size, self.padding
+        if width + padding > size or height + padding > size:
+            raise ValueError(f"{path} is too big for a {size}x{size} atlas page.")
+
+        # Next shelf when this row is full, next page when the page is
+        if not self.pages or self._shelf_x + width + padding > size:
+            self._shelf_x = 0
+            self._shelf_y += self._shelf_height
+            self._shelf_height = 0
+        if not self.pages or self._shelf_y + height + padding > size:
+            self.pages.append(AtlasPage(size))
+            self._shelf_x = self._shelf_y = self._shelf_height = 0
+
+        page = len(self.pages) - 1
+        self.pages[page].image.paste(image, (self._shelf_x, self._shelf_y))
+        self.regions[key] = (page, self._shelf_x, self._shelf_y, width, height)
+        self._shelf_x += width + padding
+        self._shelf_height = max(self._shelf_height, height + padding)
+
+    def add_directory(self, directory):
+        """ Pack every .png in a folder, tallest first so shelves fill well. """
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".png")]
+        sizes = {path: PIL.Image.open(path).size for path in paths}
+        for path in sorted(paths, key=lambda path: (-sizes[path][1], path)):
+            self.add(path)
+
+    def find(self, texture):
+        """
+        Where a texture is in the atlas: its page, and the sub texture
+        coordinates SpriteList's shader expects. None if it isn't packed.
+        """
+        source = _sources.get(texture.name)
+        if source is None or source[0] not in self.regions:
+            return None
+        path, mirrored = source
+        page, x, y, width, height = self.regions[path]
+
+        # The shader flips v, and counts on the texture wrapping around
+        size = self.page_size
+        coordinates = [x / size, 1 - (y + height) / size, width / size, height / size]
+        if mirrored:
+            coordinates[0] += coordinates[2]
+            coordinates[2] = -coordinates[2]
+        return page, coordinates
+
+
+def atlas():
+    """ The game's atlas, packed the first time it's needed. """
+    global _atlas
+    with _lock:
+        if _atlas is None:
+            packed = TextureAtlas()
+            for directory in ATLAS_DIRECTORIES:
+                packed.add_directory(directory)
+            _atlas = packed
+    return _atlas
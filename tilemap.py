@@ -0,0 +1,360 @@
+"""
+Read Tiled maps without needing a window or arcade.
+
+The map object uses the same attribute names as arcade's ``TiledMap``, so
+``arcade.generate_sprites`` can build sprite lists straight from it, while
+the headless simulation uses the plain shapes from ``layer_shapes``.
+"""
+import base64
+import gzip
+import struct
+import xml.etree.ElementTree as etree
+import zlib
+from collections import namedtuple
+
+from constants import *
+
+# An enemy placed in a map: its kind from ENEMY_SPEEDS, the name of its
+# image, its hit box's left, right, bottom and top edges from its center,
+# the points its center goes through, whether it goes round them (or there
+# and back), and its speed in pixels per tick
+EnemySpawn = namedtuple("EnemySpawn", ["kind", "image", "box", "path", "loop", "speed"])
+
+
+class TiledMap:
+    """ A tiled map, and the tile set that came with it. """
+
+    def __init__(self):
+        self.global_tile_set = {}
+        self.layers_int_data = {}
+        self.width = 0
+        self.height = 0
+        self.tilewidth = 0
+        self.tileheight = 0
+        self.backgroundcolor = None
+        # Infinite maps are stored in chunks, and can only be streamed
+        self.infinite = False
+        # EnemySpawns of the Enemies object layer
+        self.enemies = []
+
+
+class Tile:
+    """ One tile from a tile set. """
+
+    def __init__(self, source, width, height, points=None):
+        self.source = source
+        self.width = width
+        self.height = height
+        # Hit box polygon relative to the tile center, already scaled
+        self.points = points
+
+
+class TileShape:
+    """
+    Collision shape of one placed tile. Placed exactly where
+    ``arcade.generate_sprites`` puts the matching sprite.
+    """
+
+    __slots__ = ("row", "column", "gid", "center_x", "center_y", "points",
+                 "left", "right", "bottom", "top", "box")
+
+    def __init__(self, row, column, gid, center_x, center_y, points):
+        self.row = row
+        self.column = column
+        self.gid = gid
+        self.center_x = center_x
+        self.center_y = center_y
+        self.points = points
+        self.left = min(x for x, y in points)
+        self.right = max(x for x, y in points)
+        self.bottom = min(y for x, y in points)
+        self.top = max(y for x, y in points)
+        # True when the shape is just its bounding box
+        self.box = len(points) == 4 and all(x in (self.left, self.right) and y in (self.bottom, self.top)
+                                            for x, y in points)
+
+
+def _parse_points(point_text):
+    result = []
+    for point in point_text.split(" "):
+        x, y = point.split(",")
+        result.append([round(float(x)), round(float(y))])
+    return result
+
+
+def _read_hit_box(tile_tag, width, height, scaling):
+    """ Convert a tile's polygon from Tiled coordinates to scaled, centered ones. """
+    my_object = tile_tag.find("objectgroup/object")
+    if my_object is None:
+        return None
+    polygon = my_object.find("polygon")
+    if polygon is None:
+        polygon = my_object.find("polyline")
+    if polygon is None:
+        return None
+
+    offset_x = round(float(my_object.attrib['x']))
+    offset_y = round(float(my_object.attrib['y']))
+    points = []
+    for x, y in _parse_points(polygon.attrib['points']):
+        x = (x + offset_x - width // 2) * scaling
+        y = (height - (y + offset_y) - height // 2) * scaling
+        points.append((int(x), int(y)))
+    return points
+
+
+def _decode_data(data_tag, data_text):
+    """ Tile ids of a layer's <data> tag, or of a <chunk> inside it, in one flat list. """
+    data_text = data_text.strip()
+    encoding = data_tag.attrib.get('encoding')
+    if encoding == "csv":
+        values = [int(item) for item in data_text.replace("\n", "").split(",") if item]
+    elif encoding == "base64":
+        raw = base64.b64decode(data_text)
+        compression = data_tag.attrib.get('compression')
+        if compression == "zlib":
+            raw = zlib.decompress(raw)
+        elif compression == "gzip":
+            raw = gzip.decompress(raw)
+        elif compression is not None:
+            raise ValueError(f"Unsupported compression type '{compression}'.")
+        values = struct.unpack(f"<{len(raw) // 4}I", raw)
+    else:
+        raise ValueError(f"Unexpected encoding '{encoding}'.")
+    return list(values)
+
+
+def layer_blocks(layer_tag):
+    """
+    The tiles of a layer as blocks of (column, row, width, height, tile ids).
+    A fixed size map has one block for the whole layer, an infinite one has
+    a block for each chunk Tiled saved.
+    """
+    data_tag = layer_tag.find("data")
+    chunk_tags = data_tag.findall("chunk")
+    if not chunk_tags:
+        width = int(layer_tag.attrib["width"])
+        height = int(layer_tag.attrib["height"])
+        return [(0, 0, width, height, _decode_data(data_tag, data_tag.text))]
+    return [(int(chunk.attrib["x"]), int(chunk.attrib["y"]),
+             int(chunk.attrib["width"]), int(chunk.attrib["height"]),
+             _decode_data(data_tag, chunk.text)) for chunk in chunk_tags]
+
+
+def is_infinite(tmx_file):
+    """ True if a .tmx file is an infinite map. Only reads as far as the <map> tag. """
+    for event, element in etree.iterparse(tmx_file, events=("start", )):
+        return element.attrib.get("infinite") == "1"
+    return False
+
+
+def read_map_blocks(tmx_file, scaling=1):
+    """
+    Read a .tmx file made of a single image-collection tile set, keeping
+    the layers as blocks rather than whole grids.
+
+    :returns: The map, with no layers filled in, and the blocks of each layer
+    :rtype: (TiledMap, dict)
+    """
+    map_tag = etree.parse(tmx_file).getroot()
+
+    my_map = TiledMap()
+    my_map.width = int(map_tag.attrib["width"])
+    my_map.height = int(map_tag.attrib["height"])
+    my_map.tilewidth = int(map_tag.attrib["tilewidth"])
+    my_map.tileheight = int(map_tag.attrib["tileheight"])
+    my_map.infinite = map_tag.attrib.get("infinite") == "1"
+
+    # Background color is optional, and may or may not be in there
+    if "backgroundcolor" in map_tag.attrib:
+        color = map_tag.attrib["backgroundcolor"]
+        my_map.backgroundcolor = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+
+    for tileset_tag in map_tag.findall("./tileset"):
+        firstgid = int(tileset_tag.attrib["firstgid"])
+        for tile_tag in tileset_tag.findall("tile"):
+            image = tile_tag.find("image")
+            width = int(image.attrib["width"])
+            height = int(image.attrib["height"])
+            points = _read_hit_box(tile_tag, width, height, scaling)
+            gid = firstgid + int(tile_tag.attrib["id"])
+            my_map.global_tile_set[str(gid)] = Tile(image.attrib["source"], width, height, points)
+
+    blocks = {layer_tag.attrib["name"]: layer_blocks(layer_tag) for layer_tag in map_tag.findall("./layer")}
+    for group_tag in map_tag.findall("./objectgroup"):
+        if group_tag.attrib.get("name") == ENEMIES_LAYER_NAME:
+            my_map.enemies = read_enemies(group_tag, my_map, blocks.get(PLATFORMS_LAYER_NAME, []), scaling)
+    return my_map, blocks
+
+
+def read_map(tmx_file, scaling=1):
+    """
+    Read a fixed size .tmx file made of a single image-collection tile set.
+
+    :param str tmx_file: Path of the map
+    :param float scaling: Scaling applied to tile hit boxes
+    :returns: Map
+    :rtype: TiledMap
+    """
+    my_map, blocks = read_map_blocks(tmx_file, scaling)
+    if my_map.infinite:
+        raise ValueError(f"{tmx_file} is an infinite map, which can only be streamed.")
+
+    for name, ((column, row, width, height, values), ) in blocks.items():
+        my_map.layers_int_data[name] = [values[start:start + width] for start in range(0, len(values), width)]
+    return my_map
+
+
+def enemy_image(name):
+    """ Path of an enemy's image. """
+    return f"{ENEMY_IMAGE_DIRECTORY}/{name}.png"
+
+
+def enemy_hit_box(name, scaling):
+    """
+    Left, right, bottom and top of the visible part of an enemy's image,
+    from its center. The images have a lot of space round them.
+    """
+    from PIL import Image
+    with Image.open(enemy_image(name)) as image:
+        width, height = image.size
+        left, top, right, bottom = image.convert("RGBA").getchannel("A").getbbox()
+    return ((left - width / 2) * scaling, (right - width / 2) * scaling,
+            (height / 2 - bottom) * scaling, (height / 2 - top) * scaling)
+
+
+def read_enemies(group_tag, my_map, platforms, scaling):
+    """
+    The enemies of an object layer. Each object's type is the enemy's kind
+    and its name the image. A polyline is a path followed there and back, a
+    polygon one gone round. A patrol is a point on a platform, and walks it
+    from end to end.
+
+    :param platforms: Blocks of the Platforms layer, to find patrols' platforms on
+    """
+    walls = {}
+    for first_column, first_row, width, height, values in platforms:
+        for index, item in enumerate(values):
+            if item:
+                walls[first_row + index // width, first_column + index % width] = item
+
+    # arcade puts each tile a column left of where Tiled shows it, so the
+    # objects go with them
+    map_top = my_map.height * my_map.tileheight
+
+    def to_game(x, y):
+        return (x - my_map.tilewidth) * scaling, (map_top - y) * scaling
+
+    enemies = []
+    for object_tag in group_tag.findall("object"):
+        kind = object_tag.attrib.get("type", object_tag.attrib.get("class"))
+        if kind not in ENEMY_SPEEDS:
+            raise ValueError(f"Enemy {object_tag.attrib.get('id')} is of unknown kind '{kind}'.")
+        name = object_tag.attrib["name"]
+        box = enemy_hit_box(name, scaling)
+        speed = ENEMY_SPEEDS[kind]
+        for property_tag in object_tag.findall("properties/property"):
+            if property_tag.attrib["name"] == "speed":
+                speed = float(property_tag.attrib["value"])
+
+        x = float(object_tag.attrib["x"])
+        y = float(object_tag.attrib["y"])
+        line = object_tag.find("polyline")
+        loop = line is None and object_tag.find("polygon") is not None
+        if line is None:
+            line = object_tag.find("polygon")
+        if line is not None:
+            path = tuple(to_game(x + point_x, y + point_y)
+                         for point_x, point_y in (map(float, point.split(",")) for point in line.attrib["points"].split()))
+        elif kind == "patrol":
+            path = patrol_path(my_map, walls, *to_game(x, y), name, box, scaling)
+        else:
+            center_x, center_y = to_game(x, y)
+            path = ((center_x, center_y - ENEMY_BOB / 2), (center_x, center_y + ENEMY_BOB / 2))
+        enemies.append(EnemySpawn(kind, name, box, path, loop, speed))
+    return enemies
+
+
+def patrol_path(my_map, walls, x, y, name, box, scaling):
+    """
+    The two ends of the platform a patrol stands on, as where its center is
+    at each. The platform is the run of flat, square tiles under the point,
+    with nothing in the way above them.
+    """
+    tile_width = my_map.tilewidth * scaling
+    tile_height = my_map.tileheight * scaling
+    column = int(x // tile_width) + 1
+    row = my_map.height - 1 - int((y + tile_height / 2) // tile_height)
+    while (row, column) not in walls:
+        row += 1
+        if row > my_map.height:
+            raise ValueError(f"The patrol at {x:.0f}, {y:.0f} has no platform under it.")
+    ground = tile_shape(my_map, row, column, walls[row, column], scaling)
+
+    def walkable(next_column):
+        if (row - 1, next_column) in walls or (row, next_column) not in walls:
+            return False
+        shape = tile_shape(my_map, row, next_column, walls[row, next_column], scaling)
+        return shape.box and shape.top == ground.top
+
+    first = last = column
+    while walkable(first - 1):
+        first -= 1
+    while walkable(last + 1):
+        last += 1
+
+    # Stood on the platform with the bottom of its image on the top of it
+    from_bottom = image_size(enemy_image(name))[1] * scaling / 2
+    left, right, bottom, top = box
+    return (((first - 1) * tile_width - left, ground.top + from_bottom),
+            (last * tile_width - right, ground.top + from_bottom))
+
+
+def layer_shapes(my_map, layer_name, scaling):
+    """
+    Build the collision shapes for a layer, in the same order and at the
+    same positions as ``arcade.generate_sprites`` would build sprites.
+    """
+    shapes = []
+    if layer_name not in my_map.layers_int_data:
+        return shapes
+
+    for row_index, row in enumerate(my_map.layers_int_data[layer_name]):
+        for column_index, item in enumerate(row):
+            shape = tile_shape(my_map, row_index, column_index, item, scaling)
+            if shape is not None:
+                shapes.append(shape)
+
+    return shapes
+
+
+def tile_shape(my_map, row, column, gid, scaling):
+    """ Collision shape of a tile placed in a cell, or None for an empty cell. """
+    tile = my_map.global_tile_set.get(str(gid))
+    if tile is None:
+        return None
+
+    # The sprite's right edge sits on the column line and its top on
+    # the row line. Hit boxes are applied after it is placed.
+    half_width = tile.width * scaling / 2
+    half_height = tile.height * scaling / 2
+    center_x = column * my_map.tilewidth * scaling - half_width
+    center_y = (my_map.height - row) * my_map.tileheight * scaling - half_height
+
+    if tile.points is not None:
+        points = tuple((center_x + x, center_y + y) for x, y in tile.points)
+    else:
+        # Square tile, with corners rounded the way arcade rounds them
+        left = round(center_x - half_width, 2)
+        right = round(center_x + half_width, 2)
+        bottom = round(center_y - half_height, 2)
+        top = round(center_y + half_height, 2)
+        points = ((left, bottom), (right, bottom), (right, top), (left, top))
+    return TileShape(row, column, gid, center_x, center_y, points)
+
+
+def image_size(path):
+    """ Width and height of a PNG, read from its header. """
+    with open(path, "rb") as png:
+        header = png.read(24)
+    return struct.unpack(">II", header[16:24])